@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import doc_cache
+from chunk_store import ChunkStore
+
+# Persistent cache of chatbot answers, keyed by corpus fingerprint and normalized
+# question. Exact matches are looked up by key; with a similarity threshold set,
+# a question whose embedding is close enough to a cached question for the same
+# corpus is answered from the cache as well. Entries expire after a TTL and the
+# least recently used ones are dropped once max_entries is reached.
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(doc_cache.DOC_CACHE_DIR, "answers.db"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168")) * 3600
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+# Cosine similarity needed for a near-duplicate hit; empty disables semantic lookup
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY") or 0) or None
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def normalize_question(question):
+    return " ".join(str(question).lower().split()).rstrip("?!. ")
+
+
+def question_key(question):
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+# Fingerprint of everything an answer depends on: the indexed files (by content
+# hash) and whatever else the caller passes in (model, prompt, chunking, ...)
+def corpus_fingerprint(documents, *parts):
+    digest = hashlib.sha256()
+    if isinstance(documents, ChunkStore):
+        keys = {sha or documents.text(i) for i, sha in enumerate(documents.column("content_hash"))}
+    else:
+        keys = {doc.metadata.get("content_hash") or doc.page_content for doc in documents}
+    for sha in sorted(keys):
+        digest.update(sha.encode("utf-8"))
+    for part in parts:
+        digest.update(b"\0" + str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, similarity=ANSWER_CACHE_SIMILARITY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        # corpus -> (question keys, L2-normalized question embeddings)
+        self._matrices = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS answers (
+            corpus TEXT NOT NULL, question_key TEXT NOT NULL, question TEXT, answer TEXT NOT NULL,
+            embedding BLOB, created_at REAL NOT NULL, last_used REAL NOT NULL,
+            PRIMARY KEY (corpus, question_key))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._db.commit()
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+    def _semantic_matrix(self, corpus, now):
+        if corpus not in self._matrices:
+            rows = self._db.execute(
+                "SELECT question_key, embedding FROM answers WHERE corpus = ? AND embedding IS NOT NULL "
+                "AND created_at >= ?", (corpus, now - self.ttl)).fetchall()
+            keys = [row[0] for row in rows]
+            matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+            self._matrices[corpus] = (keys, matrix)
+        return self._matrices[corpus]
+
+    # Returns (answer, "exact" | "semantic") or (None, None).
+    # query_vector is only needed for semantic lookup and may be a callable
+    # producing it, so the embedding call is skipped on exact hits.
+    def get(self, corpus, question, query_vector=None):
+        now = time.time()
+        key = question_key(question)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer, created_at FROM answers WHERE corpus = ? AND question_key = ?",
+                (corpus, key)).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                self._touch(corpus, key, now)
+                self.exact_hits += 1
+                return row[0], "exact"
+
+            if self.similarity and query_vector is not None:
+                keys, matrix = self._semantic_matrix(corpus, now)
+                if matrix is not None:
+                    vector = _unit(query_vector() if callable(query_vector) else query_vector)
+                    scores = matrix @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity:
+                        hit = self._db.execute(
+                            "SELECT answer, created_at FROM answers WHERE corpus = ? AND question_key = ?",
+                            (corpus, keys[best])).fetchone()
+                        if hit is not None and now - hit[1] <= self.ttl:
+                            self._touch(corpus, keys[best], now)
+                            self.semantic_hits += 1
+                            return hit[0], "semantic"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, corpus, question, answer, query_vector=None):
+        now = time.time()
+        key = question_key(question)
+        if callable(query_vector):
+            query_vector = query_vector() if self.similarity else None
+        blob = _unit(query_vector).tobytes() if query_vector is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (corpus, question_key, question, answer, embedding, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (corpus, key, str(question), answer, blob, now, now))
+            self._db.commit()
+            self._matrices.pop(corpus, None)
+            self.evict(now)
+
+    def _touch(self, corpus, key, now):
+        self._db.execute("UPDATE answers SET last_used = ? WHERE corpus = ? AND question_key = ?",
+                         (now, corpus, key))
+        self._db.commit()
+
+    # Drop expired entries, then least recently used ones above max_entries
+    def evict(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            excess = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (excess,))
+                self._matrices.clear()
+            self._db.commit()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def get_answer_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
@@ -1,18 +1,20 @@
 import os
-import shutil
 import streamlit as st
-import requests
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
 from url_fetcher import find_top_search_results  
-from vector_embed import load_from_directory, create_embeddings, create_chatbot  # Import chatbot functions
+from index_registry import get_registry
+import instrumentation
+import jobs
+import json
 import tempfile
 from PIL import Image
 
 # Make sure these imports are at the top of your file
 import traceback
-import pandas as pd
-from io import BytesIO
+from contextlib import contextmanager
+
+# vector_embed / ingest_pipeline (LangChain, OpenAI, Chroma), comparison,
+# pdf_crawler / pdf_downloader (bs4, lxml, requests) and pandas are imported
+# where they are first needed, so the first page renders without them
 
 # Loading Tab Icon
 im = Image.open("./src/logo.ico")
@@ -47,72 +49,274 @@ if 'document_embeddings' not in st.session_state:
     st.session_state['document_embeddings'] = None
 if 'vectorstore' not in st.session_state:
     st.session_state['vectorstore'] = None
+if 'chatbot' not in st.session_state:
+    st.session_state['chatbot'] = None  # Retrieval index + chain, built once per corpus
+if 'index_name' not in st.session_state:
+    st.session_state['index_name'] = None  # Persistent collection currently loaded
 if 'pdf_files' not in st.session_state:
     st.session_state['pdf_files'] = []  # Hold the list of PDFs for confirmation
 if 'final_pdf_selection' not in st.session_state:
     st.session_state['final_pdf_selection'] = []  # Hold user-selected PDFs for final processing
+if 'perf_runs' not in st.session_state:
+    st.session_state['perf_runs'] = []  # Timing reports of recent actions, newest last
+if 'ingest_job' not in st.session_state:
+    st.session_state['ingest_job'] = None  # Background ingestion this page is attached to
+if 'sheet_job' not in st.session_state:
+    st.session_state['sheet_job'] = None  # Background question sheet run this page is attached to
+if 'compare_job' not in st.session_state:
+    st.session_state['compare_job'] = None  # Background multi-company comparison this page is attached to
+
+PERF_RUNS_KEPT = 20
+
+# Record one user action (search, PDF processing, a question, an Excel batch)
+# for the Performance panel; "Profile next run" adds a cProfile report to it
+@contextmanager
+def perf_run(name, **attributes):
+    profile = st.session_state.get('perf_profile', False)
+    if profile:
+        st.session_state['perf_profile'] = False
+    with instrumentation.record(name, profile=profile, **attributes) as run:
+        try:
+            yield run
+        finally:
+            st.session_state['perf_runs'] = (st.session_state['perf_runs'] + [run])[-PERF_RUNS_KEPT:]
+
+# Start fn(job, *args) as a background job (see jobs.py); long work runs there so
+# reruns caused by widget interactions do not abandon it
+def submit_job(kind, fn, *args, label=""):
+    profile = st.session_state.get('perf_profile', False)
+    if profile:
+        st.session_state['perf_profile'] = False
+    return jobs.get_job_manager().submit(kind, fn, *args, label=label, profile=profile)
+
+# Hand a finished job's timing report to the Performance panel
+def collect_job_run(job):
+    if job.perf_run is not None and job.perf_run not in st.session_state['perf_runs']:
+        st.session_state['perf_runs'] = (st.session_state['perf_runs'] + [job.perf_run])[-PERF_RUNS_KEPT:]
+
+def show_notices(key):
+    for level, text in st.session_state.pop(key, []):
+        getattr(st, level)(text)
 
 # Function to download PDFs from a given URL
 def download_pdf(url, folder_path):
-    response = requests.get(url)
-    file_name = os.path.basename(urlparse(url).path)
-    file_path = os.path.join(folder_path, file_name)
-    
-    # Write the PDF to the local directory
-    with open(file_path, 'wb') as file:
-        file.write(response.content)
-    return file_path
+    import pdf_downloader
+
+    return pdf_downloader.download_pdf(url, folder_path)
 
 # Function to scrape PDFs from HTML pages
 def scrape_pdfs_from_html(url):
-    try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        pdf_links = []
-
-        # Find all <a> tags with href attributes ending in .pdf
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.lower().endswith('.pdf'):
-                pdf_links.append(urljoin(url, href))
-        
-        return pdf_links
-
-    except Exception as e:
-        st.error(f"Error scraping PDFs from {url}: {str(e)}")
-        return []
-
-# Function to process URLs to scrape PDFs but not save them yet
-def process_urls(urls):
-    pdf_files = []  # Temporary list of all found PDFs
-
-    for url in urls:
-        try:
-            # Check if the URL ends with '.pdf'
-            if url.lower().endswith('.pdf'):
-                pdf_files.append(url)
-            else:
-                # Scrape PDFs from HTML pages
-                pdf_files_from_html = scrape_pdfs_from_html(url)
-                pdf_files.extend(pdf_files_from_html)
-        except Exception as e:
-            st.error(f"Error processing URL {url}: {str(e)}")
-
-    return pdf_files  # Return the list of PDFs for user confirmation
-
-# Function to save user-selected PDFs to the 'pdf_docs' folder
-def save_selected_pdfs(selected_pdfs):
-    folder_path = "pdf_docs"
-    
-    # Delete the folder if it exists and recreate it
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
+    import pdf_crawler
+
+    result = pdf_crawler.discover_pdfs([url], depth=0)
+    for failed_url, error in result.errors.items():
+        st.error(f"Error scraping PDFs from {failed_url}: {error}")
+    return result.pdf_links
+
+# Function to process URLs to scrape PDFs but not save them yet.
+# Pages are fetched concurrently; depth > 0 also follows same-site sub-pages.
+def process_urls(urls, depth=None):
+    import pdf_crawler
+
+    result = pdf_crawler.discover_pdfs(urls, depth=pdf_crawler.CRAWL_DEPTH if depth is None else depth)
+    for url, error in result.errors.items():
+        st.error(f"Error processing URL {url}: {error}")
+
+    return result.pdf_links  # Return the list of PDFs for user confirmation
+
+# Background job: save user-selected PDFs to the 'pdf_docs' folder and index them.
+# Downloading, parsing, embedding and indexing overlap (see ingest_pipeline).
+# It runs off the script thread, so progress goes to the job, not to widgets.
+def save_selected_pdfs(job, company, keyword, selected_pdfs):
+    import pdf_downloader
+    from ingest_pipeline import ingest_urls
+    from vector_embed import build_chatbot
+
+    # Each company/keyword/selection gets its own collection; sessions building
+    # the same one take turns, and every job downloads into its own folder, so
+    # concurrent sessions never overwrite or delete each other's files
+    registry = get_registry()
+    index_name, vectorstore = registry.open(company, keyword, selected_pdfs)
+    folder_path = os.path.join("pdf_docs", index_name, job.id)
     os.makedirs(folder_path, exist_ok=True)
 
-    for pdf_url in selected_pdfs:
-        download_pdf(pdf_url, folder_path)
+    # Per-file (progress, text), shown as one progress bar per file
+    urls = list(dict.fromkeys(selected_pdfs))
+    files = {url: (0.0, pdf_downloader.display_name(url)) for url in urls}
+    done = []
+    job.update(progress=0.0, message=f"Processing {len(urls)} PDFs...", files=files)
 
-    return folder_path  # Return folder path for further processing
+    def on_progress(url, size, total):
+        name = pdf_downloader.display_name(url)
+        if total:
+            files[url] = (min(size / total, 1.0), f"{name} ({size / 1e6:.1f} / {total / 1e6:.1f} MB)")
+        else:
+            files[url] = (0.0, f"{name} ({size / 1e6:.1f} MB)")
+
+    def on_file(result):
+        name = pdf_downloader.display_name(result.url)
+        done.append(result)
+        if result.error is None:
+            cached = ", cached" if result.cached else ""
+            files[result.url] = (1.0, f"{name} ({result.chunks} chunks indexed{cached})")
+        else:
+            files[result.url] = (1.0, f"{name}: skipped")
+            job.details.setdefault("warnings", []).append(f"Skipped {name}: {result.error}")
+        job.update(progress=len(done) / len(urls), message=f"{len(done)} of {len(urls)} PDFs processed")
+
+    # Per-stage throughput and queue depth, refreshed while the pipeline runs
+    def on_stats(rows):
+        job.update(stats=rows)
+
+    with registry.building(index_name, check=job.check):
+        result = ingest_urls(urls, folder_path, vectorstore=vectorstore, on_download_progress=on_progress,
+                             on_file=on_file, on_stats=on_stats, cancel=job.cancel_event)
+        chatbot = None
+        if result.documents:
+            job.update(message="Building the retrieval index...")
+            registry.register(index_name, result.documents)
+            chatbot = build_chatbot(result.documents, result.vectorstore,
+                                    index_path=registry.vector_index_path(index_name))
+    return {"index_name": index_name, "ingest": result, "chatbot": chatbot}
+
+
+# Polls the ingestion job this page is attached to; once it finishes, its
+# chatbot is attached to the session and the whole page reruns
+@st.fragment(run_every=1.0)
+def ingest_job_panel():
+    job = jobs.get_job_manager().get(st.session_state['ingest_job'])
+    if job is None:
+        st.session_state['ingest_job'] = None
+        return
+    if not job.finished:
+        st.progress(job.progress or 0.0, text=job.message or "Waiting to start...")
+        for value, text in list(job.details.get("files", {}).values()):
+            st.progress(value, text=text)
+        if job.details.get("stats"):
+            import pandas as pd
+
+            st.dataframe(pd.DataFrame(job.details["stats"]).set_index("stage"))
+        if st.button("Cancel processing", key=f"cancel_{job.id}", disabled=job.cancel_requested):
+            jobs.get_job_manager().cancel(job.id)
+        return
+
+    st.session_state['ingest_job'] = None
+    collect_job_run(job)
+    notices = [("warning", text) for text in job.details.get("warnings", [])]
+    if job.status == jobs.DONE and job.result is not None:
+        if job.result["chatbot"] is None:
+            notices.append(("error", "No documents were loaded for processing."))
+        else:
+            st.session_state['document_embeddings'] = job.result["ingest"].documents
+            st.session_state['vectorstore'] = job.result["ingest"].vectorstore
+            st.session_state['chatbot'] = job.result["chatbot"]
+            st.session_state['index_name'] = job.result["index_name"]
+            notices.append(("success", f"Documents processed successfully in {job.seconds:.0f}s!"))
+    elif job.status == jobs.FAILED:
+        notices.append(("error", f"Error during document processing: {job.error}"))
+    else:
+        notices.append(("warning", f"Document processing {job.status}. {job.message}"))
+    st.session_state['ingest_notices'] = notices
+    st.rerun()
+
+
+# Background job: answer every question of an uploaded sheet (see question_sheet)
+def answer_sheet_job(job, chatbot, path, kind, sheet_hash):
+    import question_sheet
+
+    def on_progress(done, total, result):
+        job.update(progress=done / total if total else None,
+                   message=f"{done} of {total or '?'} questions answered")
+        if result is not None and result.error is not None:
+            job.details.setdefault("warnings", []).append(f"Error processing question {result.question}: {result.error}")
+        job.check()
+
+    with open(path, "rb") as file:
+        result = question_sheet.answer_sheet(chatbot, file, kind, sheet=sheet_hash, on_progress=on_progress)
+    os.remove(path)  # kept until then so a failed run can be resumed
+    return result
+
+
+# Background job: ask the same questions about several companies (see comparison)
+def compare_job(job, companies, keyword, questions, max_pdfs, reuse):
+    import comparison
+
+    def on_progress(runs, answered, total):
+        job.update(progress=answered / total if total else None,
+                   message=f"{answered} of {total} answers",
+                   companies=[{"company": run.company, "status": run.status, "pdfs": len(run.pdfs),
+                               "chunks": run.chunks, "answered": run.answered, "error": run.error or ""}
+                              for run in runs])
+
+    return comparison.compare_companies(companies, keyword, questions, max_pdfs=max_pdfs, reuse=reuse,
+                                        on_progress=on_progress, cancel=job.cancel_event)
+
+
+@st.fragment(run_every=1.0)
+def compare_job_panel():
+    job = jobs.get_job_manager().get(st.session_state['compare_job'])
+    if job is None:
+        st.session_state['compare_job'] = None
+        return
+    if not job.finished:
+        st.progress(job.progress or 0.0, text=job.message or "Searching for reports...")
+        if job.details.get("companies"):
+            import pandas as pd
+
+            st.dataframe(pd.DataFrame(job.details["companies"]).set_index("company"))
+        if st.button("Cancel comparison", key=f"cancel_{job.id}", disabled=job.cancel_requested):
+            jobs.get_job_manager().cancel(job.id)
+        return
+
+    st.session_state['compare_job'] = None
+    collect_job_run(job)
+    notices = []
+    if job.status == jobs.DONE and job.result is not None:
+        st.session_state['comparison_path'] = job.result.path
+        for run in job.result.companies:
+            if run.error is not None:
+                notices.append(("warning", f"{run.company}: {run.error}"))
+        reused = sum(run.reused for run in job.result.companies)
+        notices.append(("success", f"Compared {len(job.result.companies)} companies on {len(job.result.questions)} "
+                                   f"questions in {job.seconds:.0f}s ({reused} saved indexes reused)."))
+    elif job.status == jobs.FAILED:
+        notices.append(("error", f"Error during comparison: {job.error}"))
+    else:
+        notices.append(("warning", f"Comparison {job.status}. {job.message}"))
+    st.session_state['compare_notices'] = notices
+    st.rerun()
+
+
+@st.fragment(run_every=1.0)
+def sheet_job_panel():
+    job = jobs.get_job_manager().get(st.session_state['sheet_job'])
+    if job is None:
+        st.session_state['sheet_job'] = None
+        return
+    if not job.finished:
+        st.progress(job.progress or 0.0, text=job.message or "Waiting to start...")
+        if st.button("Cancel processing", key=f"cancel_{job.id}", disabled=job.cancel_requested):
+            jobs.get_job_manager().cancel(job.id)
+        return
+
+    st.session_state['sheet_job'] = None
+    collect_job_run(job)
+    notices = [("error", text) for text in job.details.get("warnings", [])]
+    if job.status == jobs.DONE and job.result is not None:
+        st.session_state['excel_processed'] = job.result.path
+        resumed = f" ({job.result.resumed} resumed from an earlier run)" if job.result.resumed else ""
+        notices.append(("success", f"Processed {job.result.rows} questions{resumed} in {job.seconds:.0f}s."))
+        answer_cache = getattr(st.session_state['chatbot'], "answer_cache", None)
+        if answer_cache is not None:
+            cache_stats = answer_cache.stats()
+            notices.append(("caption", f"Answer cache: {cache_stats['exact_hits'] + cache_stats['semantic_hits']} hits "
+                                       f"of {cache_stats['lookups']} lookups ({cache_stats['hit_rate']:.0%})"))
+    elif job.status == jobs.FAILED:
+        notices.append(("error", f"Error processing Excel file: {job.error}"))
+    else:
+        notices.append(("warning", f"Processing {job.status}; answered questions are kept for a resume."))
+    st.session_state['sheet_notices'] = notices
+    st.rerun()
 
 
 col1, mid, col2 = st.columns([1, 2, 18])
@@ -125,10 +329,44 @@ with col2:
 # User input for company name and keyword
 st.session_state['company_name'] = st.text_input("Company Name", st.session_state['company_name'])
 st.session_state['keyword'] = st.text_input("Keyword", st.session_state['keyword'])
+investor_site = st.text_input("Investor-relations site (optional, e.g. investor.example.com)")
+
+# Reopen an index built earlier for this company instead of re-ingesting it
+saved_indexes = get_registry().list(company=st.session_state['company_name'] or None)
+if saved_indexes:
+    with st.expander(f"Saved indexes ({len(saved_indexes)})"):
+        labels = {entry.label: entry.name for entry in saved_indexes}
+        chosen = st.selectbox("Previously researched documents", list(labels))
+        load_col, delete_col = st.columns(2)
+        if load_col.button("Load index"):
+            try:
+                with st.spinner("Loading index..."):
+                    from vector_embed import build_chatbot
+
+                    documents, vectorstore = get_registry().load(labels[chosen])
+                    st.session_state['document_embeddings'] = documents
+                    st.session_state['vectorstore'] = vectorstore
+                    st.session_state['chatbot'] = build_chatbot(
+                        documents, vectorstore, index_path=get_registry().vector_index_path(labels[chosen]))
+                    st.session_state['index_name'] = labels[chosen]
+                st.success(f"Loaded {len(documents)} chunks.")
+            except Exception as e:
+                st.error(f"Error loading index: {str(e)}")
+        if delete_col.button("Delete index"):
+            get_registry().evict(labels[chosen])
+            if st.session_state['index_name'] == labels[chosen]:
+                st.session_state['chatbot'] = None
+                st.session_state['vectorstore'] = None
+                st.session_state['index_name'] = None
+            st.rerun()
 
 # Fetch URLs on submit
 if st.button("Submit"):
-    st.session_state['urls'] = find_top_search_results(st.session_state['company_name'], st.session_state['keyword'])
+    with perf_run("search", company=st.session_state['company_name'], keyword=st.session_state['keyword']):
+        st.session_state['urls'] = find_top_search_results(st.session_state['company_name'], st.session_state['keyword'],
+                                                           site=investor_site.strip() or None)
+    if not st.session_state['urls']:
+        st.warning("No search results found.")
     st.session_state['selected_urls'] = []  # Reset selected URLs when fetching new ones
     st.session_state['processed_data'] = {}  # Reset processed data when fetching new URLs
 
@@ -152,12 +390,17 @@ if st.session_state['urls']:
     # Update the selected URLs in session state
     st.session_state['selected_urls'] = selected_urls
 
+    import pdf_crawler
+
+    crawl_depth = st.selectbox("Crawl depth", [0, 1, 2], index=min(pdf_crawler.CRAWL_DEPTH, 2),
+                               help="Also look for PDFs on sub-pages of the selected sites (e.g. investor-relations pages).")
+
     # Submit button to process selected URLs and get list of PDFs
     if st.button("Submit Selected URLs"):
         if st.session_state['selected_urls']:
-            with st.spinner("Processing URLs..."):
+            with st.spinner("Processing URLs..."), perf_run("scrape", urls=len(st.session_state['selected_urls'])):
                 # Process the URLs to find PDFs, but don't save them yet
-                st.session_state['pdf_files'] = process_urls(st.session_state['selected_urls'])
+                st.session_state['pdf_files'] = process_urls(st.session_state['selected_urls'], depth=crawl_depth)
             
             if st.session_state['pdf_files']:
                 st.success("PDFs found! Please select the PDFs to save.")
@@ -181,47 +424,28 @@ if st.session_state['pdf_files']:
     
     st.session_state['final_pdf_selection'] = selected_pdfs
 
-    # Submit button to save the selected PDFs
-    if st.button("Save Selected PDFs"):
+    # Submit button to save the selected PDFs; the work runs as a background job
+    if st.button("Save Selected PDFs", disabled=st.session_state['ingest_job'] is not None):
         if st.session_state['final_pdf_selection']:
-            try:
-                with st.spinner("Saving selected PDFs..."):
-                    folder_path = save_selected_pdfs(st.session_state['final_pdf_selection'])
-                    # st.write(f"PDFs saved to {folder_path}")
-                
-                # Create embeddings and vector store
-                with st.spinner("Processing documents..."):
-                    try:
-                        st.write("Loading documents from directory...")
-                        processed_documents = load_from_directory(folder_path)
-                        # st.write(f"Loaded {len(processed_documents)} documents")
-
-                        if not processed_documents:
-                            st.error("No documents were loaded for processing.")
-                            st.stop()
-                        
-                        st.write("Creating embeddings...")
-                        document_embeddings, vectorstore = create_embeddings(processed_documents)
-                        
-                        if document_embeddings is None or vectorstore is None:
-                            st.error("Failed to create embeddings or vectorstore.")
-                            st.stop()
-                        
-                        st.session_state['document_embeddings'] = document_embeddings
-                        st.session_state['vectorstore'] = vectorstore
-                        st.success("Documents processed successfully!")
-                        
-                    except Exception as e:
-                        st.error(f"Error during document processing: {str(e)}")
-                        st.error(f"Traceback: {traceback.format_exc()}")
-            except Exception as e:
-                st.error(f"Error saving PDFs: {str(e)}")
-                st.error(f"Traceback: {traceback.format_exc()}")
+            st.session_state['ingest_job'] = submit_job(
+                "ingest", save_selected_pdfs, st.session_state['company_name'], st.session_state['keyword'],
+                list(st.session_state['final_pdf_selection']),
+                label=f"{st.session_state['company_name']} / {st.session_state['keyword']}: "
+                      f"{len(st.session_state['final_pdf_selection'])} PDFs")
         else:
             st.warning("Please select at least one PDF to save.")
 
+# Progress of the ingestion job this page is attached to (it keeps running
+# whatever else is clicked) and the outcome of the last one
+if st.session_state['ingest_job'] is not None:
+    st.subheader("Processing PDFs")
+    ingest_job_panel()
+show_notices('ingest_notices')
+
 # Allow chatbot functionality if vectorstore is available
-if st.session_state['vectorstore'] is not None:
+if st.session_state['chatbot'] is not None:
+    if st.session_state['index_name']:
+        get_registry().touch(st.session_state['index_name'])  # keep the index leased while in use
     try:
         st.subheader("Chatbot")
 
@@ -231,89 +455,67 @@ if st.session_state['vectorstore'] is not None:
         if st.button("Submit Question"):
             if user_question:
                 try:
-                    with st.spinner("Processing your query..."):
-                        chatbot_response = create_chatbot(
-                            st.session_state['document_embeddings'], 
-                            st.session_state['vectorstore'], 
-                            user_question
-                        )
-                        st.write(chatbot_response)
+                    with st.spinner("Processing your query..."), perf_run("question"):
+                        chatbot = st.session_state['chatbot']
+                        st.write_stream(chatbot.stream(user_question))
+                        metrics = chatbot.metrics[-1]
+                        if metrics.cache_hit is not None:
+                            st.caption(f"Answered from cache ({metrics.cache_hit} match) in {metrics.total_latency:.2f}s")
+                        elif metrics.time_to_first_token is not None:
+                            st.caption(f"First token after {metrics.time_to_first_token:.2f}s, "
+                                       f"full answer in {metrics.total_latency:.2f}s, "
+                                       f"{metrics.context_chunks} chunks / {metrics.context_tokens} context tokens "
+                                       f"({metrics.context_tokens_saved} saved)")
                 except Exception as e:
                     st.error(f"Error processing question: {str(e)}")
                     st.error(f"Traceback: {traceback.format_exc()}")
             else:
                 st.warning("Please enter a question before submitting.")
 
-        # Excel file processing
-        uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
+        # Excel / CSV question sheet processing. The upload is read row by row and
+        # answered in checkpointed batches (question_sheet), so re-uploading a file
+        # after a failure resumes where it stopped; only its hash is kept in session.
+        uploaded_file = st.file_uploader("Upload an Excel or CSV file", type=["xlsx", "csv"])
 
         if uploaded_file is not None:
             try:
-                current_file_contents = uploaded_file.getvalue()
-                
-                # Check if this is a new file
-                if 'last_processed_file' not in st.session_state or \
-                st.session_state['last_processed_file'] != current_file_contents:
-                    
-                    st.session_state['last_processed_file'] = current_file_contents
-                    
-                    with st.spinner("Processing Excel file..."):
-                        try:
-                            df = pd.read_excel(BytesIO(current_file_contents))
-                            # st.write(f"Excel file loaded. Columns found: {', '.join(df.columns.tolist())}")
-
-                            if 'QUESTIONS' not in df.columns:
-                                st.error("The Excel file must contain a 'QUESTIONS' column.")
-                            else:
-                                responses = []
-                                total_questions = len(df['QUESTIONS'])
-                                st.write(f"Found {total_questions} questions to process")
-
-                                progress_bar = st.progress(0)
-                                
-                                for index, question in enumerate(df['QUESTIONS']):
-                                    try:
-                                        # st.write(f"Processing question {index + 1}: {question}")
-                                        chatbot_response = create_chatbot(
-                                            st.session_state['document_embeddings'],
-                                            st.session_state['vectorstore'],
-                                            question
-                                        )
-                                        responses.append(chatbot_response)
-                                        progress_bar.progress((index + 1) / total_questions)
-                                    except Exception as e:
-                                        st.error(f"Error processing question {index + 1}: {str(e)}")
-                                        responses.append(f"Error: {str(e)}")
-
-                                result_df = pd.DataFrame({
-                                    'QUESTIONS': df['QUESTIONS'],
-                                    'RESPONSES': responses
-                                })
-
-                                output = BytesIO()
-                                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                                    result_df.to_excel(writer, index=False, sheet_name='Chatbot Responses')
-                                    workbook = writer.book
-                                    worksheet = writer.sheets['Chatbot Responses']
-                                    wrap_format = workbook.add_format({'text_wrap': True})
-                                    worksheet.set_column('A:A', 50)
-                                    worksheet.set_column('B:B', 100, wrap_format)
-
-                                st.session_state['excel_processed'] = output.getvalue()
-                                st.success("Excel file processed successfully!")
-
-                        except Exception as e:
-                            st.error(f"Error processing Excel file: {str(e)}")
-                            st.error(f"Traceback: {traceback.format_exc()}")
-
-                if 'excel_processed' in st.session_state:
+                import question_sheet
+
+                sheet_hash = question_sheet.hash_file(uploaded_file)
+                kind = question_sheet.sheet_type(uploaded_file.name)
+
+                # Check if this is a new file; it is answered by a background job that
+                # keeps running across reruns, from a copy of the upload on disk
+                if st.session_state.get('last_processed_sheet') != sheet_hash:
+
+                    st.session_state['last_processed_sheet'] = sheet_hash
+                    st.session_state.pop('excel_processed', None)
+                    sheet_path = question_sheet.save_upload(uploaded_file, sheet_hash, kind)
+                    st.session_state['sheet_job'] = submit_job(
+                        "excel", answer_sheet_job, st.session_state['chatbot'], sheet_path, kind, sheet_hash,
+                        label=uploaded_file.name)
+
+                if st.session_state['sheet_job'] is not None:
+                    sheet_job_panel()
+                show_notices('sheet_notices')
+
+                result_path = st.session_state.get('excel_processed')
+                if result_path is None and st.session_state['sheet_job'] is None and \
+                        st.session_state.get('last_processed_sheet') == sheet_hash:
+                    # The last run failed or was cancelled part way; answered rows are checkpointed
+                    if st.button("Resume processing"):
+                        st.session_state.pop('last_processed_sheet', None)
+                        st.rerun()
+                if result_path and os.path.exists(result_path):
                     try:
-                        st.download_button(
-                            label="Download Responses",
-                            data=st.session_state['excel_processed'],
-                            file_name="chatbot_responses.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
+                        xlsx = result_path.endswith(".xlsx")
+                        with open(result_path, "rb") as result_file:
+                            st.download_button(
+                                label="Download Responses",
+                                data=result_file,
+                                file_name="chatbot_responses.xlsx" if xlsx else "chatbot_responses.csv",
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" if xlsx else "text/csv"
+                            )
                     except Exception as e:
                         st.error(f"Error creating download button: {str(e)}")
             
@@ -323,4 +525,94 @@ if st.session_state['vectorstore'] is not None:
     
     except Exception as e:
         st.error(f"Error in chatbot section: {str(e)}")
-        st.error(f"Traceback: {traceback.format_exc()}")
\ No newline at end of file
+        st.error(f"Traceback: {traceback.format_exc()}")
+
+
+# Comparison mode: the same question sheet for several companies, each ingested
+# into its own index (saved ones are reused), answered into one
+# question x company workbook
+with st.expander("Compare companies"):
+    compare_names = st.text_area("Companies (one per line)")
+    compare_file = st.file_uploader("Questions (Excel or CSV with a QUESTIONS column)", type=["xlsx", "csv"],
+                                    key="compare_questions")
+    compare_max_pdfs = st.number_input("PDFs per company", min_value=1, max_value=20, value=None,
+                                       placeholder="COMPARE_MAX_PDFS (default 5)")
+    compare_reuse = st.checkbox("Reuse saved indexes", value=True)
+    if st.button("Run comparison", disabled=st.session_state['compare_job'] is not None):
+        companies = [line.strip() for line in compare_names.splitlines() if line.strip()]
+        if not companies or not st.session_state['keyword'] or compare_file is None:
+            st.warning("Please enter a keyword, at least one company and a question file.")
+        else:
+            try:
+                import question_sheet
+
+                questions = [question for _, question in question_sheet.iter_questions(
+                    compare_file, question_sheet.sheet_type(compare_file.name)) if question]
+                st.session_state.pop('comparison_path', None)
+                st.session_state['compare_job'] = submit_job(
+                    "compare", compare_job, companies, st.session_state['keyword'], questions,
+                    int(compare_max_pdfs) if compare_max_pdfs else None, compare_reuse,
+                    label=f"{len(companies)} companies x {len(questions)} questions")
+            except Exception as e:
+                st.error(f"Error reading the question file: {str(e)}")
+    if st.session_state['compare_job'] is not None:
+        compare_job_panel()
+    show_notices('compare_notices')
+    comparison_path = st.session_state.get('comparison_path')
+    if comparison_path and os.path.exists(comparison_path):
+        with open(comparison_path, "rb") as comparison_file:
+            st.download_button(label="Download comparison", data=comparison_file,
+                               file_name="company_comparison.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+
+# Background jobs of this server (any session): status, progress, and attaching
+# this page to a running ingestion, e.g. after a page reload
+with st.expander("Background jobs"):
+    recent_jobs = jobs.get_job_manager().list(limit=10)
+    if not recent_jobs:
+        st.caption("No background jobs yet.")
+    for job in recent_jobs:
+        progress = f", {job.progress:.0%}" if job.progress is not None and not job.finished else ""
+        st.write(f"**{job.kind}** {job.label} - {job.status}{progress} ({job.seconds:.0f}s) {job.message}")
+        if not job.finished:
+            cancel_col, attach_col = st.columns(2)
+            if cancel_col.button("Cancel", key=f"jobs_cancel_{job.id}", disabled=job.cancel_requested):
+                jobs.get_job_manager().cancel(job.id)
+            if job.kind == "ingest" and st.session_state['ingest_job'] != job.id and \
+                    attach_col.button("Attach", key=f"jobs_attach_{job.id}"):
+                st.session_state['ingest_job'] = job.id
+                st.rerun()
+
+
+# Timing report of recent actions: per-stage spans, token/byte counters and
+# exports (JSON, OpenTelemetry OTLP/JSON, cProfile dump)
+with st.expander("Performance"):
+    st.checkbox("Profile next run (cProfile)", key='perf_profile')
+    perf_runs = st.session_state['perf_runs']
+    if perf_runs:
+        import pandas as pd
+
+        labels = [f"{run.name} - {run.seconds:.2f}s ({i + 1})" for i, run in enumerate(perf_runs)]
+        index = st.selectbox("Run", list(range(len(perf_runs)))[::-1], format_func=lambda i: labels[i])
+        run = perf_runs[index]
+        st.caption(f"{run.name}: {run.seconds:.2f}s total, trace {run.trace_id}"
+                   + (f", failed: {run.root.error}" if run.root.error else ""))
+        summary = run.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary).set_index("stage"))
+        if run.counters:
+            st.dataframe(pd.DataFrame([{"counter": name, "value": value}
+                                       for name, value in sorted(run.counters.items())]).set_index("counter"))
+        json_col, otel_col = st.columns(2)
+        json_col.download_button("Download JSON", run.to_json(), file_name=f"{run.name}-{run.trace_id}.json",
+                                  mime="application/json")
+        otel_col.download_button("Download OpenTelemetry", json.dumps(run.to_otel()),
+                                 file_name=f"{run.name}-{run.trace_id}.otlp.json", mime="application/json")
+        report = run.profile_report()
+        if report:
+            st.text(report)
+            st.download_button("Download profile (.prof)", run.profile_bytes(),
+                               file_name=f"{run.name}-{run.trace_id}.prof")
+    else:
+        st.caption("No runs recorded yet in this session.")
@@ -0,0 +1,8 @@
+import os
+
+# Benchmarks run offline: give the modules under test placeholder settings so
+# importing them does not need a real .env (no request is ever sent with these).
+os.environ.setdefault("OPEN_API_KEY", "offline-benchmark")
+os.environ.setdefault("EMBEDDING_MODEL", "text-embedding-3-small")
+os.environ.setdefault("LLM", "gpt-4o-mini")
+os.environ.setdefault("USER_AGENT", "social-equality-funds-benchmark")
@@ -0,0 +1,54 @@
+# Excel batch answering: one question at a time (old loop) vs. answer_questions
+# with bounded concurrency, against a fake LLM with a fixed round-trip latency.
+#
+#   python -m benchmarks.bench_batch_qa --questions 40 --latency 0.2 --concurrency 8
+import argparse
+import time
+
+from benchmarks.bench_retrieval import synthetic_corpus, synthetic_questions
+from benchmarks.fakes import FakeChatModel, fake_vectorstore
+from vector_embed import Chatbot, answer_questions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds per call")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    documents = synthetic_corpus(args.chunks, words_per_chunk=120)
+    questions = synthetic_questions(args.questions)
+    questions[len(questions) // 2] += " FAIL"  # one failing row must not sink the batch
+
+    chatbot = Chatbot(documents, fake_vectorstore(documents), chat_model=FakeChatModel(latency=args.latency))
+
+    start = time.perf_counter()
+    sequential = []
+    for question in questions:
+        try:
+            sequential.append(chatbot.ask(question))
+        except Exception as e:
+            sequential.append(f"Error: {e}")
+    sequential_s = time.perf_counter() - start
+
+    progress = []
+    start = time.perf_counter()
+    answers = answer_questions(chatbot, questions, max_concurrency=args.concurrency,
+                               on_progress=lambda done, total, result: progress.append(done))
+    concurrent_s = time.perf_counter() - start
+
+    concurrent = [a.answer if a.error is None else f"Error: {a.error}" for a in answers]
+    assert concurrent == sequential, "concurrent answers differ from sequential order"
+    assert progress == list(range(1, len(questions) + 1))
+    assert sum(a.error is not None for a in answers) == 1
+
+    print(f"questions={len(questions)} llm_latency={args.latency}s concurrency={args.concurrency}")
+    print(f"sequential : {sequential_s:7.2f} s")
+    print(f"concurrent : {concurrent_s:7.2f} s")
+    print(f"speedup    : {sequential_s / concurrent_s:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Corpus memory: a list of LangChain Documents (one object and one metadata dict
+# per chunk) vs. a ChunkStore built in memory vs. a ChunkStore reopened
+# memory-mapped from disk, at 10k and 100k chunks. Memory is the Python heap
+# retained by the corpus (tracemalloc); the memory-mapped text lives in the OS
+# page cache, shared by every session that opens the same index. Also times
+# building the BM25 retriever from each.
+#
+#   python -m benchmarks.bench_chunk_store --sizes 10000 100000
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from langchain_core.documents import Document
+
+from chunk_store import ChunkStore
+from benchmarks.bench_retrieval import synthetic_corpus, synthetic_questions
+from vector_embed import CompactBM25Retriever
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--words-per-chunk", type=int, default=60)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        for n in args.sizes:
+            # Generated outside tracemalloc (slow under it); the measured step rebuilds
+            # every Document, text and metadata dict included, as loading a corpus does
+            raw = [(doc.page_content.encode("utf-8"), doc.metadata)
+                   for doc in synthetic_corpus(n, words_per_chunk=args.words_per_chunk)]
+            documents, list_bytes, _ = retained(lambda: [
+                Document(page_content=text.decode("utf-8"),
+                         metadata={**metadata, "content_hash": f"{i // 50:064x}"})
+                for i, (text, metadata) in enumerate(raw)])
+            del raw
+            store, store_bytes, _ = retained(lambda: ChunkStore.from_documents(documents))
+            path = store.save(os.path.join(work_dir, f"store-{n}"))
+            mapped, mapped_bytes, _ = retained(lambda: ChunkStore.open(path))
+            text_bytes = os.path.getsize(os.path.join(path, "text.bin"))
+
+            print(f"chunks={n} text={text_bytes / 1e6:.1f} MB")
+            print(f"  list of Documents     : {list_bytes / 1e6:7.1f} MB")
+            print(f"  ChunkStore            : {store_bytes / 1e6:7.1f} MB")
+            print(f"  ChunkStore, mmap      : {mapped_bytes / 1e6:7.1f} MB  heap + {text_bytes / 1e6:.1f} MB shared page cache")
+
+            for label, corpus in (("list", documents), ("mmap store", mapped)):
+                start = time.perf_counter()
+                retriever = CompactBM25Retriever.from_documents(corpus, k=5)
+                built = time.perf_counter() - start
+                questions = synthetic_questions(20)
+                start = time.perf_counter()
+                hits = [retriever.invoke(q) for q in questions]
+                print(f"  BM25 from {label:<11}: build {built:5.2f} s, "
+                      f"{(time.perf_counter() - start) / len(questions) * 1000:6.1f} ms/question")
+            assert [d.page_content for d in hits[-1]] == [d.page_content for d in retriever.invoke(questions[-1])]
+            assert mapped[n - 1].metadata == documents[n - 1].metadata
+
+            del documents, store, mapped, retriever
+            gc.collect()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
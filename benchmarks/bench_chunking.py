@@ -0,0 +1,79 @@
+# Chunking strategies (chunking.py) on a sample corpus: the old character
+# splitter (2048 characters, 250 overlap) vs. token-sized, structure-aware
+# chunks at several sizes. For each: chunk count, tokens sent to the embeddings
+# API and what they cost at --price dollars per 1M tokens, the overhead over the
+# page text itself (overlap), the largest chunk in tokens and the split time.
+# The corpus is --reports synthetic reports, or the PDFs given with --pdf.
+# Token counts use the configured tokenizer (an estimate when tiktoken's tables
+# cannot be fetched).
+#
+#   python -m benchmarks.bench_chunking --reports 5 --pages 40 --tokens 256 512 1024
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pdf_extract
+from benchmarks.synthetic_pdf import synthetic_report
+from chunking import TokenChunker, count_tokens
+from vector_embed import CHUNK_OVERLAP, CHUNK_SIZE
+
+
+def load_pages(paths):
+    from langchain_core.documents import Document
+
+    return [Document(page_content=page["text"], metadata={"source": path, "page": page["page"]})
+            for path in paths for page in pdf_extract.iter_pages(path, use_cache=False, use_ocr=False)
+            if len(page["text"].strip()) >= pdf_extract.OCR_MIN_CHARS]
+
+
+def measure(name, splitter, pages, page_tokens, price, baseline):
+    start = time.perf_counter()
+    chunks = splitter.split_documents(pages)
+    seconds = time.perf_counter() - start
+    sizes = [count_tokens(chunk.page_content) for chunk in chunks]
+    tokens = sum(sizes)
+    delta = "" if baseline is None else f"  cost {100 * (tokens - baseline) / baseline:+6.1f}%"
+    print(f"{name:<28} {len(chunks):6d} chunks  {tokens:9d} tokens  ${tokens * price / 1e6:8.4f}{delta}  "
+          f"overhead {100 * (tokens - page_tokens) / page_tokens:+5.1f}%  max {max(sizes, default=0):5d} tokens  "
+          f"split {seconds:6.2f} s")
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--pdf", nargs="*", default=[], help="chunk these PDFs instead of synthetic reports")
+    parser.add_argument("--tokens", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--overlap", type=int, default=0, help="token overlap for the token chunker")
+    parser.add_argument("--price", type=float, default=0.02, help="embedding price, dollars per 1M tokens")
+    args = parser.parse_args()
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    work_dir = tempfile.mkdtemp(prefix="bench-chunking-")
+    try:
+        paths = args.pdf
+        if not paths:
+            for i in range(args.reports):
+                paths.append(os.path.join(work_dir, f"report-{i}.pdf"))
+                with open(paths[-1], "wb") as file:
+                    file.write(synthetic_report(i, n_pages=args.pages))
+        pages = load_pages(paths)
+        page_tokens = sum(count_tokens(page.page_content) for page in pages)
+        print(f"{len(paths)} PDFs, {len(pages)} pages, {page_tokens} tokens of page text, ${args.price}/1M tokens")
+
+        baseline = measure(f"chars {CHUNK_SIZE}/{CHUNK_OVERLAP}",
+                           RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP),
+                           pages, page_tokens, args.price, None)
+        for size in args.tokens:
+            measure(f"tokens {size}/{args.overlap}", TokenChunker(chunk_tokens=size, overlap_tokens=args.overlap),
+                    pages, page_tokens, args.price, baseline)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
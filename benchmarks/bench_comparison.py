@@ -0,0 +1,88 @@
+# Comparison mode (comparison.compare_companies) vs. the by-hand workflow it
+# replaces: one company at a time, each ingested and then asked the question set
+# on its own (QA_CONCURRENCY calls in flight, as the Excel batch does). Reports
+# are served by the local fixture server and OpenAI is replaced by the fake
+# embedder and chat model with a fixed per-call latency, so the timings show how
+# the work overlaps, not how fast the services are.
+# Every run starts from empty caches.
+#
+#   python -m benchmarks.bench_comparison --companies 1 2 4 8 --questions 20
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+# Caches and indexes go to a scratch directory; set before the app modules read them
+WORK_DIR = tempfile.mkdtemp(prefix="bench-comparison-")
+os.environ["DOC_CACHE_DIR"] = os.path.join(WORK_DIR, "cache")
+os.environ["VECTOR_STORE_DIR"] = os.path.join(WORK_DIR, "vector_store_db")
+
+import comparison
+from benchmarks.bench_retrieval import synthetic_questions
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.suite import reset_caches
+from benchmarks.synthetic_pdf import synthetic_report
+from vector_embed import QA_CONCURRENCY
+
+
+def run(companies, sources, questions, args, tag, concurrent):
+    reset_caches()
+    embedding = FakeEmbeddings(size=args.dimensions, latency=args.embed_latency)
+    chat_model = FakeChatModel(latency=args.llm_latency)
+    options = dict(sources=sources, reuse=False, chat_model=chat_model, embedding=embedding,
+                   path=os.path.join(WORK_DIR, f"{tag}.xlsx"))
+    start = time.perf_counter()
+    if concurrent:
+        result = comparison.compare_companies(companies, tag, questions, **options)
+        runs = result.companies
+    else:
+        runs = []
+        for company in companies:
+            runs += comparison.compare_companies([company], tag, questions, max_concurrency=1,
+                                                 qa_concurrency=QA_CONCURRENCY, **options).companies
+    seconds = time.perf_counter() - start
+    failed = [run.company for run in runs if run.status != "done"]
+    if failed:
+        raise RuntimeError(f"companies failed: {failed}")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--companies", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--reports", type=int, default=3, help="reports per company")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--http-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    os.chdir(WORK_DIR)  # downloads go to ./pdf_docs, as in the app
+    try:
+        with FixtureServer(delay=args.http_delay) as server:
+            names = [f"Company {i}" for i in range(max(args.companies))]
+            sources = {name: [server.add_page(f"/c{i}/report-{r}.pdf", synthetic_report(i * 100 + r, n_pages=args.pages),
+                                              "application/pdf") for r in range(args.reports)]
+                       for i, name in enumerate(names)}
+            questions = synthetic_questions(args.questions)
+            print(f"{args.reports} reports x {args.pages} pages per company, {args.questions} questions, "
+                  f"LLM {args.llm_latency}s, embeddings {args.embed_latency}s per call")
+            run(names[:1], sources, questions[:1], args, "warmup", concurrent=True)  # imports, worker start-up
+            for n in args.companies:
+                sequential = run(names[:n], sources, questions, args, f"seq{n}", concurrent=False)
+                concurrent = run(names[:n], sources, questions, args, f"cmp{n}", concurrent=True)
+                print(f"{n:3d} companies: one at a time {sequential:7.2f} s ({sequential / n:6.2f} s each)   "
+                      f"comparison mode {concurrent:7.2f} s ({concurrent / n:6.2f} s each)   "
+                      f"x{sequential / concurrent:.1f}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# PDF discovery: the old serial scrape (one blocking requests.get + html.parser
+# per selected URL) vs. pdf_crawler.discover_pdfs (concurrent, per-host limits,
+# faster parser when lxml is installed), on a local fixture site with
+# investor-relations pages that link to report sub-pages.
+#
+#   python -m benchmarks.bench_discovery --sites 10 --delay 0.2
+import argparse
+import contextlib
+import time
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+import pdf_crawler
+from benchmarks.fixture_server import FixtureServer
+
+
+def old_scrape(url):
+    response = requests.get(url)
+    soup = BeautifulSoup(response.content, 'html.parser')
+    return [urljoin(url, link['href']) for link in soup.find_all('a', href=True)
+            if link['href'].lower().endswith('.pdf')]
+
+
+def build_site(server, site, sub_pages, pdfs_per_page, filler_links):
+    filler = "".join(f'<li><a href="/news/{site}-{i}.html">News item {i}</a></li>' for i in range(filler_links))
+    subs = []
+    for j in range(sub_pages):
+        pdfs = "".join(f'<a href="/files/{site}-annual-{j}-{k}.pdf">Report {k}</a>' for k in range(pdfs_per_page))
+        # Same documents linked again with tracking parameters / fragments
+        pdfs += f'<a href="/files/{site}-annual-{j}-0.pdf?utm_source=ir#page=2">Report 0 again</a>'
+        subs.append(server.add_page(f"/ir/{site}/reports-{j}.html", f"<html><body>{pdfs}<ul>{filler}</ul></body></html>"))
+    links = "".join(f'<a href="{sub}">Reports {j}</a>' for j, sub in enumerate(subs))
+    pdfs = "".join(f'<a href="/files/{site}-summary-{k}.pdf">Summary {k}</a>' for k in range(pdfs_per_page))
+    return server.add_page(f"/ir/{site}/index.html", f"<html><body>{links}{pdfs}<ul>{filler}</ul></body></html>")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", type=int, default=10)
+    parser.add_argument("--sub-pages", type=int, default=4)
+    parser.add_argument("--pdfs-per-page", type=int, default=10)
+    parser.add_argument("--filler-links", type=int, default=2000, help="non-PDF links per page (page weight)")
+    parser.add_argument("--delay", type=float, default=0.2, help="server time-to-first-byte per page")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        # One server per site so each has its own host:port for per-host limits
+        servers = [stack.enter_context(FixtureServer(delay=args.delay)) for _ in range(args.sites)]
+        seeds = [build_site(server, i, args.sub_pages, args.pdfs_per_page, args.filler_links)
+                 for i, server in enumerate(servers)]
+        print(f"sites={args.sites} sub_pages={args.sub_pages} delay={args.delay}s parser={pdf_crawler.PARSER}")
+
+        start = time.perf_counter()
+        old_links = [link for seed in seeds for link in old_scrape(seed)]
+        print(f"serial, depth 0     : {time.perf_counter() - start:6.2f} s  {len(old_links)} PDF links")
+
+        result = pdf_crawler.discover_pdfs(seeds, depth=0)
+        print(f"concurrent, depth 0 : {result.seconds:6.2f} s  {len(result.pdf_links)} PDF links")
+        assert sorted(result.pdf_links) == sorted(old_links)
+
+        result = pdf_crawler.discover_pdfs(seeds, depth=1)
+        expected = args.sites * (args.sub_pages + 1) * args.pdfs_per_page
+        print(f"concurrent, depth 1 : {result.seconds:6.2f} s  {len(result.pdf_links)} PDF links "
+              f"({result.pages_fetched} pages, duplicates removed)")
+        assert len(result.pdf_links) == expected
+
+        html = requests.get(seeds[0]).content
+        for name, extract in (("html.parser", lambda: BeautifulSoup(html, "html.parser").find_all("a", href=True)),
+                              (pdf_crawler.PARSER, lambda: pdf_crawler.extract_links(html, seeds[0]))):
+            start = time.perf_counter()
+            for _ in range(20):
+                extract()
+            print(f"parse one page ({name:<11}): {(time.perf_counter() - start) / 20 * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# PDF downloads: sequential requests.get + response.content (old download_pdf)
+# vs. pdf_downloader.download_pdfs (pooled session, parallel, streamed to disk),
+# against the local fixture server. Reports throughput and peak Python heap.
+#
+#   python -m benchmarks.bench_downloads --files 50 --size-mb 8 --delay 0.05
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+import requests
+
+import pdf_downloader
+from benchmarks.fixture_server import FixtureServer
+
+
+def old_download_pdf(url, folder_path):
+    response = requests.get(url)
+    file_name = os.path.basename(urlparse(url).path)
+    with open(os.path.join(folder_path, file_name), 'wb') as file:
+        file.write(response.content)
+
+
+def measure(label, func, total_bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<11}: {seconds:7.2f} s  {total_bytes / seconds / 1e6:8.1f} MB/s  peak heap {peak / 1e6:8.1f} MB")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--delay", type=float, default=0.05, help="server time-to-first-byte per file")
+    parser.add_argument("--workers", type=int, default=pdf_downloader.DOWNLOAD_WORKERS)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    total_bytes = size * args.files
+    work_dir = tempfile.mkdtemp()
+    try:
+        with FixtureServer() as server:
+            urls = [f"{server.base_url}/files/report_{i}.pdf?size={size}&delay={args.delay}"
+                    for i in range(args.files)]
+            print(f"files={args.files} size={args.size_mb} MB workers={args.workers}")
+
+            old_dir = os.path.join(work_dir, "old")
+            os.makedirs(old_dir)
+            sequential_s = measure("sequential", lambda: [old_download_pdf(u, old_dir) for u in urls], total_bytes)
+
+            new_dir = os.path.join(work_dir, "new")
+            results = []
+            parallel_s = measure("streamed", lambda: results.extend(
+                pdf_downloader.download_pdfs(urls, new_dir, max_workers=args.workers, use_cache=False)), total_bytes)
+
+            assert all(r.error is None and r.bytes == size for r in results)
+            print(f"speedup    : {sequential_s / parallel_s:7.1f}x")
+
+            limited = pdf_downloader.download_pdfs(urls[:2], os.path.join(work_dir, "limited"),
+                                                   max_bytes=size // 2, use_cache=False)
+            assert all(r.error and not os.listdir(os.path.join(work_dir, "limited")) for r in limited)
+            print("size limit : oversized files rejected, no partial files left")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Embedding stage: one embed_documents call over every chunk (old create_embeddings)
+# vs. embedding_pipeline.embed_texts (dedupe, disk memo, concurrent batches with
+# backoff), against a deterministic fake embedder with per-call latency and
+# periodic 429s. Also checks that an interrupted run resumes from its checkpoint.
+#
+#   python -m benchmarks.bench_embeddings --chunks 5000 --duplicates 0.2
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import embedding_pipeline
+from benchmarks.bench_retrieval import synthetic_corpus
+from benchmarks.fakes import FakeEmbeddings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of repeated chunk texts")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API seconds per call")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = [d.page_content for d in synthetic_corpus(args.chunks, words_per_chunk=60)]
+    for i in rng.sample(range(len(texts)), int(len(texts) * args.duplicates)):
+        texts[i] = texts[rng.randrange(len(texts))]
+    print(f"chunks={len(texts)} unique={len(set(texts))} batch={args.batch_size} concurrency={args.concurrency}")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        baseline = FakeEmbeddings(size=64, latency=args.latency)
+        start = time.perf_counter()
+        expected = np.asarray(
+            [v for i in range(0, len(texts), args.batch_size)
+             for v in baseline.embed_documents(texts[i:i + args.batch_size])], dtype=np.float32)
+        print(f"sequential          : {time.perf_counter() - start:6.2f} s  {baseline.texts_sent} texts sent")
+
+        memo = embedding_pipeline.EmbeddingMemo(os.path.join(work_dir, "memo.db"))
+        embedder = FakeEmbeddings(size=64, latency=args.latency, rate_limit_every=7)
+        start = time.perf_counter()
+        vectors = embedding_pipeline.embed_texts(texts, embedder, memo=memo, batch_size=args.batch_size,
+                                                 max_concurrency=args.concurrency)
+        print(f"pipeline (cold memo): {time.perf_counter() - start:6.2f} s  {embedder.texts_sent} texts sent")
+        assert np.allclose(vectors, expected)
+
+        embedder = FakeEmbeddings(size=64, latency=args.latency)
+        start = time.perf_counter()
+        embedding_pipeline.embed_texts(texts, embedder, memo=memo)
+        print(f"pipeline (warm memo): {time.perf_counter() - start:6.2f} s  {embedder.texts_sent} texts sent")
+        assert embedder.texts_sent == 0
+
+        # Interrupted run: every call fails after the first few batches are stored
+        memo = embedding_pipeline.EmbeddingMemo(os.path.join(work_dir, "resume.db"))
+        flaky = FakeEmbeddings(size=64, rate_limit_every=1)
+        first = FakeEmbeddings(size=64)
+        embedding_pipeline.embed_texts(texts[:len(texts) // 2], first, memo=memo, batch_size=args.batch_size)
+        try:
+            embedding_pipeline.embed_texts(texts, flaky, memo=memo, batch_size=args.batch_size, max_retries=0)
+        except Exception:
+            pass
+        resumed = FakeEmbeddings(size=64)
+        embedding_pipeline.embed_texts(texts, resumed, memo=memo, batch_size=args.batch_size)
+        print(f"resume              : {len(set(texts)) - resumed.texts_sent} of {len(set(texts))} "
+              f"unique texts recovered from checkpoint")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# PDF text extraction: the old PyPDFLoader.load() + split_documents (whole report
+# in memory) vs. pdf_extract.load_pdf (page at a time, per-page cache, empty
+# pages skipped, chunks packed into a ChunkStore as they are yielded) for every installed extractor backend, on a synthetic report
+# with a blank "scanned" page every --blank-every pages. Reports pages/s and
+# peak Python memory (tracemalloc).
+#
+#   python -m benchmarks.bench_extraction --pages 300
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import doc_cache
+import pdf_extract
+from chunk_store import ChunkStore
+import vector_embed
+from benchmarks.synthetic_pdf import synthetic_report
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--blank-every", type=int, default=25)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_dir, "report.pdf")
+        with open(path, "wb") as file:
+            file.write(synthetic_report(0, n_pages=args.pages, blank_every=args.blank_every))
+        sha = doc_cache.file_sha256(path)
+        pdf_extract.doc_cache._cache = doc_cache.DocumentCache(os.path.join(work_dir, "cache"))
+        splitter = vector_embed.get_text_splitter()
+        print(f"pages={args.pages} size={os.path.getsize(path) / 1e6:.1f} MB "
+              f"blank pages={args.pages // args.blank_every if args.blank_every else 0} "
+              f"extractors={pdf_extract.available_extractors()} ocr={pdf_extract.ocr_available()}")
+
+        from langchain_community.document_loaders import PyPDFLoader
+
+        old, seconds, peak = measure(lambda: splitter.split_documents(PyPDFLoader(path).load()))
+        print(f"{'PyPDFLoader.load':<24}: {args.pages / seconds:7.0f} pages/s  peak {peak / 1e6:6.1f} MB  "
+              f"{len(old)} chunks")
+
+        for extractor in pdf_extract.available_extractors():
+            for label in ("cold", "page cache"):
+                chunks, seconds, peak = measure(lambda: ChunkStore.from_documents(pdf_extract.load_pdf(
+                    path, splitter, sha=sha, extractor=extractor, use_ocr=False)))
+                print(f"{extractor + ', ' + label:<24}: {args.pages / seconds:7.0f} pages/s  peak {peak / 1e6:6.1f} MB  "
+                      f"{len(chunks)} chunks")
+            if extractor == "pypdf":
+                # Same text and metadata as before, minus the chunks of blank pages
+                assert [(c.page_content, c.metadata) for c in chunks] == \
+                       [(c.page_content, c.metadata) for c in old if len(c.page_content.strip()) >= pdf_extract.OCR_MIN_CHARS]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Question sheet (Excel batch) handling: the old path (pd.read_excel of the whole
+# upload, every response kept in a list, the output workbook built in a BytesIO)
+# vs. question_sheet.answer_sheet (read-only openpyxl row stream, checkpointed
+# batches, workbook written row by row to disk). The chatbot is a stub that
+# returns a fixed-size answer instantly, so only the sheet handling is measured.
+# Also checks that a run interrupted part way resumes from its checkpoint.
+#
+#   python -m benchmarks.bench_question_sheet --rows 5000 --answer-chars 1500
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+import question_sheet
+from benchmarks.bench_retrieval import synthetic_questions
+from vector_embed import answer_questions
+
+
+class StubChatbot:
+    fingerprint = "stub-corpus"
+
+    def __init__(self, answer_chars):
+        self.answer_chars = answer_chars
+        self.calls = 0
+
+    def ask(self, question):
+        self.calls += 1
+        return (f"Answer to {question}. " * (self.answer_chars // 20 + 1))[:self.answer_chars]
+
+
+def old_excel_batch(chatbot, contents):
+    import pandas as pd
+
+    df = pd.read_excel(BytesIO(contents))
+    answers = answer_questions(chatbot, df['QUESTIONS'].tolist())
+    responses = [a.answer if a.error is None else f"Error: {a.error}" for a in answers]
+    result_df = pd.DataFrame({'QUESTIONS': df['QUESTIONS'], 'RESPONSES': responses})
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        result_df.to_excel(writer, index=False, sheet_name='Chatbot Responses')
+    return output.getvalue()
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--answer-chars", type=int, default=1500)
+    args = parser.parse_args()
+
+    import xlsxwriter
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_dir, "questions.xlsx")
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        sheet = workbook.add_worksheet()
+        sheet.write_row(0, 0, ["ID", "QUESTIONS"])
+        for i, question in enumerate(synthetic_questions(args.rows)):
+            sheet.write_row(i + 1, 0, [i, question])
+        workbook.close()
+        with open(path, "rb") as file:
+            contents = file.read()
+        print(f"rows={args.rows} answer={args.answer_chars} chars upload={len(contents) / 1e6:.1f} MB")
+
+        output, seconds, peak = measure(lambda: old_excel_batch(StubChatbot(args.answer_chars), contents))
+        print(f"pd.read_excel + BytesIO : {seconds:6.2f} s  peak {peak / 1e6:6.1f} MB")
+
+        question_sheet.SHEETS_DIR = os.path.join(work_dir, "sheets")
+        checkpoint = question_sheet.SheetCheckpoint(os.path.join(work_dir, "sheets.db"))
+        with open(path, "rb") as file:
+            result, seconds, peak = measure(lambda: question_sheet.answer_sheet(
+                StubChatbot(args.answer_chars), file, "xlsx", checkpoint=checkpoint))
+        print(f"answer_sheet            : {seconds:6.2f} s  peak {peak / 1e6:6.1f} MB")
+        assert result.rows == args.rows and result.errors == 0
+
+        # Interrupted run: stop after about 90% of the rows, then run again
+        checkpoint.clear(result.sheet, StubChatbot.fingerprint)
+        stop_at = args.rows * 9 // 10
+
+        def interrupt(done, total, answer):
+            if done >= stop_at:
+                raise KeyboardInterrupt
+
+        with open(path, "rb") as file:
+            try:
+                question_sheet.answer_sheet(StubChatbot(args.answer_chars), file, "xlsx", checkpoint=checkpoint,
+                                            on_progress=interrupt)
+            except KeyboardInterrupt:
+                pass
+            chatbot = StubChatbot(args.answer_chars)
+            resumed = question_sheet.answer_sheet(chatbot, file, "xlsx", checkpoint=checkpoint)
+        print(f"resume                  : {resumed.resumed} of {args.rows} rows from the checkpoint, "
+              f"{chatbot.calls} asked again")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
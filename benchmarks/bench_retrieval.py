@@ -0,0 +1,74 @@
+# Per-question keyword retrieval latency: rebuilding BM25Retriever for every
+# question (old create_chatbot) vs. querying the BM25Index built once per corpus.
+#
+#   python -m benchmarks.bench_retrieval --chunks 3000 --questions 300
+import argparse
+import itertools
+import random
+import time
+
+from langchain_community.retrievers import BM25Retriever
+from langchain_core.documents import Document
+
+from vector_embed import CompactBM25Retriever
+
+
+def synthetic_corpus(n_chunks, words_per_chunk=350, vocab_size=20000, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    # Zipf-like word distribution so common words dominate as in real reports
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(vocab_size)))
+    documents = []
+    for i in range(n_chunks):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=words_per_chunk)
+        documents.append(Document(page_content=" ".join(words),
+                                  metadata={"source": f"report_{i // 50}.pdf", "page": i % 50,
+                                            "content_hash": f"report-{i // 50}"}))
+    return documents
+
+
+def synthetic_questions(n_questions, vocab_size=5000, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(f"w{rng.randrange(vocab_size)}" for _ in range(12)) for _ in range(n_questions)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = synthetic_corpus(args.chunks)
+    questions = synthetic_questions(args.questions)
+
+    start = time.perf_counter()
+    before = []
+    for question in questions:
+        retriever = BM25Retriever.from_documents(documents)
+        retriever.k = args.k
+        before.append(retriever.invoke(question))
+    before_s = (time.perf_counter() - start) / len(questions)
+
+    start = time.perf_counter()
+    retriever = CompactBM25Retriever.from_documents(documents, k=args.k)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    after = [retriever.invoke(question) for question in questions]
+    after_s = (time.perf_counter() - start) / len(questions)
+
+    # BM25Retriever copies the documents, so compare hits by content
+    overlap = sum(
+        len({d.page_content for d in a} & {d.page_content for d in b}) for a, b in zip(before, after)
+    ) / (args.k * len(questions))
+
+    print(f"chunks={args.chunks} questions={len(questions)} k={args.k}")
+    print(f"rebuild per question : {before_s * 1000:9.2f} ms/question")
+    print(f"build once           : {build_s * 1000:9.2f} ms (one-off)")
+    print(f"reuse index          : {after_s * 1000:9.2f} ms/question")
+    print(f"speedup              : {before_s / after_s:9.1f}x")
+    print(f"top-{args.k} overlap        : {overlap:9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Report search: the old single serial query per Submit vs. url_fetcher's
+# concurrent query variants with the on-disk search cache, against a stub
+# backend with a fixed per-query latency.
+#
+#   python -m benchmarks.bench_search --companies 10 --latency 0.5
+import argparse
+import os
+import tempfile
+import time
+
+import url_fetcher
+from benchmarks.fakes import FakeSearchBackend
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--companies", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="backend latency per query")
+    parser.add_argument("--variants", default="latest,filetype,year", help="SEARCH_VARIANTS to fan out to")
+    args = parser.parse_args()
+
+    backend = FakeSearchBackend(latency=args.latency)
+    url_fetcher._cache = url_fetcher.SearchCache(os.path.join(tempfile.mkdtemp(), "search.db"))
+    companies = [f"Company {i}" for i in range(args.companies)]
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    print(f"companies={args.companies} latency={args.latency}s variants={len(url_fetcher.query_variants('x', 'y', variants))}")
+
+    start = time.perf_counter()
+    old_links = [item["link"] for company in companies
+                 for item in backend.results(f"{company} + diversity + pdf + report + latest", 5)]
+    print(f"single query, serial     : {time.perf_counter() - start:6.2f} s  {len(old_links)} links")
+
+    for label in ("fan-out, cold cache      ", "fan-out, warm cache      "):
+        calls = backend.calls
+        start = time.perf_counter()
+        results = [url_fetcher.find_top_search_results(company, "diversity", backend=backend, variants=variants) for company in companies]
+        print(f"{label}: {time.perf_counter() - start:6.2f} s  {sum(map(len, results))} links, "
+              f"{backend.calls - calls} backend calls")
+        assert all(len(links) == len(set(links)) for links in results)
+
+
+if __name__ == "__main__":
+    main()
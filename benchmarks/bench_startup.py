@@ -0,0 +1,86 @@
+# Cold start: time to the first rendered page of app.py in a fresh interpreter
+# (Streamlit's AppTest runs the script once, as a browser session would), with
+# -X importtime showing which imports the time goes to. --baseline runs the same
+# measurement on an earlier commit for a before/after comparison.
+#
+#   python -m benchmarks.bench_startup --baseline HEAD~1
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import benchmarks  # noqa: F401  (placeholder API settings)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_RENDER = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=120)
+app.run()
+assert not app.exception, app.exception
+print(f"FIRST_RENDER {time.perf_counter() - start:.3f}")
+"""
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package" lines; top level = least indented
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) <= 1:
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative) / 1e6
+    return modules
+
+
+def measure(tree, state_dir):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1",
+               VECTOR_STORE_DIR=os.path.join(state_dir, "vector_store_db"),
+               DOC_CACHE_DIR=os.path.join(state_dir, "doc_cache"))
+    env.setdefault("GOOGLE_API_SECRET", "offline-benchmark")
+    env.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", FIRST_RENDER],
+                             cwd=tree, env=env, capture_output=True, text=True)
+    seconds = [float(line.split()[1]) for line in process.stdout.splitlines() if line.startswith("FIRST_RENDER")]
+    if process.returncode or not seconds:
+        raise RuntimeError(f"first render failed in {tree}:\n{process.stderr[-2000:]}")
+    return seconds[0], parse_importtime(process.stderr)
+
+
+def report(label, runs, top):
+    seconds = sorted(run[0] for run in runs)
+    imports = runs[0][1]
+    print(f"{label}: first render {seconds[len(seconds) // 2]:.2f} s (median of {len(seconds)}), "
+          f"imports {sum(imports.values()):.2f} s")
+    for name, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {cumulative:6.3f} s  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", help="git ref to compare against, e.g. HEAD~1")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="slowest top-level imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trees = []
+        if args.baseline:
+            baseline = os.path.join(tmp, "baseline")
+            os.makedirs(baseline)
+            archive = subprocess.run(["git", "archive", args.baseline], cwd=ROOT, capture_output=True, check=True)
+            subprocess.run(["tar", "-x", "-C", baseline], input=archive.stdout, check=True)
+            trees.append((f"baseline ({args.baseline})", baseline))
+        trees.append(("working tree", ROOT))
+
+        for label, tree in trees:
+            runs = [measure(tree, os.path.join(tmp, f"state-{i}")) for i in range(args.runs)]
+            report(label, runs, args.top)
+
+
+if __name__ == "__main__":
+    main()
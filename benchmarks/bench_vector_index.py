@@ -0,0 +1,113 @@
+# Vector retrieval backends (vector_index.py): recall@k and per-query latency of
+# the exact index at float32 / float16 / int8 and of HNSW at several ef_search
+# values, against exact float32 search as ground truth. --chroma also times a
+# query to a Chroma collection (the default retrieval path) over the same vectors.
+#
+# Vectors are synthetic: unit vectors drawn around --clusters centres, which
+# gives the clumpy neighbourhoods of real embeddings (uniform random vectors are
+# the worst case for any ANN index); queries are perturbed corpus vectors.
+#
+#   python -m benchmarks.bench_vector_index --chunks 20000 --dimensions 1536 --k 5
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import vector_index
+
+
+def synthetic_vectors(n, dimensions, clusters=200, spread=0.6, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=n)] + spread * rng.standard_normal((n, dimensions)).astype(np.float32)
+    return vector_index._unit(vectors)
+
+
+def synthetic_queries(vectors, n, noise=0.8, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(len(vectors), size=n)]
+    return vector_index._unit(picked + noise * rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(vectors.shape[1]))
+
+
+def time_queries(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return results, statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def recall(results, truth, k):
+    return statistics.mean(len(set(map(int, found[:k])) & set(map(int, expected[:k]))) / k
+                           for found, expected in zip(results, truth))
+
+
+def report(name, build_s, nbytes, results, p50, p95, truth, k):
+    print(f"{name:<24} build {build_s:6.2f} s  {nbytes / 1e6:7.1f} MB  "
+          f"p50 {p50 * 1e3:7.3f} ms  p95 {p95 * 1e3:7.3f} ms  recall@{k} {recall(results, truth, k):.3f}")
+
+
+def chroma_baseline(vectors, queries, k, truth):
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection("bench-vector-index")
+    start = time.perf_counter()
+    ids = [str(i) for i in range(len(vectors))]
+    for i in range(0, len(vectors), vector_index.COLLECTION_BATCH_SIZE):
+        batch = slice(i, i + vector_index.COLLECTION_BATCH_SIZE)
+        collection.add(ids=ids[batch], embeddings=vectors[batch].tolist(), documents=[""] * len(ids[batch]))
+    build_s = time.perf_counter() - start
+    # Same call Chatbot.retrieve makes: documents, metadatas and stored embeddings come back with the hits
+    results, p50, p95 = time_queries(
+        lambda q: list(map(int, collection.query(query_embeddings=[q.tolist()], n_results=k,
+                                                 include=["documents", "metadatas", "embeddings"])["ids"][0])),
+        queries)
+    report("chroma (current)", build_s, 0, results, p50, p95, truth, k)
+    client.delete_collection("bench-vector-index")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--m", type=int, default=vector_index.HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=vector_index.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--chroma", action="store_true", help="also time the Chroma collection query")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.chunks, args.dimensions, clusters=args.clusters)
+    queries = synthetic_queries(vectors, args.queries)
+    print(f"chunks={args.chunks} dimensions={args.dimensions} queries={args.queries} k={args.k}")
+
+    truth = None
+    for dtype in vector_index.DTYPES:
+        start = time.perf_counter()
+        index = vector_index.build_index(vectors, "exact", dtype)
+        build_s = time.perf_counter() - start
+        results, p50, p95 = time_queries(lambda q: index.search(q, args.k)[0], queries)
+        if truth is None:
+            truth = results  # exact float32 is the ground truth
+        report(f"exact {dtype}", build_s, index.nbytes, results, p50, p95, truth, args.k)
+
+    start = time.perf_counter()
+    index = vector_index.build_index(vectors, "hnsw", m=args.m, ef_construction=args.ef_construction)
+    build_s = time.perf_counter() - start
+    for ef in args.ef:
+        index.set_ef_search(ef)
+        results, p50, p95 = time_queries(lambda q: index.search(q, args.k)[0], queries)
+        report(f"hnsw M={args.m} ef={ef}", build_s, index.nbytes, results, p50, p95, truth, args.k)
+
+    if args.chroma:
+        chroma_baseline(vectors, queries, args.k, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Deterministic local stand-ins for the OpenAI chat and embedding clients, with a
+# configurable per-call latency so network-bound behaviour can be measured offline.
+import itertools
+import threading
+import time
+from typing import Any
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    fail_marker: str = "FAIL"
+
+    @property
+    def _llm_type(self):
+        return "fake-latency-chat"
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        if self.fail_marker and self.fail_marker in prompt:
+            raise RuntimeError("fake LLM failure")
+        # Echo the prompt tail so callers can check which question was answered
+        return "ANSWER: " + prompt.strip().splitlines()[-3].strip()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._reply(messages).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.latency / len(words))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    latency: float = 0.0
+    # Every n-th embed_documents call fails with a 429 (0 = never)
+    rate_limit_every: int = 0
+    model: str = "fake-embedding"
+    _calls: Any = PrivateAttr(default_factory=lambda: itertools.count(1))
+    _texts_sent: Any = PrivateAttr(default_factory=list)
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        if self.rate_limit_every and next(self._calls) % self.rate_limit_every == 0:
+            raise FakeRateLimitError("429 Too Many Requests")
+        self._texts_sent.append(len(texts))
+        return super().embed_documents(texts)
+
+    @property
+    def texts_sent(self):
+        return sum(self._texts_sent)
+
+    # Same vectors as DeterministicFakeEmbedding, which reseeds NumPy's global
+    # generator and so mixes up the vectors of batches embedded concurrently
+    def _get_embedding(self, seed):
+        return list(np.random.RandomState(seed).normal(size=self.size))
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+# In-memory Chroma collection over documents. Chunks that carry a content_hash
+# are written under the same sha:n ids as ingestion (vector_embed.upsert_chunks)
+def fake_vectorstore(documents, embedding=None, collection_name="benchmark"):
+    from vector_embed import upsert_chunks
+
+    embedding = embedding or FakeEmbeddings(size=64)
+    if any(doc.metadata.get("content_hash") is None for doc in documents):
+        return Chroma.from_documents(documents, embedding, collection_name=collection_name)
+    vectorstore = Chroma(collection_name=collection_name, embedding_function=embedding)
+    by_hash = {}
+    for doc in documents:
+        by_hash.setdefault(doc.metadata["content_hash"], []).append(doc)
+    for sha, chunks in by_hash.items():
+        upsert_chunks(vectorstore._collection, sha, chunks, embedding.embed_documents([c.page_content for c in chunks]))
+    return vectorstore
+
+
+# Stand-in for the Google search backend (see url_fetcher.set_search_backend):
+# n deterministic results per query, overlapping between query variants
+class FakeSearchBackend:
+    name = "fake"
+
+    def __init__(self, latency=0.0, sites=20):
+        self.latency = latency
+        self.sites = sites
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def results(self, query, num_results):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        seed = sum(map(ord, query))
+        return [{"title": f"Result {i} for {query}", "link": f"https://site{(seed + i) % self.sites}.example.com/report.pdf"}
+                for i in range(num_results)]
@@ -0,0 +1,108 @@
+# Local HTTP stand-in for the sites the app downloads from.
+#
+#   /files/<name>.pdf?size=<bytes>&delay=<seconds>   streamed PDF-like body
+#       &block_delay=<seconds>  pause before every 1 MB block
+#       &no_length=1            no Content-Length header (body ends when the connection closes)
+#   any path registered in FixtureServer.pages      fixed HTML/bytes body
+# FixtureServer(delay=...) adds a time-to-first-byte to every response.
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BLOCK = b"%PDF-1.4\n" + b"0" * (1024 * 1024 - 9)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        delay = max(float(params.get("delay", ["0"])[0]), self.server.delay)
+        if delay:
+            time.sleep(delay)
+
+        page = self.server.pages.get(parsed.path)
+        if page is not None:
+            body, content_type = page
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if parsed.path.startswith("/files/"):
+            size = int(params.get("size", [str(len(BLOCK))])[0])
+            block_delay = float(params.get("block_delay", ["0"])[0])
+            no_length = params.get("no_length", ["0"])[0] == "1"
+            etag = f'"{parsed.path}-{size}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("ETag", etag)
+            if no_length:
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            else:
+                self.send_header("Content-Length", str(size))
+            self.end_headers()
+            sent = 0
+            while sent < size:
+                if block_delay:
+                    time.sleep(block_delay)
+                piece = BLOCK[:min(len(BLOCK), size - sent)]
+                self.wfile.write(piece)
+                sent += len(piece)
+            return
+
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients aborting oversized or timed-out downloads are expected
+        pass
+
+
+class FixtureServer:
+
+    def __init__(self, pages=None, delay=0.0):
+        self.pages = dict(pages or {})
+        self.delay = delay
+
+    def __enter__(self):
+        self.httpd = _Server(("127.0.0.1", 0), _Handler)
+        self.httpd.pages = self.pages
+        self.httpd.delay = self.delay
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_page(self, path, body, content_type="text/html; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.pages[path] = (body, content_type)
+        return self.base_url + path
@@ -0,0 +1,269 @@
+# Offline end-to-end benchmark suite. Every scenario runs the app's own pipeline
+# code; only the remote services are replaced: synthetic PDF reports are served
+# by a local HTTP fixture server, and OpenAI is replaced by the deterministic
+# fake embedder and chat model (benchmarks/fakes.py) with a fixed per-call latency.
+#
+#   ingest    download -> parse -> embed -> upsert of --reports synthetic PDFs,
+#             cold (empty caches) and warm (same URLs again)
+#   question  per-question latency of Chatbot.stream (first token and full answer)
+#   batch     an Excel-style batch of --batch questions through answer_questions
+#
+# Each scenario runs --repeat times (timings are the median) under an
+# instrumentation run, so results also carry the per-stage breakdown. Results are
+# written as JSON with the commit they were measured on; --compare prints the
+# change against an earlier results file and --fail-over makes a regression
+# beyond that percentage exit non-zero.
+#
+#   python -m benchmarks.suite --output bench-results.json
+#   python -m benchmarks.suite --compare bench-results.json --fail-over 20
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Caches go to a scratch directory; set before the app modules read DOC_CACHE_DIR
+WORK_DIR = tempfile.mkdtemp(prefix="bench-suite-")
+os.environ["DOC_CACHE_DIR"] = os.path.join(WORK_DIR, "cache")
+os.environ["VECTOR_STORE_DIR"] = os.path.join(WORK_DIR, "vector_store_db")
+
+import answer_cache
+import doc_cache
+import embedding_pipeline
+import instrumentation
+from benchmarks.bench_retrieval import synthetic_corpus, synthetic_questions
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, fake_vectorstore
+from benchmarks.fixture_server import FixtureServer
+from benchmarks.synthetic_pdf import synthetic_report
+
+SUITE_VERSION = 1
+SCENARIOS = ("ingest", "question", "batch")
+
+
+def reset_caches():
+    doc_cache._cache = None
+    embedding_pipeline._memo = None
+    answer_cache._cache = None
+    shutil.rmtree(doc_cache.DOC_CACHE_DIR, ignore_errors=True)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def digest(values):
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def ingest_scenario(args, repeat):
+    from langchain_community.vectorstores import Chroma
+
+    import ingest_pipeline
+
+    with FixtureServer(delay=args.http_delay) as server:
+        urls = [server.add_page(f"/reports/report-{i}.pdf", synthetic_report(i, n_pages=args.pages),
+                                "application/pdf") for i in range(args.reports)]
+        reset_caches()
+        embedding = FakeEmbeddings(size=args.dimensions, latency=args.embed_latency)
+        vectorstore = Chroma(collection_name=f"suite-ingest-{repeat}", embedding_function=embedding)
+        folder = os.path.join(WORK_DIR, f"pdf_docs-{repeat}")
+        try:
+            start = time.perf_counter()
+            cold = ingest_pipeline.ingest_urls(urls, folder, vectorstore=vectorstore, embedding=embedding)
+            cold_s = time.perf_counter() - start
+            sent = embedding.texts_sent
+            start = time.perf_counter()
+            warm = ingest_pipeline.ingest_urls(urls, folder, vectorstore=vectorstore, embedding=embedding)
+            warm_s = time.perf_counter() - start
+        finally:
+            vectorstore.delete_collection()
+            shutil.rmtree(folder, ignore_errors=True)
+
+    errors = [f.error for f in cold.files + warm.files if f.error is not None]
+    if errors:
+        raise RuntimeError(f"ingestion failed: {errors}")
+    chunks = len(cold.documents)
+    return {
+        "cold_s": cold_s,
+        "warm_s": warm_s,
+        "cold_files_per_s": args.reports / cold_s,
+        "cold_pages_per_s": args.reports * args.pages / cold_s,
+        "cold_chunks_per_s": chunks / cold_s,
+        "chunks": chunks,
+        "texts_embedded": sent,
+        "warm_texts_embedded": embedding.texts_sent - sent,
+    }, digest([cold.documents.text(i) for i in range(0, chunks, max(1, chunks // 50))])
+
+
+def _chatbot(args):
+    from vector_embed import Chatbot
+
+    reset_caches()
+    documents = synthetic_corpus(args.chunks, words_per_chunk=120)
+    vectorstore = fake_vectorstore(documents, FakeEmbeddings(size=args.dimensions),
+                                   collection_name=f"suite-qa-{time.monotonic_ns()}")
+    # No answer cache: every question must reach retrieval and the LLM
+    return Chatbot(documents, vectorstore, chat_model=FakeChatModel(latency=args.llm_latency))
+
+
+def question_scenario(args, repeat):
+    chatbot = _chatbot(args)
+    try:
+        answers = ["".join(chatbot.stream(q)) for q in synthetic_questions(args.questions)]
+    finally:
+        chatbot.vectorstore.delete_collection()
+    first = [m.time_to_first_token for m in chatbot.metrics]
+    total = [m.total_latency for m in chatbot.metrics]
+    return {
+        "first_token_p50_s": percentile(first, 0.5),
+        "first_token_p95_s": percentile(first, 0.95),
+        "latency_p50_s": percentile(total, 0.5),
+        "latency_p95_s": percentile(total, 0.95),
+        "context_tokens_mean": statistics.mean(m.context_tokens for m in chatbot.metrics),
+    }, digest(answers)
+
+
+def batch_scenario(args, repeat):
+    from vector_embed import answer_questions
+
+    chatbot = _chatbot(args)
+    questions = synthetic_questions(args.batch, seed=2)
+    try:
+        start = time.perf_counter()
+        answers = answer_questions(chatbot, questions, max_concurrency=args.concurrency)
+        seconds = time.perf_counter() - start
+    finally:
+        chatbot.vectorstore.delete_collection()
+    return {
+        "batch_s": seconds,
+        "questions_per_s": len(questions) / seconds,
+        "errors": sum(a.error is not None for a in answers),
+    }, digest([a.answer for a in answers])
+
+
+RUNNERS = {"ingest": ingest_scenario, "question": question_scenario, "batch": batch_scenario}
+
+
+def run_scenario(name, args):
+    samples, checks, run = [], set(), None
+    for repeat in range(args.repeat):
+        with instrumentation.record(name) as run:
+            metrics, check = RUNNERS[name](args, repeat)
+        samples.append(metrics)
+        checks.add(check)
+    # Median of every metric over the repeats; counts are identical between repeats
+    metrics = {key: round(statistics.median(sample[key] for sample in samples), 4) for key in samples[0]}
+    return {
+        "metrics": metrics,
+        # Same output on every repeat and, for an unchanged pipeline, across commits
+        "output_digest": checks.pop() if len(checks) == 1 else "nondeterministic",
+        "stages": run.summary(),
+        "counters": run.counters,
+    }
+
+
+def git_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+# Lower is better for durations (*_s), higher for throughputs (*_per_s); other
+# metrics are reported without a verdict
+def direction(metric):
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith("_s"):
+        return -1
+    return 0
+
+
+def compare(baseline, results, fail_over=None):
+    print(f"\nvs. {(baseline.get('commit') or 'unknown')[:12]}:")
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if before.get("output_digest") != scenario["output_digest"]:
+            print(f"  {name}: output differs from baseline")
+        for metric, value in scenario["metrics"].items():
+            old = before["metrics"].get(metric)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            worse = direction(metric) * change < 0
+            flag = ""
+            if direction(metric) and fail_over is not None and worse and abs(change) > fail_over:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{metric}")
+            print(f"  {name + '.' + metric:<34} {old:>10.4g} -> {value:>10.4g}  {change:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--reports", type=int, default=8, help="synthetic PDFs to ingest")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--chunks", type=int, default=2000, help="corpus size for the Q&A scenarios")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=40, help="questions in the Excel-style batch")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding size")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="fake embedding seconds per call")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM seconds per call")
+    parser.add_argument("--http-delay", type=float, default=0.05, help="fixture server time to first byte")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--fail-over", type=float, help="exit 1 if a timing regresses by more than this %%")
+    args = parser.parse_args()
+
+    try:
+        results = {
+            "suite_version": SUITE_VERSION,
+            **git_info(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "compare", "fail_over")},
+            "scenarios": {},
+        }
+        for name in args.scenarios:
+            results["scenarios"][name] = scenario = run_scenario(name, args)
+            print(f"{name}: " + ", ".join(f"{key}={value:g}" for key, value in scenario["metrics"].items()))
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("params") != results["params"]:
+            print("warning: baseline was measured with different parameters")
+        regressions = compare(baseline, results, args.fail_over)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.fail_over:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
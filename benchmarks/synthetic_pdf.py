@@ -0,0 +1,55 @@
+# Minimal text PDF writer for synthetic benchmark corpora (no extra dependencies).
+import random
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """Return PDF bytes with one page per entry of pages (a list of text lines)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+        stream.extend(f"({_escape(line)}) '" for line in lines)
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(None)
+        page_ids.append(len(objects))
+        objects[-1] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects) - 1))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+WORDS = ("equity diversity inclusion board pay gap gender ethnicity workforce human rights "
+         "supply chain privacy accountability governance disclosure policy report annual "
+         "sustainability emissions community employees representation leadership audit").split()
+
+
+# blank_every=n makes every n-th page blank, like a scanned page without a text layer
+def synthetic_report(seed, n_pages=10, lines_per_page=60, words_per_line=12, blank_every=0):
+    rng = random.Random(seed)
+    pages = []
+    for page in range(n_pages):
+        if blank_every and (page + 1) % blank_every == 0:
+            pages.append([])
+            continue
+        lines = [f"Report {seed} section {page + 1}"]
+        lines += [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines_per_page)]
+        pages.append(lines)
+    return make_pdf(pages)
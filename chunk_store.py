@@ -0,0 +1,160 @@
+import json
+import mmap
+import os
+import shutil
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+# Compact, read-only corpus of chunks, used in place of a list of LangChain
+# Documents wherever a whole corpus is kept around (session state, the chatbot,
+# the BM25 retriever). The text of every chunk lives in one UTF-8 buffer
+# addressed by an offsets array, and metadata is stored column-wise with every
+# value interned once per key: a corpus has a handful of sources and a few
+# hundred page numbers, not one dict per chunk.
+#
+# A store can be saved to a directory and reopened memory-mapped, so every
+# session (and process) that opens the same index shares one copy of the text
+# through the OS page cache:
+#
+#   <dir>/text.bin       UTF-8 text of all chunks, back to back
+#   <dir>/offsets.npy    int64, chunk i is text.bin[offsets[i]:offsets[i + 1]]
+#   <dir>/column_<n>.npy int32 value id per chunk for metadata key n (-1 = absent)
+#   <dir>/values.json    {"keys": [...], "values": [[...], ...]}
+#
+# Indexing returns a Document built on demand, so the store can be passed
+# anywhere a list of Documents was (Chroma sync, BM25, corpus fingerprints).
+MISSING = -1
+
+
+def _intern_key(value):
+    try:
+        hash(value)
+        return type(value), value
+    except TypeError:
+        return type(value), json.dumps(value, sort_keys=True)
+
+
+class ChunkStore(Sequence):
+    __slots__ = ("_buffer", "_offsets", "_keys", "_columns", "_values", "_mmap")
+
+    def __init__(self, buffer, offsets, keys, columns, values, mmap_file=None):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._keys = keys
+        self._columns = columns
+        self._values = values
+        self._mmap = mmap_file
+
+    @classmethod
+    def from_documents(cls, documents):
+        if isinstance(documents, ChunkStore):
+            return documents
+        pieces, offsets = [], array("q", [0])
+        keys, columns, values, interned = [], [], [], []
+        count = 0
+        for doc in documents:
+            data = doc.page_content.encode("utf-8")
+            pieces.append(data)
+            offsets.append(offsets[-1] + len(data))
+            for key, value in doc.metadata.items():
+                try:
+                    column = keys.index(key)
+                except ValueError:
+                    column = len(keys)
+                    keys.append(key)
+                    columns.append(array("i", [MISSING]) * count)
+                    values.append([])
+                    interned.append({})
+                ids = interned[column]
+                value_key = _intern_key(value)
+                if value_key not in ids:
+                    ids[value_key] = len(values[column])
+                    values[column].append(value)
+                columns[column].append(ids[value_key])
+            count += 1
+            for column in columns:
+                if len(column) < count:
+                    column.append(MISSING)
+        return cls(b"".join(pieces), np.frombuffer(offsets, dtype=np.int64).copy(), keys,
+                   [np.frombuffer(column, dtype=np.int32).copy() for column in columns], values)
+
+    # ---- persistence -------------------------------------------------------
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "text.bin"), "wb") as file:
+            file.write(self._buffer)
+        np.save(os.path.join(tmp_path, "offsets.npy"), self._offsets)
+        for n, column in enumerate(self._columns):
+            np.save(os.path.join(tmp_path, f"column_{n}.npy"), column)
+        with open(os.path.join(tmp_path, "values.json"), "w", encoding="utf-8") as file:
+            json.dump({"keys": self._keys, "values": self._values}, file)
+        # Readers that still map the old files keep them until they close
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, "values.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        mmap_file = None
+        with open(os.path.join(path, "text.bin"), "rb") as file:
+            if os.fstat(file.fileno()).st_size:
+                mmap_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        columns = [np.load(os.path.join(path, f"column_{n}.npy"), mmap_mode="r") for n in range(len(meta["keys"]))]
+        return cls(mmap_file if mmap_file is not None else b"", offsets, meta["keys"], columns,
+                   meta["values"], mmap_file)
+
+    # ---- access ------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def text(self, i):
+        return self._buffer[int(self._offsets[i]):int(self._offsets[i + 1])].decode("utf-8")
+
+    def metadata(self, i):
+        return {key: values[column[i]] for key, column, values in zip(self._keys, self._columns, self._values)
+                if column[i] != MISSING}
+
+    def texts(self):
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def __getitem__(self, i):
+        from langchain_core.documents import Document
+
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    # Value of one metadata key for every chunk (None where absent), without building any Document
+    def column(self, key):
+        if key not in self._keys:
+            return [None] * len(self)
+        n = self._keys.index(key)
+        values = self._values[n] + [None]  # MISSING (-1) picks the trailing None
+        return [values[i] for i in self._columns[n].tolist()]
+
+    # Distinct values of one metadata key, without building any Document
+    def distinct(self, key):
+        if key not in self._keys:
+            return []
+        n = self._keys.index(key)
+        return [self._values[n][i] for i in np.unique(self._columns[n]) if i != MISSING]
+
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.nbytes + sum(column.nbytes for column in self._columns)
+
+    def __repr__(self):
+        return f"ChunkStore({len(self)} chunks, {self.nbytes() / 1e6:.1f} MB)"
@@ -0,0 +1,194 @@
+import os
+import re
+from functools import lru_cache
+
+# Token-sized, structure-aware chunking. Chunk sizes are counted in tokens of
+# the embedding/LLM tokenizer instead of characters, so a chunk's size matches
+# what the models see. A chunk never spans two pages (every page is split on its
+# own) and a heading starts a new chunk once the current one holds at least
+# CHUNK_MIN_TOKENS; inside a section, text is cut at paragraph, then line, then
+# sentence boundaries and only split mid-sentence when one sentence alone is
+# larger than a chunk. Chunk text is an exact slice of the page text.
+#
+# Every chunk records its size in metadata["tokens"], so context budgeting at
+# question time does not tokenize chunks again. CHUNK_OVERLAP_TOKENS repeats the
+# tail of a chunk at the start of the next one (within a section); it defaults
+# to 0 since chunks already end at natural boundaries and overlap is paid for
+# on every embedding call. CHUNK_STRATEGY=chars restores the old
+# RecursiveCharacterTextSplitter (2048 characters, 250 overlap).
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "tokens")  # tokens | chars
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_HEADING_MAX_CHARS = 80
+_NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.|[A-Z]\.)\s+\S")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+@lru_cache(maxsize=None)
+def get_token_encoder():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        # tiktoken fetches its tables on first use; fall back to ~4 characters per token
+        print(f"Token encoder unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text):
+    encoder = get_token_encoder()
+    if encoder is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoder = get_token_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+
+
+# Token count of a chunk, from its metadata when it was chunked here
+def chunk_tokens(doc):
+    tokens = doc.metadata.get("tokens")
+    return tokens if isinstance(tokens, int) else count_tokens(doc.page_content)
+
+
+def is_heading(line):
+    line = line.strip()
+    if not line or len(line) > _HEADING_MAX_CHARS or line[-1] in ".,;:":
+        return False
+    if line.startswith("#"):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) < 3:
+        return False
+    if _NUMBERED_HEADING.match(line) or all(c.isupper() for c in letters):
+        return True
+    # Short Title Case line ("Human Rights Policy", "Board Diversity")
+    words = line.split()
+    return len(words) <= 8 and all(w[0].isupper() or not w[0].isalpha() or len(w) <= 3 for w in words) \
+        and words[0][0].isupper()
+
+
+# (start, end) character spans of the sections of text, a new one at every heading line
+def _sections(text):
+    starts, offset = [0], 0
+    for line in text.splitlines(keepends=True):
+        if offset and is_heading(line):
+            starts.append(offset)
+        offset += len(line)
+    starts.append(len(text))
+    return [(a, b) for a, b in zip(starts, starts[1:]) if text[a:b].strip()]
+
+
+def _pieces(text, start, end, pattern):
+    spans, last = [], start
+    for match in pattern.finditer(text, start, end):
+        if match.start() > last:
+            spans.append((last, match.start()))
+        last = match.end()
+    if last < end:
+        spans.append((last, end))
+    return spans
+
+
+def _lines(text, start, end):
+    spans, offset = [], start
+    for line in text[start:end].splitlines(keepends=True):
+        if line.strip():
+            spans.append((offset, offset + len(line)))
+        offset += len(line)
+    return spans
+
+
+class TokenChunker:
+
+    def __init__(self, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, min_tokens=CHUNK_MIN_TOKENS,
+                 count=None):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        self.min_tokens = min_tokens
+        self.count = count or count_tokens
+
+    # (start, end, tokens) spans no larger than chunk_tokens covering text[start:end],
+    # cut at the coarsest boundary that fits: paragraph, line, sentence, then tokens
+    def _units(self, text, start, end, level=0):
+        tokens = self.count(text[start:end])
+        if tokens < self.chunk_tokens:
+            return [(start, end, tokens)]
+        splitters = (lambda a, b: _pieces(text, a, b, _PARAGRAPH_BREAK), lambda a, b: _lines(text, a, b),
+                     lambda a, b: _pieces(text, a, b, _SENTENCE_END))
+        for depth in range(level, len(splitters)):
+            spans = splitters[depth](start, end)
+            if len(spans) > 1:
+                return [unit for a, b in spans for unit in self._units(text, a, b, depth + 1)]
+        return self._token_windows(text, start, end)
+
+    # Last resort for a single oversized "sentence": cut every chunk_tokens tokens
+    def _token_windows(self, text, start, end):
+        encoder = get_token_encoder()
+        if encoder is None:
+            step = (self.chunk_tokens - 1) * 4
+            return [(a, min(a + step, end), self.count(text[a:min(a + step, end)])) for a in range(start, end, step)]
+        spans, offset = [], start
+        tokens = encoder.encode(text[start:end], disallowed_special=())
+        for i in range(0, len(tokens), self.chunk_tokens - 1):
+            piece = encoder.decode(tokens[i:i + self.chunk_tokens - 1])
+            spans.append((offset, min(offset + len(piece), end), len(tokens[i:i + self.chunk_tokens - 1])))
+            offset += len(piece)
+        return spans
+
+    # (start, end) character spans of the chunks of one page. Every unit costs
+    # one token more than its own count, for the separator joining it to the
+    # previous one, so that a chunk recounted as a whole stays within chunk_tokens
+    def split_spans(self, text):
+        chunks, current, size = [], [], 0
+        for start, end in _sections(text):
+            if current and size >= self.min_tokens:
+                chunks.append((current[0][0], current[-1][1]))
+                current, size = [], 0
+            for unit_start, unit_end, tokens in self._units(text, start, end):
+                unit = (unit_start, unit_end, tokens + 1)
+                if current and size + unit[2] > self.chunk_tokens:
+                    chunks.append((current[0][0], current[-1][1]))
+                    # Carry the tail of the chunk over, as far as overlap_tokens allows
+                    kept, kept_size = [], 0
+                    for previous in reversed(current):
+                        if kept_size + previous[2] > self.overlap_tokens or kept_size + previous[2] + unit[2] > self.chunk_tokens:
+                            break
+                        kept.insert(0, previous)
+                        kept_size += previous[2]
+                    current, size = kept, kept_size
+                current.append(unit)
+                size += unit[2]
+        if current:
+            chunks.append((current[0][0], current[-1][1]))
+        return chunks
+
+    def split_text(self, text):
+        return [text[start:end].strip() for start, end in self.split_spans(text) if text[start:end].strip()]
+
+    # Same interface as LangChain's text splitters: each document (a page) is
+    # split on its own and every chunk gets the page's metadata plus "tokens"
+    def split_documents(self, documents):
+        from langchain_core.documents import Document
+
+        chunks = []
+        for doc in documents:
+            for text in self.split_text(doc.page_content):
+                chunks.append(Document(page_content=text, metadata={**doc.metadata, "tokens": self.count(text)}))
+        return chunks
+
+    # Identifies the chunk sizes; chunks sized by the ~4 characters per token
+    # estimate are keyed apart from ones counted with the real tokenizer
+    @property
+    def key(self):
+        estimated = "-est4" if get_token_encoder() is None else ""
+        return f"tok{self.chunk_tokens}-{self.overlap_tokens}-{self.min_tokens}-{TOKEN_ENCODING}{estimated}"
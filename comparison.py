@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import doc_cache
+import instrumentation
+
+# Comparison mode: one question set asked about many companies, answered as a
+# company x question matrix. Every company gets its own index (see
+# index_registry), found, downloaded and ingested with up to COMPARE_CONCURRENCY
+# companies in flight; a company that already has a saved index for the keyword
+# is reopened instead. All companies share one Chroma client, the document,
+# embedding and answer caches, one embedding of each question and one pool of
+# COMPARE_QA_CONCURRENCY LLM calls, and a company's questions start as soon as
+# its index is ready, while the others are still ingesting. Retrieval for a company only
+# ever sees that company's collection.
+COMPARE_CONCURRENCY = int(os.getenv("COMPARE_CONCURRENCY", "4"))
+COMPARE_MAX_PDFS = int(os.getenv("COMPARE_MAX_PDFS", "5"))  # per company, best scoring links first
+# LLM calls in flight across all companies (the single-company batch uses QA_CONCURRENCY)
+COMPARE_QA_CONCURRENCY = int(os.getenv("COMPARE_QA_CONCURRENCY", "16"))
+COMPARE_DIR = os.getenv("COMPARE_DIR", os.path.join(doc_cache.DOC_CACHE_DIR, "comparisons"))
+
+
+class ComparisonCancelled(Exception):
+    pass
+
+
+@dataclass
+class CompanyRun:
+    company: str
+    status: str = "queued"  # queued, searching, ingesting, answering, done, failed, cancelled
+    index_name: Optional[str] = None
+    reused: bool = False
+    pdfs: List[str] = field(default_factory=list)
+    chunks: int = 0
+    answered: int = 0
+    errors: int = 0
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class ComparisonResult:
+    companies: List[CompanyRun]
+    questions: List[str]
+    # company -> one answer (or "Error: ...") per question
+    answers: Dict[str, List[Optional[str]]]
+    path: Optional[str] = None
+    seconds: float = 0.0
+
+
+# PDF links for a company: searched for (or taken from sources, page or PDF
+# URLs) and crawled, keeping the max_pdfs links that look most like reports
+def find_company_pdfs(company, keyword, sources=None, max_pdfs=None, depth=None, site=None):
+    import pdf_crawler
+    from url_fetcher import find_top_search_results
+
+    urls = sources or find_top_search_results(company, keyword, site=site)
+    result = pdf_crawler.discover_pdfs(urls, depth=pdf_crawler.CRAWL_DEPTH if depth is None else depth)
+    for url, error in result.errors.items():
+        print(f"Comparison: error crawling {url} for {company}: {error}")
+    ranked = sorted(result.pdf_links, key=lambda link: -pdf_crawler.link_score(link))  # stable: search order breaks ties
+    return ranked[:max_pdfs or COMPARE_MAX_PDFS]
+
+
+# A chatbot over the company's index: the newest saved one for company/keyword,
+# or a new one ingested from its PDFs
+def prepare_company(run, keyword, sources=None, max_pdfs=None, reuse=True, chat_model=None,
+                    embedding=None, parse_workers=None, cancel=None):
+    from index_registry import get_registry
+    from ingest_pipeline import ingest_urls
+    from vector_embed import build_chatbot
+
+    registry = get_registry()
+
+    def check():
+        if cancel is not None and cancel.is_set():
+            raise ComparisonCancelled()
+
+    saved = registry.list(company=run.company, keyword=keyword) if reuse else []
+    if saved:
+        run.index_name, run.reused = saved[0].name, True
+        documents, vectorstore = registry.load(run.index_name, embedding)
+    else:
+        run.status = "searching"
+        run.pdfs = find_company_pdfs(run.company, keyword, sources=sources, max_pdfs=max_pdfs)
+        if not run.pdfs:
+            raise ValueError("no PDFs found")
+        check()
+        run.status = "ingesting"
+        run.index_name, vectorstore = registry.open(run.company, keyword, run.pdfs, embedding)
+
+        # Takes turns with app sessions building the same collection, and downloads
+        # into a folder of its own as they do
+        folder_path = os.path.join("pdf_docs", run.index_name, f"compare-{os.getpid()}-{threading.get_ident()}")
+        with registry.building(run.index_name, check=check):
+            result = ingest_urls(run.pdfs, folder_path, vectorstore=vectorstore, embedding=embedding,
+                                 parse_workers=parse_workers, cancel=cancel)
+            failed = [f.error for f in result.files if f.error is not None]
+            run.errors += len(failed)
+            if not len(result.documents):
+                raise ValueError(f"no documents could be loaded ({failed[0]})" if failed else "no documents could be loaded")
+            registry.register(run.index_name, result.documents)
+            run.chunks = len(result.documents)
+            return build_chatbot(result.documents, result.vectorstore, chat_model=chat_model,
+                                 index_path=registry.vector_index_path(run.index_name))
+    run.chunks = len(documents)
+    return build_chatbot(documents, vectorstore, chat_model=chat_model,
+                         index_path=registry.vector_index_path(run.index_name))
+
+
+# Matrix workbook: one row per question, one column per company, plus a sheet
+# with how each company's documents were found
+def write_matrix(result, path):
+    import xlsxwriter
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        workbook = xlsxwriter.Workbook(tmp_path, {"constant_memory": True})
+        wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+        matrix = workbook.add_worksheet("Comparison")
+        matrix.set_column(0, 0, 50, wrap_format)
+        matrix.set_column(1, len(result.companies), 60, wrap_format)
+        matrix.write_row(0, 0, ["QUESTIONS"] + [run.company for run in result.companies])
+        for row, question in enumerate(result.questions, start=1):
+            matrix.write_row(row, 0, [question] + [result.answers[run.company][row - 1] or ""
+                                                   for run in result.companies])
+
+        companies = workbook.add_worksheet("Companies")
+        companies.write_row(0, 0, ["COMPANY", "STATUS", "INDEX", "REUSED", "CHUNKS", "ANSWERED", "ERRORS",
+                                   "SECONDS", "PDFS", "ERROR"])
+        for row, run in enumerate(result.companies, start=1):
+            companies.write_row(row, 0, [run.company, run.status, run.index_name or "", run.reused, run.chunks,
+                                         run.answered, run.errors, round(run.seconds, 1), "\n".join(run.pdfs),
+                                         run.error or ""])
+        workbook.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+# Ask questions about every company and write the matrix workbook to path (a
+# new file in COMPARE_DIR by default). sources optionally maps a company to the
+# page or PDF URLs to use instead of a web search. on_progress(runs, answered,
+# total) is called from worker threads whenever a company or answer finishes.
+# cancel (a threading.Event) stops ingestion and skips unanswered questions.
+def compare_companies(companies, keyword, questions, sources=None, max_pdfs=None, max_concurrency=None,
+                      qa_concurrency=None, reuse=True, chat_model=None, embedding=None, path=None,
+                      on_progress=None, cancel=None):
+    from embedding_pipeline import embed_texts, get_memo
+    from vector_embed import LOAD_WORKERS, embedding_model_name, get_embeddings
+
+    start = time.perf_counter()
+    companies = list(dict.fromkeys(" ".join(str(c).split()) for c in companies if str(c).strip()))
+    questions = [str(q) for q in questions]
+    runs = [CompanyRun(company=company) for company in companies]
+    answers = {company: [None] * len(questions) for company in companies}
+    cancel = cancel or threading.Event()
+    lock = threading.Lock()
+    answered = [0]
+    total = len(companies) * len(questions)
+
+    def progress():
+        if on_progress is not None:
+            on_progress(runs, answered[0], total)
+
+    # Each question is embedded once for every company (one batched, memoized call)
+    embedding = embedding or get_embeddings()
+    with instrumentation.span("compare.embed_questions", questions=len(questions)):
+        query_vectors = embed_texts(questions, embedding, model=embedding_model_name(embedding), memo=get_memo())
+
+    max_concurrency = max(1, min(max_concurrency or COMPARE_CONCURRENCY, len(runs) or 1))
+    parse_workers = max(1, LOAD_WORKERS // max_concurrency)
+    qa_pool = ThreadPoolExecutor(max_workers=max(1, qa_concurrency or COMPARE_QA_CONCURRENCY))
+    question_futures = {}
+
+    def ask(run, chatbot, i):
+        if cancel.is_set():
+            return
+        try:
+            answer = chatbot.ask(questions[i], question_vector=query_vectors[i])
+        except Exception as e:
+            answer = f"Error: {e}"
+            with lock:
+                run.errors += 1
+        with lock:
+            answers[run.company][i] = answer
+            run.answered += 1
+            answered[0] += 1
+        progress()
+
+    def prepare(run):
+        company_start = time.perf_counter()
+        try:
+            with instrumentation.span("compare.company", company=run.company) as span:
+                chatbot = prepare_company(run, keyword, sources=(sources or {}).get(run.company), max_pdfs=max_pdfs,
+                                          reuse=reuse, chat_model=chat_model, embedding=embedding,
+                                          parse_workers=parse_workers, cancel=cancel)
+                if span is not None:
+                    span.attributes.update(chunks=run.chunks, reused=run.reused, pdfs=len(run.pdfs))
+            run.status = "answering"
+            futures = [qa_pool.submit(instrumentation.wrap(ask), run, chatbot, i) for i in range(len(questions))]
+            with lock:
+                question_futures[run.company] = futures
+        except Exception as e:
+            run.status = "cancelled" if cancel.is_set() else "failed"
+            run.error = str(e) or type(e).__name__
+            print(f"Comparison: {run.company} failed: {run.error}")
+        finally:
+            run.seconds = time.perf_counter() - company_start
+        progress()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as company_pool:
+            for future in as_completed([company_pool.submit(instrumentation.wrap(prepare), run) for run in runs]):
+                future.result()
+        for run in runs:
+            for future in question_futures.get(run.company, []):
+                future.result()
+            if run.status == "answering":
+                run.status = "cancelled" if cancel.is_set() else "done"
+    finally:
+        qa_pool.shutdown(wait=True)
+    if cancel.is_set():
+        raise ComparisonCancelled(f"Comparison cancelled after {answered[0]} of {total} answers")
+
+    for run in runs:
+        if run.error is not None:
+            answers[run.company] = [f"Error: {run.error}"] * len(questions)
+    result = ComparisonResult(companies=runs, questions=questions, answers=answers,
+                              seconds=time.perf_counter() - start)
+    if path is None:
+        os.makedirs(COMPARE_DIR, exist_ok=True)
+        path = os.path.join(COMPARE_DIR, f"comparison-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.xlsx")
+    result.path = write_matrix(result, path)
+    print(f"Compared {len(runs)} companies on {len(questions)} questions in {result.seconds:.1f}s "
+          f"({sum(run.reused for run in runs)} indexes reused, {sum(run.error is not None for run in runs)} failed)")
+    return result
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Persistent, content-addressed cache of downloaded PDFs, their split chunks and
+# chunk embeddings. Everything is keyed by the SHA-256 of the raw file, and URLs
+# map to a hash together with the ETag/Last-Modified they were fetched with, so an
+# unchanged report is never downloaded, parsed or embedded twice.
+#
+#   <DOC_CACHE_DIR>/index.db                       url + entry bookkeeping (SQLite)
+#   <DOC_CACHE_DIR>/blobs/<sha>.pdf                raw file
+#   <DOC_CACHE_DIR>/pages/<sha>.<extractor>.jsonl  extracted text, one page per line
+#   <DOC_CACHE_DIR>/chunks/<sha>.<chunk_key>.json  split chunks
+#   <DOC_CACHE_DIR>/vectors/<sha>.<key>.npy        chunk embeddings (float32)
+#
+# Entries are evicted least-recently-used first once the cache grows past
+# DOC_CACHE_MAX_MB. index.db records the size of every file it wrote (files
+# table), so keeping count costs one stat per write and eviction knows which
+# files to delete without listing the cache directories.
+DOC_CACHE_DIR = os.getenv("DOC_CACHE_DIR", ".doc_cache")
+DOC_CACHE_MAX_BYTES = int(float(os.getenv("DOC_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+_cache_lock = threading.Lock()
+_cache = None
+_cache_pid = None
+# Process that opened the bookkeeping database. SQLite state must not cross
+# fork(): a forked parse worker that opens the same index.db can find it locked
+# by lock state inherited from its parent. Caches created in such a child skip
+# the bookkeeping and only remember what they wrote; the parse worker hands
+# that list back (take_untracked) and the parent records it (account_files).
+_db_pid = None
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _safe_key(key):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in key)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class DocumentCache:
+
+    def __init__(self, root=DOC_CACHE_DIR, max_bytes=DOC_CACHE_MAX_BYTES, track_usage=None):
+        global _db_pid
+        self.root = root
+        self.max_bytes = max_bytes
+        for sub in ("blobs", "pages", "chunks", "vectors"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+        self._lock = threading.RLock()
+        self.track_usage = _db_pid in (None, os.getpid()) if track_usage is None else track_usage
+        self._db = None
+        self._untracked = []
+        if not self.track_usage:
+            return
+        _db_pid = os.getpid()
+        self._db = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, etag TEXT, last_modified TEXT, fetched_at REAL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            sha256 TEXT PRIMARY KEY, size_bytes INTEGER NOT NULL DEFAULT 0, last_used REAL)""")
+        has_files = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone() is not None
+        # path is relative to root
+        self._db.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size_bytes INTEGER NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+        if not has_files:
+            self._index_existing_files()
+        self._db.commit()
+
+    # ---- paths -------------------------------------------------------------
+
+    def blob_path(self, sha):
+        return os.path.join(self.root, "blobs", f"{sha}.pdf")
+
+    def _pages_path(self, sha, extractor):
+        return os.path.join(self.root, "pages", f"{sha}.{_safe_key(extractor)}.jsonl")
+
+    def _chunks_path(self, sha, chunk_key):
+        return os.path.join(self.root, "chunks", f"{sha}.{_safe_key(chunk_key)}.json")
+
+    def _vectors_path(self, sha, key):
+        return os.path.join(self.root, "vectors", f"{sha}.{_safe_key(key)}.npy")
+
+    # ---- urls --------------------------------------------------------------
+
+    # Returns {"sha256", "etag", "last_modified"} for a url whose blob is still cached
+    def lookup_url(self, url):
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256, etag, last_modified FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return {"sha256": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def put_url(self, url, sha, etag=None, last_modified=None):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, sha, etag, last_modified, time.time()))
+            self._db.commit()
+
+    # ---- blobs -------------------------------------------------------------
+
+    def put_blob(self, path, sha=None):
+        sha = sha or file_sha256(path)
+        blob = self.blob_path(sha)
+        if not os.path.exists(blob):
+            _link_or_copy(path, blob)
+        self._account(sha, blob)
+        return sha
+
+    # Place the cached file for sha at path (hard link when possible)
+    def materialize(self, sha, path):
+        if os.path.exists(path):
+            os.remove(path)
+        _link_or_copy(self.blob_path(sha), path)
+        self.touch(sha)
+        return path
+
+    # ---- pages -------------------------------------------------------------
+
+    # Iterator over the cached pages of a file ({"page", "text", "ocr"} dicts,
+    # read one line at a time), or None when the file was not extracted yet
+    def iter_pages(self, sha, extractor):
+        path = self._pages_path(sha, extractor)
+        if not os.path.exists(path):
+            return None
+        self.touch(sha)
+        return _read_json_lines(path)
+
+    # Pass pages through while writing them to the cache; the entry only
+    # becomes visible once every page has been consumed
+    def put_pages(self, sha, extractor, pages):
+        path = self._pages_path(sha, extractor)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                for page in pages:
+                    file.write(json.dumps(page) + "\n")
+                    yield page
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._account(sha, path)
+
+    # ---- chunks ------------------------------------------------------------
+
+    def get_chunks(self, sha, chunk_key):
+        path = self._chunks_path(sha, chunk_key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                records = json.load(file)
+        except (OSError, ValueError):
+            return None
+        from langchain_core.documents import Document
+
+        self.touch(sha)
+        return [Document(page_content=r["page_content"], metadata=r["metadata"]) for r in records]
+
+    def put_chunks(self, sha, chunk_key, documents):
+        path = self._chunks_path(sha, chunk_key)
+        records = [{"page_content": d.page_content, "metadata": d.metadata} for d in documents]
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(records, file)
+        os.replace(tmp_path, path)
+        self._account(sha, path)
+
+    # ---- vectors -----------------------------------------------------------
+
+    def get_vectors(self, sha, key):
+        try:
+            vectors = np.load(self._vectors_path(sha, key))
+        except (OSError, ValueError):
+            return None
+        self.touch(sha)
+        return vectors
+
+    def put_vectors(self, sha, key, vectors):
+        path = self._vectors_path(sha, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp_path, np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, path)
+        self._account(sha, path)
+
+    # ---- bookkeeping -------------------------------------------------------
+
+    def touch(self, sha):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_used = ? WHERE sha256 = ?", (time.time(), sha))
+            self._db.commit()
+
+    # Record path (just written for sha) with its size and refresh the entry's
+    # total from the files table. A cache without bookkeeping keeps the pair for
+    # take_untracked instead.
+    def _account(self, sha, path):
+        if self._db is None:
+            self._untracked.append((sha, path))
+            return
+        with self._lock:
+            self._record(sha, path)
+            self._db.commit()
+        self.evict()
+
+    def _record(self, sha, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self._db.execute("INSERT OR REPLACE INTO files (path, sha256, size_bytes) VALUES (?, ?, ?)",
+                         (os.path.relpath(path, self.root), sha, size))
+        self._db.execute(
+            """INSERT INTO entries (sha256, size_bytes, last_used)
+               VALUES (?, (SELECT SUM(size_bytes) FROM files WHERE sha256 = ?), ?)
+               ON CONFLICT (sha256) DO UPDATE SET size_bytes = excluded.size_bytes, last_used = excluded.last_used""",
+            (sha, sha, time.time()))
+
+    # (sha, path) of every file written since the last call by a cache that
+    # keeps no bookkeeping (one in a forked worker)
+    def take_untracked(self):
+        with self._lock:
+            untracked, self._untracked = self._untracked, []
+        return untracked
+
+    # Record files another process wrote into this cache (take_untracked's result)
+    def account_files(self, files):
+        if not files:
+            return
+        if self._db is None:
+            self._untracked.extend(files)
+            return
+        with self._lock:
+            for sha, path in files:
+                self._record(sha, path)
+            self._db.commit()
+        self.evict()
+
+    # One-off scan for a cache created before the files table existed
+    def _index_existing_files(self):
+        shas = {row[0] for row in self._db.execute("SELECT sha256 FROM entries")}
+        if not shas:
+            return
+        for sub in ("blobs", "pages", "chunks", "vectors"):
+            for name in os.listdir(os.path.join(self.root, sub)):
+                sha = name.split(".", 1)[0]
+                if sha in shas and not name.endswith((".tmp", ".tmp.npy")):
+                    self._db.execute("INSERT OR REPLACE INTO files (path, sha256, size_bytes) VALUES (?, ?, ?)",
+                                     (f"{sub}/{name}", sha, os.path.getsize(os.path.join(self.root, sub, name))))
+        self._db.execute(
+            "UPDATE entries SET size_bytes = COALESCE((SELECT SUM(size_bytes) FROM files WHERE files.sha256 = entries.sha256), 0)")
+
+    def total_bytes(self):
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+
+    # Drop least-recently-used entries until the cache fits in max_bytes
+    def evict(self):
+        with self._lock:
+            total = self.total_bytes()
+            if total <= self.max_bytes:
+                return []
+            evicted = []
+            rows = self._db.execute("SELECT sha256, size_bytes FROM entries ORDER BY last_used ASC").fetchall()
+            for sha, size in rows:
+                if total <= self.max_bytes:
+                    break
+                for (path,) in self._db.execute("SELECT path FROM files WHERE sha256 = ?", (sha,)).fetchall():
+                    path = os.path.join(self.root, path)
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._db.execute("DELETE FROM files WHERE sha256 = ?", (sha,))
+                self._db.execute("DELETE FROM entries WHERE sha256 = ?", (sha,))
+                self._db.execute("DELETE FROM urls WHERE sha256 = ?", (sha,))
+                total -= size
+                evicted.append(sha)
+            self._db.commit()
+            print(f"Document cache evicted {len(evicted)} entries")
+            return evicted
+
+
+def _read_json_lines(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+# One cache per process; a forked parse worker gets its own, without bookkeeping
+def get_cache():
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = DocumentCache()
+            _cache_pid = os.getpid()
+        return _cache
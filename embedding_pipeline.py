@@ -0,0 +1,198 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import doc_cache
+import instrumentation
+
+# Embedding stage shared by every path that sends text to the embeddings API:
+# identical texts are embedded once, vectors are memoized on disk by
+# sha256(model, text), batches run with bounded concurrency and back off on rate
+# limits, and every finished batch is committed to the memo straight away so an
+# interrupted run resumes where it stopped. The memo is kept under
+# EMBEDDING_MEMO_MAX_MB by dropping the least recently used vectors.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBEDDING_MEMO_PATH = os.getenv("EMBEDDING_MEMO_PATH", os.path.join(doc_cache.DOC_CACHE_DIR, "embeddings.db"))
+EMBEDDING_MEMO_MAX_BYTES = int(float(os.getenv("EMBEDDING_MEMO_MAX_MB", "1024")) * 1024 * 1024)
+
+_RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+_memo_lock = threading.Lock()
+_memo = None
+
+
+def memo_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingMemo:
+
+    def __init__(self, path=EMBEDDING_MEMO_PATH, max_bytes=EMBEDDING_MEMO_MAX_BYTES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS vectors (
+            key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL DEFAULT 0)""")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(vectors)")]
+        if "last_used" not in columns:
+            # Memo written before the size limit: every vector counts as least recently used
+            self._db.execute("ALTER TABLE vectors ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+        self._db.commit()
+        # Running total of vector bytes, so a put does not sum the whole table
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM vectors").fetchone()[0]
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            hits = list(found)
+            for i in range(0, len(hits), 500):
+                batch = hits[i:i + 500]
+                self._db.execute(f"UPDATE vectors SET last_used = ? WHERE key IN ({','.join('?' * len(batch))})",
+                                 [time.time(), *batch])
+            if hits:
+                self._db.commit()
+        return found
+
+    def put_many(self, items):
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), time.time()) for key, vector in items]
+        with self._lock:
+            for i in range(0, len(rows), 500):
+                batch = [key for key, _, _ in rows[i:i + 500]]
+                self._bytes -= self._db.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM vectors WHERE key IN ({','.join('?' * len(batch))})",
+                    batch).fetchone()[0]
+            self._db.executemany("INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._bytes += sum(len(blob) for _, blob, _ in rows)
+            self._evict()
+            self._db.commit()
+
+    def total_bytes(self):
+        with self._lock:
+            return self._bytes
+
+    # Drop least recently used vectors until the memo fits in max_bytes
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        excess, evicted = self._bytes - self.max_bytes, []
+        cursor = self._db.execute("SELECT rowid, LENGTH(vector) FROM vectors ORDER BY last_used ASC")
+        for rowid, size in cursor:
+            if excess <= 0:
+                break
+            evicted.append((rowid,))
+            excess -= size
+            self._bytes -= size
+        cursor.close()
+        self._db.executemany("DELETE FROM vectors WHERE rowid = ?", evicted)
+        print(f"Embedding memo evicted {len(evicted)} vectors")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+def get_memo():
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = EmbeddingMemo()
+        return _memo
+
+
+def is_retryable(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def embed_with_backoff(embedding, texts, max_retries=EMBED_MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+    with instrumentation.span("embed.batch", texts=len(texts)) as span:
+        for attempt in range(max_retries + 1):
+            try:
+                return embedding.embed_documents(texts)
+            except Exception as e:
+                if attempt == max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e) or min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random())
+                print(f"Embedding batch rate limited ({type(e).__name__}), retrying in {delay:.1f}s")
+                instrumentation.add("embed.retries")
+                if span is not None:
+                    span.attributes["retries"] = attempt + 1
+                time.sleep(delay)
+
+
+# Embed texts and return a float32 array of shape (len(texts), dim) in input order.
+# on_progress(done, total) counts unique texts and is called on the calling thread.
+def embed_texts(texts, embedding, model=None, memo=None, batch_size=None, max_concurrency=None,
+                max_retries=EMBED_MAX_RETRIES, on_progress=None):
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    model = model or getattr(embedding, "model", None) or type(embedding).__name__
+    batch_size = batch_size or EMBED_BATCH_SIZE
+
+    keys = [memo_key(model, text) for text in texts]
+    unique = dict(zip(keys, texts))
+    vectors = memo.get_many(unique) if memo is not None else {}
+    missing = [key for key in unique if key not in vectors]
+    done = len(unique) - len(missing)
+    if on_progress is not None:
+        on_progress(done, len(unique))
+
+    instrumentation.add("embed.texts", len(texts))
+    instrumentation.add("embed.texts_sent", len(missing))
+    instrumentation.add("embed.chars_sent", sum(len(unique[key]) for key in missing))
+    with instrumentation.span("embed", texts=len(texts), unique=len(unique), sent=len(missing)):
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        if batches:
+            max_workers = max(1, min(max_concurrency or EMBED_CONCURRENCY, len(batches)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(instrumentation.wrap(embed_with_backoff), embedding, [unique[k] for k in batch], max_retries): batch
+                           for batch in batches}
+                errors = []
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        items = list(zip(batch, future.result()))
+                    except Exception as e:
+                        # Keep checkpointing the other batches, then fail the call
+                        errors.append(e)
+                        continue
+                    # Checkpoint: a finished batch is never paid for again
+                    if memo is not None:
+                        memo.put_many(items)
+                    vectors.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in items)
+                    done += len(batch)
+                    if on_progress is not None:
+                        on_progress(done, len(unique))
+                if errors:
+                    raise errors[0]
+
+    if missing:
+        print(f"Embedded {len(texts)} texts: {len(unique)} unique, {len(missing)} sent to the API")
+    return np.vstack([vectors[key] for key in keys])
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List
+
+from chunk_store import ChunkStore
+
+# Named, persistent vector store collections, one per researched corpus, so a
+# company researched before can be reopened without re-embedding anything and
+# concurrent Streamlit sessions never write into each other's index.
+#
+# A collection is keyed by company, keyword and the corpus selection (the set
+# of selected document URLs): the name has to exist before the first download,
+# since ingestion upserts files as they arrive. The registry also records the
+# content hash of the indexed files, and re-ingesting a selection whose files
+# changed replaces their chunks in place. Writers of one collection take turns
+# (see building). Entries live in <VECTOR_STORE_DIR>/registry.db next to the
+# Chroma database, and each ready index keeps its chunks as a memory-mapped
+# ChunkStore under <VECTOR_STORE_DIR>/chunks/<name>. Collections used within INDEX_LEASE_SECONDS count as in use
+# and are never evicted; beyond INDEX_MAX_COLLECTIONS the least recently used
+# of the others are dropped.
+INDEX_MAX_COLLECTIONS = int(os.getenv("INDEX_MAX_COLLECTIONS", "50"))
+INDEX_LEASE_SECONDS = float(os.getenv("INDEX_LEASE_SECONDS", "1800"))
+# Same setting as vector_embed.VECTOR_STORE_DIR; vector_embed (LangChain, Chroma)
+# is only imported once a collection is opened, so listing saved indexes on the
+# first page render stays cheap
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store_db")
+
+_registry_lock = threading.Lock()
+_registry = None
+
+
+@dataclass
+class IndexEntry:
+    name: str
+    company: str
+    keyword: str
+    corpus_hash: str = ""
+    urls: List[str] = field(default_factory=list)
+    files: int = 0
+    chunks: int = 0
+    status: str = "building"
+    created_at: float = 0.0
+    last_used: float = 0.0
+
+    @property
+    def label(self):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.created_at))
+        return f"{self.company or '-'} / {self.keyword or '-'}: {self.files} files, {self.chunks} chunks ({when}, {self.name[-6:]})"
+
+
+def _normalize(text):
+    return " ".join(str(text or "").lower().split())
+
+
+def _slug(text, length=24):
+    slug = re.sub(r"[^a-z0-9]+", "-", _normalize(text)).strip("-")
+    return slug[:length].strip("-") or "corpus"
+
+
+# Chroma collection names: 3-63 characters of [a-zA-Z0-9._-], alphanumeric at both ends
+def collection_name(company, keyword, urls):
+    digest = hashlib.sha256()
+    for part in (_normalize(company), _normalize(keyword), *sorted(set(urls))):
+        digest.update(part.encode("utf-8") + b"\0")
+    return f"idx-{_slug(company)}-{digest.hexdigest()[:16]}"
+
+
+def corpus_hash(documents):
+    digest = hashlib.sha256()
+    for sha in sorted(ChunkStore.from_documents(documents).distinct("content_hash")):
+        digest.update(sha.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IndexRegistry:
+
+    def __init__(self, root=VECTOR_STORE_DIR, max_collections=INDEX_MAX_COLLECTIONS,
+                 lease_seconds=INDEX_LEASE_SECONDS):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_collections = max_collections
+        self.lease_seconds = lease_seconds
+        self._lock = threading.RLock()
+        self._build_locks = {}
+        self._db = sqlite3.connect(os.path.join(root, "registry.db"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS collections (
+            name TEXT PRIMARY KEY, company TEXT, keyword TEXT, corpus_hash TEXT, urls TEXT,
+            files INTEGER, chunks INTEGER, status TEXT, created_at REAL, last_used REAL)""")
+        self._db.commit()
+
+    def _entry(self, row):
+        name, company, keyword, corpus, urls, files, chunks, status, created_at, last_used = row
+        return IndexEntry(name=name, company=company, keyword=keyword, corpus_hash=corpus or "",
+                          urls=json.loads(urls or "[]"), files=files or 0, chunks=chunks or 0,
+                          status=status, created_at=created_at or 0.0, last_used=last_used or 0.0)
+
+    def get(self, name):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM collections WHERE name = ?", (name,)).fetchone()
+        return self._entry(row) if row else None
+
+    # Ready indexes, most recently used first, optionally for one company/keyword
+    def list(self, company=None, keyword=None):
+        query, args = "SELECT * FROM collections WHERE status = 'ready'", []
+        if company:
+            query += " AND lower(company) = ?"
+            args.append(_normalize(company))
+        if keyword:
+            query += " AND lower(keyword) = ?"
+            args.append(_normalize(keyword))
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY last_used DESC", args).fetchall()
+        return [self._entry(row) for row in rows]
+
+    # Collection to ingest a selection into; created (and leased) if new
+    def open(self, company, keyword, urls, embedding=None):
+        name = collection_name(company, keyword, urls)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO collections (name, company, keyword, urls, status, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, 'building', ?, ?) ON CONFLICT(name) DO UPDATE SET last_used = excluded.last_used",
+                (name, " ".join(str(company or "").split()), " ".join(str(keyword or "").split()),
+                 json.dumps(sorted(set(urls))), now, now))
+            self._db.commit()
+        self.evict_lru()
+        import vector_embed
+
+        return name, vector_embed.open_vectorstore(name, embedding)
+
+    # Held while a collection is ingested into and registered, so two sessions
+    # building the same selection take turns instead of upserting into one
+    # collection at once. check() is called while waiting and may raise to give up
+    # (e.g. Job.check on cancel).
+    @contextmanager
+    def building(self, name, check=None):
+        with self._lock:
+            lock = self._build_locks.setdefault(name, threading.Lock())
+        while not lock.acquire(timeout=0.5):
+            if check is not None:
+                check()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def _chunks_path(self, name):
+        return os.path.join(self.root, "chunks", name)
+
+    # Where build_chatbot keeps the index's vector index; register() replaces the
+    # chunk directory, so an index never outlives the chunks it was built for
+    def vector_index_path(self, name):
+        return os.path.join(self._chunks_path(name), "vector_index")
+
+    # Record what an ingestion run put into a collection and mark it ready
+    def register(self, name, documents):
+        documents = ChunkStore.from_documents(documents)
+        os.makedirs(os.path.join(self.root, "chunks"), exist_ok=True)
+        documents.save(self._chunks_path(name))
+        sources = set(documents.distinct("content_hash"))
+        with self._lock:
+            self._db.execute(
+                "UPDATE collections SET corpus_hash = ?, files = ?, chunks = ?, status = 'ready', "
+                "created_at = ?, last_used = ? WHERE name = ?",
+                (corpus_hash(documents), len(sources), len(documents), time.time(), time.time(), name))
+            self._db.commit()
+        return self.get(name)
+
+    # Reopen a ready index: its documents (for BM25) and vector store, no embedding calls
+    def load(self, name, embedding=None):
+        entry = self.get(name)
+        if entry is None or entry.status != "ready":
+            raise KeyError(f"No ready index named {name}")
+        import vector_embed
+
+        self.touch(name)
+        vectorstore = vector_embed.open_vectorstore(name, embedding)
+        try:
+            documents = ChunkStore.open(self._chunks_path(name))
+        except (OSError, ValueError):
+            # Indexes registered before chunk stores existed: rebuild it from Chroma once
+            documents = vector_embed.collection_documents(vectorstore._collection)
+            documents.save(self._chunks_path(name))
+        return documents, vectorstore
+
+    def touch(self, name):
+        with self._lock:
+            self._db.execute("UPDATE collections SET last_used = ? WHERE name = ?", (time.time(), name))
+            self._db.commit()
+
+    def evict(self, name):
+        import vector_embed
+
+        try:
+            vector_embed.get_chroma_client().delete_collection(name)
+        except ValueError:
+            pass  # already gone
+        shutil.rmtree(self._chunks_path(name), ignore_errors=True)
+        with self._lock:
+            self._db.execute("DELETE FROM collections WHERE name = ?", (name,))
+            self._db.commit()
+
+    # Drop least recently used collections beyond max_collections, sparing leased ones
+    def evict_lru(self):
+        cutoff = time.time() - self.lease_seconds
+        with self._lock:
+            rows = self._db.execute("SELECT name, last_used FROM collections ORDER BY last_used DESC").fetchall()
+        evicted = []
+        for name, last_used in rows[self.max_collections:]:
+            if (last_used or 0) < cutoff:
+                self.evict(name)
+                evicted.append(name)
+        if evicted:
+            print(f"Evicted {len(evicted)} vector store collections")
+        return evicted
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry()
+        return _registry
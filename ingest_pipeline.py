@@ -0,0 +1,379 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+import doc_cache
+from chunk_store import ChunkStore
+import instrumentation
+import pdf_downloader
+import vector_embed
+from embedding_pipeline import EMBED_CONCURRENCY, embed_texts, get_memo
+
+# Streaming ingestion: download -> parse/split -> embed -> upsert, each stage
+# running in its own thread(s) and handing work to the next through a bounded
+# queue. A PDF is parsed as soon as it lands, its chunks are embedded as soon as
+# they are split and vectors go to Chroma in batches, so the network, the CPU and
+# the embeddings API are busy at the same time. Full queues push back on the
+# stage in front of them, which keeps memory bounded.
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "512"))
+
+STAGES = ("download", "parse", "embed", "upsert")
+_DONE = object()
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+@dataclass
+class FileResult:
+    url: Optional[str]
+    file_path: Optional[str] = None
+    content_hash: Optional[str] = None
+    chunks: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestResult:
+    documents: ChunkStore
+    vectorstore: object
+    files: List[FileResult]
+    stats: List[dict]
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class _ParsedFile:
+    url: Optional[str]
+    file_path: str
+    sha: str
+    chunks: Sequence[Document]  # list or ChunkStore
+    cached: bool = False
+    vectors: Optional[np.ndarray] = None
+
+
+class PipelineStats:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {name: {"files": 0, "chunks": 0, "bytes": 0, "busy_seconds": 0.0, "errors": 0}
+                        for name in STAGES}
+        self._depth = {}
+
+    def watch(self, stage, depth):
+        self._depth[stage] = depth
+
+    def add(self, stage, files=0, chunks=0, bytes=0, seconds=0.0, errors=0):
+        with self._lock:
+            counters = self._stages[stage]
+            counters["files"] += files
+            counters["chunks"] += chunks
+            counters["bytes"] += bytes
+            counters["busy_seconds"] += seconds
+            counters["errors"] += errors
+
+    # One row per stage: work done, throughput over wall-clock time and the
+    # number of items waiting in front of the stage
+    def snapshot(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        rows = []
+        with self._lock:
+            for name in STAGES:
+                counters = self._stages[name]
+                rows.append({
+                    "stage": name,
+                    "files": counters["files"],
+                    "chunks": counters["chunks"],
+                    "MB": round(counters["bytes"] / 1e6, 1),
+                    "files/s": round(counters["files"] / elapsed, 2),
+                    "chunks/s": round(counters["chunks"] / elapsed, 1),
+                    "busy_s": round(counters["busy_seconds"], 1),
+                    "queue": self._depth[name]() if name in self._depth else 0,
+                    "errors": counters["errors"],
+                })
+        return rows
+
+
+# Process-pool entry point: parse + split one file, timed in the worker. With
+# trace set, the worker records its own spans and counters and returns them to
+# be merged into the caller's run. Cache files the worker wrote are returned
+# for the caller to account for.
+def _parse_file(file_path, sha, trace=False):
+    start = time.perf_counter()
+    if not trace:
+        chunks, written = vector_embed._load_file_job(file_path, sha)
+        return chunks, written, time.perf_counter() - start, [], {}
+    with instrumentation.record("parse-worker") as run:
+        chunks, written = vector_embed._load_file_job(file_path, sha)
+    return chunks, written, time.perf_counter() - start, run.spans, run.counters
+
+
+# Download urls into folder_path and index them into vectorstore (the shared
+# persistent store by default), removing files that are no longer selected.
+# Callbacks run on the calling thread, so they may update Streamlit widgets:
+#   on_download_progress(url, bytes_done, total_bytes_or_None)
+#   on_file(file_result)        once per url, when its chunks are indexed or it failed
+#   on_stats(rows)              every stats_interval seconds, see PipelineStats.snapshot
+# Setting cancel (a threading.Event) stops every stage at its next item; once
+# they have wound down IngestCancelled is raised. Files already upserted stay.
+def ingest_urls(urls, folder_path, vectorstore=None, embedding=None, use_cache=True,
+                parse_workers=None, embed_workers=None, on_download_progress=None, on_file=None,
+                on_stats=None, stats_interval=0.5, cancel=None):
+    urls = list(dict.fromkeys(urls))
+    os.makedirs(folder_path, exist_ok=True)
+    vectorstore = vectorstore if vectorstore is not None else vector_embed.open_vectorstore()
+    embedding = embedding or vector_embed.get_embeddings()
+    collection = vectorstore._collection
+    cache = doc_cache.get_cache() if use_cache else None
+    memo = get_memo() if use_cache else None
+    model = vector_embed.embedding_model_name(embedding)
+    vector_key = f"{model}.{vector_embed.chunk_key()}"
+    indexed = vector_embed.indexed_files(collection)
+
+    parse_workers = max(1, parse_workers or vector_embed.LOAD_WORKERS)
+    embed_workers = max(1, embed_workers or EMBED_CONCURRENCY)
+    parse_q = queue.Queue(PIPELINE_QUEUE_SIZE)
+    embed_q = queue.Queue(PIPELINE_QUEUE_SIZE)
+    upsert_q = queue.Queue(PIPELINE_QUEUE_SIZE)
+    events = queue.Queue()
+
+    stats = PipelineStats()
+    downloads_done = [0]
+    stats.watch("download", lambda: len(urls) - downloads_done[0])
+    stats.watch("parse", parse_q.qsize)
+    stats.watch("embed", embed_q.qsize)
+    stats.watch("upsert", upsert_q.qsize)
+
+    lock = threading.Lock()
+    documents = []  # (file_path, chunks) per file
+    seen_hashes = set()
+    failures = []
+    embed_remaining = [embed_workers]
+    run = instrumentation.current_run()
+    cancel = cancel or threading.Event()
+
+    def report(result):
+        events.put(("file", result))
+
+    def download_stage():
+        def on_complete(result):
+            downloads_done[0] += 1
+            stats.add("download", files=1, bytes=result.bytes, seconds=result.seconds,
+                      errors=int(result.error is not None))
+            if result.error is not None:
+                report(FileResult(url=result.url, error=result.error))
+            else:
+                parse_q.put(result)
+
+        try:
+            pdf_downloader.download_pdfs(
+                urls, folder_path, use_cache=use_cache, on_complete=on_complete, cancel=cancel,
+                on_progress=lambda url, done, total: events.put(("progress", url, done, total)))
+        except Exception as e:
+            failures.append(f"download stage: {e}")
+        finally:
+            parse_q.put(_DONE)
+
+    def parse_stage():
+        def emit(parsed):
+            with lock:
+                documents.append((parsed.file_path, parsed.chunks))
+            embed_q.put(parsed)
+
+        def on_parsed(future, url, file_path, sha):
+            try:
+                chunks, written, seconds, spans, counters = future.result()
+            except Exception as e:
+                stats.add("parse", errors=1)
+                report(FileResult(url=url, file_path=file_path, content_hash=sha, error=str(e)))
+                return
+            doc_cache.get_cache().account_files(written)
+            stats.add("parse", files=1, chunks=len(chunks), seconds=seconds)
+            if run is not None:
+                run.merge(spans, counters)
+            if cache is not None:
+                cache.put_chunks(sha, vector_embed.chunk_key(), chunks)
+            emit(_ParsedFile(url=url, file_path=file_path, sha=sha, chunks=chunks))
+
+        try:
+            with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+                while True:
+                    download = parse_q.get()
+                    if download is _DONE:
+                        break
+                    if cancel.is_set():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        continue
+                    file_path = download.path
+                    try:
+                        sha = doc_cache.file_sha256(file_path)
+                        with lock:
+                            duplicate = sha in seen_hashes
+                            seen_hashes.add(sha)
+                        if duplicate:
+                            report(FileResult(url=download.url, file_path=file_path, content_hash=sha, cached=True))
+                            continue
+                        chunks = cache.get_chunks(sha, vector_embed.chunk_key()) if cache is not None else None
+                    except Exception as e:
+                        stats.add("parse", errors=1)
+                        report(FileResult(url=download.url, file_path=file_path, error=str(e)))
+                        continue
+                    if chunks is not None:
+                        for chunk in chunks:
+                            chunk.metadata["source"] = file_path
+                        stats.add("parse", files=1, chunks=len(chunks))
+                        instrumentation.add("parse.cached_files")
+                        emit(_ParsedFile(url=download.url, file_path=file_path, sha=sha, chunks=chunks, cached=True))
+                    else:
+                        future = executor.submit(_parse_file, file_path, sha, run is not None)
+                        future.add_done_callback(
+                            lambda f, url=download.url, path=file_path, sha=sha: on_parsed(f, url, path, sha))
+        except Exception as e:
+            failures.append(f"parse stage: {e}")
+            _drain(parse_q)
+        finally:
+            for _ in range(embed_workers):
+                embed_q.put(_DONE)
+
+    def embed_stage():
+        try:
+            while True:
+                parsed = embed_q.get()
+                if parsed is _DONE:
+                    break
+                if cancel.is_set():
+                    continue
+                if parsed.sha in indexed:
+                    # Already in the collection from an earlier run
+                    report(FileResult(url=parsed.url, file_path=parsed.file_path, content_hash=parsed.sha,
+                                      chunks=len(parsed.chunks), cached=True))
+                    continue
+                start = time.perf_counter()
+                try:
+                    vectors = cache.get_vectors(parsed.sha, vector_key) if cache is not None else None
+                    if vectors is None or len(vectors) != len(parsed.chunks):
+                        vectors = embed_texts([c.page_content for c in parsed.chunks], embedding,
+                                              model=model, memo=memo, max_concurrency=1)
+                        if cache is not None:
+                            cache.put_vectors(parsed.sha, vector_key, vectors)
+                except Exception as e:
+                    stats.add("embed", errors=1)
+                    report(FileResult(url=parsed.url, file_path=parsed.file_path, content_hash=parsed.sha,
+                                      error=f"embedding failed: {e}"))
+                    continue
+                stats.add("embed", files=1, chunks=len(parsed.chunks), seconds=time.perf_counter() - start)
+                parsed.vectors = vectors
+                upsert_q.put(parsed)
+        except Exception as e:
+            failures.append(f"embed stage: {e}")
+            _drain(embed_q, until=1)
+        finally:
+            with lock:
+                embed_remaining[0] -= 1
+                last = embed_remaining[0] == 0
+            if last:
+                upsert_q.put(_DONE)
+
+    def upsert_stage():
+        pending = []
+
+        def flush():
+            start = time.perf_counter()
+            ids, vectors, metadatas, texts = [], [], [], []
+            for parsed in pending:
+                ids.extend(f"{parsed.sha}:{i}" for i in range(len(parsed.chunks)))
+                vectors.extend(np.asarray(parsed.vectors, dtype=np.float32).tolist())
+                metadatas.extend(c.metadata for c in parsed.chunks)
+                texts.extend(c.page_content for c in parsed.chunks)
+            with instrumentation.span("upsert", files=len(pending), chunks=len(ids)):
+                for i in range(0, len(ids), vector_embed.CHROMA_BATCH_SIZE):
+                    batch = slice(i, i + vector_embed.CHROMA_BATCH_SIZE)
+                    collection.upsert(ids=ids[batch], embeddings=vectors[batch],
+                                      metadatas=metadatas[batch], documents=texts[batch])
+            stats.add("upsert", files=len(pending), chunks=len(ids), seconds=time.perf_counter() - start)
+            for parsed in pending:
+                report(FileResult(url=parsed.url, file_path=parsed.file_path, content_hash=parsed.sha,
+                                  chunks=len(parsed.chunks), cached=parsed.cached))
+            pending.clear()
+
+        try:
+            while True:
+                parsed = upsert_q.get()
+                if parsed is _DONE:
+                    break
+                if cancel.is_set():
+                    continue
+                pending.append(parsed)
+                if sum(len(p.chunks) for p in pending) >= UPSERT_BATCH_SIZE:
+                    flush()
+            if pending and not cancel.is_set():
+                flush()
+        except Exception as e:
+            failures.append(f"upsert stage: {e}")
+            _drain(upsert_q)
+
+    # wrap() carries the caller's performance run (if any) into the stage threads
+    threads = [threading.Thread(target=instrumentation.wrap(download_stage), name="ingest-download"),
+               threading.Thread(target=instrumentation.wrap(parse_stage), name="ingest-parse")]
+    threads += [threading.Thread(target=instrumentation.wrap(embed_stage), name=f"ingest-embed-{i}")
+                for i in range(embed_workers)]
+    threads.append(threading.Thread(target=instrumentation.wrap(upsert_stage), name="ingest-upsert"))
+    for thread in threads:
+        thread.start()
+
+    files = []
+    next_stats = 0.0
+    while True:
+        alive = any(thread.is_alive() for thread in threads)
+        try:
+            event = events.get(timeout=stats_interval if alive else 0)
+        except queue.Empty:
+            event = None
+        if event is not None:
+            if event[0] == "progress":
+                if on_download_progress is not None:
+                    on_download_progress(*event[1:])
+            else:
+                files.append(event[1])
+                if event[1].error is not None:
+                    print(f"Ingestion failed for {event[1].url}: {event[1].error}")
+                if on_file is not None:
+                    on_file(event[1])
+        if on_stats is not None and (time.perf_counter() >= next_stats or (event is None and not alive)):
+            on_stats(stats.snapshot())
+            next_stats = time.perf_counter() + stats_interval
+        if event is None and not alive:
+            break
+
+    for thread in threads:
+        thread.join()
+    if cancel.is_set():
+        raise IngestCancelled(f"Ingestion cancelled after {sum(f.error is None for f in files)} of {len(urls)} files")
+    if failures:
+        raise RuntimeError("; ".join(failures))
+
+    removed = vector_embed.remove_files(collection, indexed, keep=seen_hashes)
+    # Chunks of a file are already in page order
+    documents = ChunkStore.from_documents(
+        chunk for _, chunks in sorted(documents, key=lambda item: item[0]) for chunk in chunks)
+    print(f"Ingested {len(urls)} urls: {len(documents)} chunks, {len(removed)} stale chunks removed")
+    return IngestResult(documents=documents, vectorstore=vectorstore, files=files, stats=stats.snapshot())
+
+
+# After a stage failure, keep consuming its input so upstream stages never block
+def _drain(q, until=1):
+    seen = 0
+    while seen < until:
+        if q.get() is _DONE:
+            seen += 1
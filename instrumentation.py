@@ -0,0 +1,270 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import secrets
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+# Lightweight tracing for one user action ("run": a search, an ingestion, a
+# question, an Excel batch). Code wraps its stages in span(name) and bumps
+# counters with add(name, value); both are no-ops unless a run is being
+# recorded, so library code can be instrumented unconditionally.
+#
+# The active run and parent span live in context variables. Thread pools do not
+# carry those over, so work submitted to one is wrapped with wrap(fn); process
+# pool workers record into their own run and hand its spans back (merge).
+#
+# A finished run summarises per stage (count, total, mean, max), exports as plain
+# JSON or as OpenTelemetry OTLP/JSON spans, and can optionally be profiled with
+# cProfile (calling thread only). PERF_EXPORT_DIR, when set, receives one OTLP
+# JSON file per run.
+PERF_EXPORT_DIR = os.getenv("PERF_EXPORT_DIR")
+PERF_PROFILE_TOP = int(os.getenv("PERF_PROFILE_TOP", "30"))
+SERVICE_NAME = "social-equality-funds"
+
+_run = contextvars.ContextVar("perf_run", default=None)
+_parent = contextvars.ContextVar("perf_parent", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float  # epoch seconds
+    end: Optional[float] = None
+    attributes: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def seconds(self):
+        return (self.end or time.time()) - self.start
+
+
+class Run:
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.trace_id = secrets.token_hex(16)
+        self.counters = {}
+        self.spans: List[Span] = []
+        self.profile = None
+        self._lock = threading.Lock()
+        self.root = Span(name, secrets.token_hex(8), None, time.time(), attributes=dict(attributes))
+
+    # ---- recording ---------------------------------------------------------
+
+    def start_span(self, name, parent_id, attributes):
+        span = Span(name, secrets.token_hex(8), parent_id or self.root.span_id, time.time(), attributes=attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Spans (and counters) recorded elsewhere, e.g. by a process-pool worker
+    def merge(self, spans, counters=None, parent_id=None):
+        ids = {span.span_id for span in spans}
+        with self._lock:
+            for span in spans:
+                if span.parent_id not in ids:
+                    span.parent_id = parent_id or self.root.span_id
+                self.spans.append(span)
+            for name, value in (counters or {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    # ---- reporting ---------------------------------------------------------
+
+    @property
+    def seconds(self):
+        return self.root.seconds
+
+    # One row per span name, slowest stage first
+    def summary(self):
+        stages = {}
+        for span in list(self.spans):
+            row = stages.setdefault(span.name, {"stage": span.name, "count": 0, "total_s": 0.0,
+                                                "max_s": 0.0, "errors": 0})
+            row["count"] += 1
+            row["total_s"] += span.seconds
+            row["max_s"] = max(row["max_s"], span.seconds)
+            row["errors"] += span.error is not None
+        rows = sorted(stages.values(), key=lambda row: -row["total_s"])
+        for row in rows:
+            row["mean_s"] = round(row["total_s"] / row["count"], 4)
+            row["total_s"] = round(row["total_s"], 3)
+            row["max_s"] = round(row["max_s"], 3)
+        return rows
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "seconds": round(self.seconds, 4),
+            "attributes": self.root.attributes,
+            "counters": dict(self.counters),
+            "summary": self.summary(),
+            "spans": [asdict(span) for span in [self.root] + list(self.spans)],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, default=str)
+
+    # OTLP/JSON (the OpenTelemetry collector's JSON encoding of ExportTraceServiceRequest)
+    def to_otel(self):
+        spans = []
+        for span in [self.root] + list(self.spans):
+            record = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int((span.end or time.time()) * 1e9)),
+                "attributes": _otel_attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                record["parentSpanId"] = span.parent_id
+            spans.append(record)
+        # Counters ride along as attributes of the root span
+        spans[0]["attributes"] += _otel_attributes({f"counter.{name}": value for name, value in self.counters.items()})
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otel_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+        }]}
+
+    def profile_report(self, top=PERF_PROFILE_TOP):
+        if self.profile is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
+
+    # Raw pstats dump (loadable with pstats / snakeviz)
+    def profile_bytes(self):
+        if self.profile is None:
+            return None
+        with tempfile.NamedTemporaryFile(suffix=".prof", delete=False) as file:
+            path = file.name
+        try:
+            self.profile.dump_stats(path)
+            with open(path, "rb") as file:
+                return file.read()
+        finally:
+            os.remove(path)
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otel_attributes(attributes):
+    return [{"key": key, "value": _otel_value(value)} for key, value in attributes.items() if value is not None]
+
+
+# ---- module API ------------------------------------------------------------
+
+def current_run():
+    return _run.get()
+
+
+# Record everything done inside the block as one run; profile=True also runs
+# cProfile over the calling thread for the duration
+@contextlib.contextmanager
+def record(name, profile=False, **attributes):
+    run = Run(name, **attributes)
+    run_token, parent_token = _run.set(run), _parent.set(run.root)
+    if profile:
+        run.profile = cProfile.Profile()
+        run.profile.enable()
+    try:
+        yield run
+    except BaseException as e:
+        run.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if run.profile is not None:
+            run.profile.disable()
+        run.root.end = time.time()
+        _parent.reset(parent_token)
+        _run.reset(run_token)
+        if PERF_EXPORT_DIR:
+            export(run, os.path.join(PERF_EXPORT_DIR, f"{run.name}-{run.trace_id}.json"), fmt="otel")
+
+
+# Time a block as a child of the current span; yields the span (or None when no
+# run is being recorded) so callers can attach attributes found along the way
+@contextlib.contextmanager
+def span(name, **attributes):
+    run = _run.get()
+    if run is None:
+        yield None
+        return
+    parent = _parent.get()
+    current = run.start_span(name, parent.span_id if parent else None, attributes)
+    token = _parent.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.time()
+        _parent.reset(token)
+
+
+# A span for work that was timed elsewhere (e.g. in a worker process)
+def record_span(name, seconds, **attributes):
+    run = _run.get()
+    if run is None:
+        return None
+    parent = _parent.get()
+    current = run.start_span(name, parent.span_id if parent else None, attributes)
+    current.end = time.time()
+    current.start = current.end - seconds
+    return current
+
+
+def add(name, value=1):
+    run = _run.get()
+    if run is not None:
+        run.add(name, value)
+
+
+# Carry the current run and span into a function that will run on another thread
+def wrap(fn):
+    run, parent = _run.get(), _parent.get()
+    if run is None:
+        return fn
+
+    def wrapped(*args, **kwargs):
+        run_token, parent_token = _run.set(run), _parent.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _parent.reset(parent_token)
+            _run.reset(run_token)
+    return wrapped
+
+
+def export(run, path, fmt="json"):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(run.to_otel() if fmt == "otel" else run.to_dict(), file, default=str)
+    return path
@@ -0,0 +1,200 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import doc_cache
+import instrumentation
+
+# Background jobs for long work (ingesting PDFs, answering a question sheet),
+# so it keeps running whatever happens to the Streamlit script that started it:
+# a widget interaction reruns the script, but the job lives in the server
+# process and the page re-attaches to it by job id and polls its progress.
+#
+# Jobs run on a small thread pool in the Streamlit server process (they share
+# the Chroma client, caches and built chatbots, which a worker process could not)
+# and record an instrumentation run each. Status, progress and messages are also
+# written to <DOC_CACHE_DIR>/jobs.db, so every session can list the jobs of the
+# server; jobs that were still queued or running when the server stopped are
+# marked "interrupted" on the next start. Results stay in memory.
+#
+# Cancellation is cooperative: the job function calls job.check() where it is
+# safe to stop, or hands job.cancel_event to code that watches one (ingest_urls).
+# A job that fails after cancel was requested counts as cancelled.
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(doc_cache.DOC_CACHE_DIR, "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_PERSIST_SECONDS = 1.0  # progress is written to SQLite at most this often per job
+JOBS_KEPT = int(os.getenv("JOBS_KEPT", "20"))  # finished jobs whose results stay in memory
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED = (
+    "queued", "running", "done", "failed", "cancelled", "interrupted")
+FINISHED = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+_manager_lock = threading.Lock()
+_manager = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    label: str = ""
+    status: str = QUEUED
+    progress: Optional[float] = None  # 0..1, None when unknown
+    message: str = ""
+    error: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Anything the job wants the page to show while it runs (e.g. stage stats)
+    details: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    perf_run: Any = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _manager: Any = field(default=None, repr=False)
+    _persisted_at: float = field(default=0.0, repr=False)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def cancel_event(self):
+        return self._cancel
+
+    @property
+    def seconds(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def update(self, progress=None, message=None, **details):
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+        self.details.update(details)
+        if self._manager is not None and time.time() - self._persisted_at >= JOB_PERSIST_SECONDS:
+            self._manager._persist(self)
+
+
+class JobManager:
+
+    def __init__(self, path=JOBS_DB_PATH, max_workers=JOB_WORKERS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, label TEXT, status TEXT NOT NULL,
+            progress REAL, message TEXT, error TEXT,
+            created_at REAL NOT NULL, started_at REAL, finished_at REAL)""")
+        # Whatever was unfinished belonged to a server process that is gone
+        self._db.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE status IN (?, ?)",
+                         (INTERRUPTED, time.time(), QUEUED, RUNNING))
+        self._db.commit()
+
+    def _persist(self, job):
+        job._persisted_at = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, label, status, progress, message, error, created_at, "
+                "started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.label, job.status, job.progress, job.message, job.error,
+                 job.created_at, job.started_at, job.finished_at))
+            self._db.commit()
+
+    # Run fn(job, *args, **kwargs) in the background; returns the job id at once.
+    # profile=True also profiles the job's thread with cProfile.
+    def submit(self, kind, fn, *args, label="", profile=False, **kwargs):
+        job = Job(id=f"{kind}-{secrets.token_hex(6)}", kind=kind, label=label, created_at=time.time(),
+                  _manager=self)
+        self.prune(JOBS_KEPT)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._persist(job)
+        self._executor.submit(self._run, job, fn, args, kwargs, profile)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs, profile):
+        if job.cancel_requested:
+            job.status, job.finished_at = CANCELLED, time.time()
+            self._persist(job)
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        self._persist(job)
+        try:
+            with instrumentation.record(job.kind, profile=profile, job=job.id, label=job.label) as run:
+                job.perf_run = run
+                job.result = fn(job, *args, **kwargs)
+            job.status, job.progress = DONE, 1.0
+        except Exception as e:
+            if job.cancel_requested:
+                job.status, job.message = CANCELLED, str(e)
+            else:
+                job.status, job.error = FAILED, str(e)
+                print(f"Job {job.id} failed: {e}\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
+            self._persist(job)
+
+    # The live job of this server process, or its last persisted state
+    # (result and details are only available for jobs of this process)
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+            row = self._db.execute(
+                "SELECT id, kind, label, status, progress, message, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(*row) if row is not None else None
+
+    def list(self, kind=None, limit=20):
+        query = "SELECT id FROM jobs" + (" WHERE kind = ?" if kind else "") + " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(query, ((kind,) if kind else ()) + (limit,))]
+        return [self.get(job_id) for job_id in ids]
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        job.message = "Cancelling..."
+        return True
+
+    # Forget finished in-memory jobs (and their results) beyond the newest keep
+    def prune(self, keep=JOBS_KEPT):
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.created_at)
+            for job in finished[:-keep] if keep else finished:
+                del self._jobs[job.id]
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+from bs4 import BeautifulSoup
+
+import instrumentation
+import pdf_downloader
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup's html.parser is the fallback
+    lxml = None
+
+# Concurrent discovery of PDF links on the pages the user selected. Pages are
+# fetched through the pooled download session with a global and a per-host
+# concurrency limit, same-site sub-pages can be followed up to CRAWL_DEPTH levels
+# (investor-relations pages often link to a "reports" sub-page), and PDF links
+# are deduplicated after URL normalization. Only sub-pages whose URL mentions one
+# of CRAWL_KEYWORDS are followed, best matches first, at most CRAWL_MAX_PAGES
+# pages per selected site.
+CRAWL_DEPTH = int(os.getenv("CRAWL_DEPTH", "0"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "2"))
+CRAWL_TIMEOUT_SECONDS = float(os.getenv("CRAWL_TIMEOUT_SECONDS", "15"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+MAX_HTML_BYTES = 5 * 1024 * 1024
+CRAWL_KEYWORDS = ("report", "investor", "sustainab", "esg", "annual", "financial", "governance",
+                  "impact", "responsib", "disclosure", "publication", "download", "document", "proxy")
+
+PARSER = "lxml" if lxml is not None else "html.parser"
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+@dataclass
+class DiscoveryResult:
+    pdf_links: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    pages_fetched: int = 0
+    seconds: float = 0.0
+
+
+# Canonical form used to deduplicate links: lower-case scheme and host, no
+# default port, no fragment, no tracking parameters, "." / ".." resolved
+def normalize_url(url):
+    parts = urlparse(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = urljoin("/", parts.path) if parts.path else "/"
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                       if not k.lower().startswith(_TRACKING_PARAMS)])
+    return urlunparse((scheme, host, path, parts.params, query, ""))
+
+
+def is_pdf_url(url):
+    return urlparse(url).path.lower().endswith(".pdf")
+
+
+# All <a href> targets of a page, resolved against base_url
+def extract_links(html, base_url):
+    if lxml is not None:
+        try:
+            document = lxml.html.fromstring(html)
+            return [urljoin(base_url, href.strip()) for href in document.xpath("//a/@href")]
+        except (ValueError, lxml.etree.ParserError):
+            return []
+    soup = BeautifulSoup(html, PARSER)
+    return [urljoin(base_url, link["href"].strip()) for link in soup.find_all("a", href=True)]
+
+
+def extract_pdf_links(html, base_url):
+    return [link for link in extract_links(html, base_url) if is_pdf_url(link)]
+
+
+def link_score(url):
+    path = urlparse(url).path.lower()
+    return sum(keyword in path for keyword in CRAWL_KEYWORDS)
+
+
+def _fetch(url, timeout):
+    session = pdf_downloader.get_session()
+    with session.get(url, stream=True, timeout=(pdf_downloader.CONNECT_TIMEOUT_SECONDS, timeout)) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").lower()
+        if "pdf" in content_type or "html" not in content_type:
+            # Never pull binary bodies here; a PDF served without a .pdf path is still reported
+            return response.url, content_type, None
+        body = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            body += chunk
+            if len(body) > MAX_HTML_BYTES:
+                break
+        return response.url, content_type, bytes(body)
+
+
+async def discover_pdfs_async(urls, depth=CRAWL_DEPTH, max_concurrency=CRAWL_CONCURRENCY,
+                              per_host=CRAWL_PER_HOST, timeout=CRAWL_TIMEOUT_SECONDS,
+                              max_pages=CRAWL_MAX_PAGES):
+    start = time.perf_counter()
+    result = DiscoveryResult()
+    found = {}
+    visited = set()
+    site_pages = {}
+    global_limit = asyncio.Semaphore(max_concurrency)
+    host_limits = {}
+
+    def add_pdf(url):
+        found.setdefault(normalize_url(url), url)
+
+    async def visit(url, level, site):
+        key = normalize_url(url)
+        if key in visited or site_pages.get(site, 0) >= max_pages:
+            return
+        visited.add(key)
+        site_pages[site] = site_pages.get(site, 0) + 1
+        host = urlparse(url).netloc.lower()
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        with instrumentation.span("scrape.page", url=url, level=level) as span:
+            try:
+                async with global_limit, host_limit:
+                    final_url, content_type, body = await asyncio.wait_for(
+                        asyncio.to_thread(_fetch, url, timeout), timeout + pdf_downloader.CONNECT_TIMEOUT_SECONDS)
+            except Exception as e:
+                # Broken sub-pages are common and not worth reporting; selected pages are
+                if level == 0:
+                    result.errors[url] = str(e) or type(e).__name__
+                if span is not None:
+                    span.error = str(e) or type(e).__name__
+                return
+            result.pages_fetched += 1
+            if body is None:
+                if "pdf" in content_type:
+                    add_pdf(final_url)
+                return
+
+            instrumentation.add("scrape.bytes", len(body))
+            links = await asyncio.to_thread(extract_links, body, final_url)
+        follow = {}
+        for link in links:
+            if is_pdf_url(link):
+                add_pdf(link)
+            elif level < depth and urlparse(link).netloc.lower() == site and urlparse(link).scheme in ("http", "https"):
+                score = link_score(link)
+                if score:
+                    follow.setdefault(normalize_url(link), (score, link))
+        ranked = sorted(follow.values(), key=lambda item: -item[0])
+        await asyncio.gather(*(visit(link, level + 1, site) for _, link in ranked))
+
+    tasks = []
+    for url in urls:
+        if is_pdf_url(url):
+            add_pdf(url)
+        else:
+            tasks.append(visit(url, 0, urlparse(url).netloc.lower()))
+    await asyncio.gather(*tasks)
+
+    result.pdf_links = list(found.values())
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+# Synchronous entry point for the Streamlit script
+def discover_pdfs(urls, **kwargs):
+    with instrumentation.span("scrape", urls=len(urls)) as span:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            result = asyncio.run(discover_pdfs_async(urls, **kwargs))
+        else:
+            # Already inside an event loop: run the crawl on a helper thread's own loop
+            outcome = {}
+            thread = threading.Thread(target=instrumentation.wrap(
+                lambda: outcome.update(result=asyncio.run(discover_pdfs_async(urls, **kwargs)))))
+            thread.start()
+            thread.join()
+            result = outcome["result"]
+        if span is not None:
+            span.attributes.update(pages=result.pages_fetched, pdf_links=len(result.pdf_links))
+        return result
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import doc_cache
+import instrumentation
+
+# Download limits, overridable from the environment
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+PDF_MAX_BYTES = int(float(os.getenv("PDF_MAX_MB", "200")) * 1024 * 1024)
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "120"))
+CONNECT_TIMEOUT_SECONDS = 10
+CHUNK_SIZE = 256 * 1024
+
+_session_lock = threading.Lock()
+_session = None
+
+
+class DownloadError(Exception):
+    pass
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: Optional[str] = None
+    bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+# Shared requests session with a connection pool sized for the worker count,
+# so parallel downloads from the same host reuse TCP/TLS connections.
+def get_session(pool_size=None):
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = pool_size or max(DOWNLOAD_WORKERS, 10)
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=["GET", "HEAD"])
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = os.getenv("USER_AGENT", "Mozilla/5.0 (compatible; SocialEqualityFunds)")
+            _session = session
+        return _session
+
+
+def display_name(url):
+    return os.path.basename(urlparse(url).path) or "download.pdf"
+
+
+# Local file name for url: prefixed with a hash of the url, so reports that share
+# a name (".../2023/report.pdf", ".../2024/report.pdf") never overwrite each other
+def file_name_for(url):
+    return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:12]}-{display_name(url)}"
+
+
+# Stream one PDF to folder_path in CHUNK_SIZE pieces. The body goes to a temporary
+# ".part" file that is renamed into place only once complete, so an aborted or
+# oversized download never leaves a truncated PDF behind.
+# With a document cache, a url fetched before is revalidated with its ETag /
+# Last-Modified and served from the cache on 304, and new bodies are stored there.
+# on_progress(url, bytes_done, total_bytes_or_None) is called after every chunk.
+def download_pdf(url, folder_path, session=None, max_bytes=PDF_MAX_BYTES,
+                 timeout=PDF_TIMEOUT_SECONDS, on_progress=None, use_cache=True):
+    with instrumentation.span("download", url=url) as span:
+        session = session or get_session()
+        cache = doc_cache.get_cache() if use_cache else None
+        file_path = os.path.join(folder_path, file_name_for(url))
+        deadline = time.monotonic() + timeout
+
+        cached = cache.lookup_url(url) if cache is not None else None
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        with session.get(url, stream=True, headers=headers,
+                         timeout=(CONNECT_TIMEOUT_SECONDS, timeout)) as response:
+            if cached is not None and response.status_code == 304:
+                cache.materialize(cached["sha256"], file_path)
+                if span is not None:
+                    span.attributes["not_modified"] = True
+                if on_progress is not None:
+                    size = os.path.getsize(file_path)
+                    on_progress(url, size, size)
+                return file_path
+
+            response.raise_for_status()
+            total = response.headers.get("Content-Length")
+            total = int(total) if total and total.isdigit() else None
+            if total is not None and total > max_bytes:
+                raise DownloadError(f"{url} is {total} bytes, over the {max_bytes} byte limit")
+
+            fd, part_path = tempfile.mkstemp(suffix=".part", dir=folder_path)
+            digest = hashlib.sha256()
+            done = 0
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if not chunk:
+                            continue
+                        done += len(chunk)
+                        if done > max_bytes:
+                            raise DownloadError(f"{url} exceeded the {max_bytes} byte limit")
+                        if time.monotonic() > deadline:
+                            raise DownloadError(f"{url} did not finish within {timeout:.0f}s")
+                        file.write(chunk)
+                        digest.update(chunk)
+                        if on_progress is not None:
+                            on_progress(url, done, total)
+                os.replace(part_path, file_path)
+            except BaseException:
+                os.remove(part_path)
+                raise
+
+            instrumentation.add("download.bytes", done)
+            if span is not None:
+                span.attributes["bytes"] = done
+            if cache is not None:
+                sha = cache.put_blob(file_path, digest.hexdigest())
+                cache.put_url(url, sha, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        return file_path
+
+
+# Download urls into folder_path with up to max_workers transfers in flight.
+# Returns one DownloadResult per url, in input order; failures are recorded per
+# file rather than raised. Progress callbacks are delivered on the calling thread:
+#   on_progress(url, bytes_done, total_bytes_or_None)
+#   on_complete(result)
+# Setting the cancel event (a threading.Event) aborts transfers in flight and
+# fails the ones not started yet with a "cancelled" error.
+def download_pdfs(urls, folder_path, max_workers=None, max_bytes=PDF_MAX_BYTES,
+                  timeout=PDF_TIMEOUT_SECONDS, on_progress=None, on_complete=None, use_cache=True, cancel=None):
+    urls = list(urls)
+    results = [DownloadResult(url=url) for url in urls]
+    if not urls:
+        return results
+
+    os.makedirs(folder_path, exist_ok=True)
+    max_workers = max(1, min(max_workers or DOWNLOAD_WORKERS, len(urls)))
+    session = get_session()
+    events = queue.Queue()
+
+    def progress(url, done, total):
+        if cancel is not None and cancel.is_set():
+            raise DownloadError("cancelled")
+        events.put(("progress", url, done, total))
+
+    def worker(index):
+        result = results[index]
+        start = time.perf_counter()
+        try:
+            if cancel is not None and cancel.is_set():
+                raise DownloadError("cancelled")
+            result.path = download_pdf(
+                result.url, folder_path, session=session, max_bytes=max_bytes, timeout=timeout,
+                use_cache=use_cache, on_progress=progress,
+            )
+            result.bytes = os.path.getsize(result.path)
+        except Exception as e:
+            result.error = str(e)
+        result.seconds = time.perf_counter() - start
+        events.put(("complete", result))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index in range(len(urls)):
+            executor.submit(instrumentation.wrap(worker), index)
+
+        completed = 0
+        while completed < len(urls):
+            event = events.get()
+            if event[0] == "progress":
+                if on_progress is not None:
+                    on_progress(*event[1:])
+            else:
+                completed += 1
+                if on_complete is not None:
+                    on_complete(event[1])
+
+    return results
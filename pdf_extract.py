@@ -0,0 +1,180 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.util import find_spec
+
+import doc_cache
+import instrumentation
+
+# Page-at-a-time PDF text extraction. Pages are read, cached and split one at a
+# time, so the extractor never holds more than the current page's text (the old
+# PyPDFLoader.load() built the whole report in memory first). Extracted pages are
+# cached per file hash and extractor, so re-chunking a known file skips PDF
+# parsing entirely.
+#
+# Pages with fewer than OCR_MIN_CHARS characters of text are usually scans. When
+# a local OCR engine is available (pytesseract + the tesseract binary + PyMuPDF
+# to render pages) they go to a separate OCR worker queue while extraction
+# carries on, and their text is added after the text pages; otherwise they are
+# skipped instead of wasting embedding calls on empty chunks.
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "auto")  # auto | pymupdf | pypdf
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "20"))
+PDF_OCR = os.getenv("PDF_OCR", "auto")  # auto = when available, 0 = off
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "1"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+
+
+def _pypdf_pages(path):
+    from pypdf import PdfReader
+
+    # An open file keeps pypdf reading objects on demand instead of loading the whole file
+    with open(path, "rb") as file:
+        reader = PdfReader(file)
+        for number, page in enumerate(reader.pages):
+            yield number, page.extract_text() or ""
+
+
+def _pymupdf_pages(path):
+    import fitz
+
+    with fitz.open(path) as pdf:
+        for number, page in enumerate(pdf):
+            yield number, page.get_text()
+
+
+# Fastest first; "auto" picks the first one that is installed
+EXTRACTORS = {
+    "pymupdf": ("fitz", _pymupdf_pages),
+    "pypdf": ("pypdf", _pypdf_pages),
+}
+
+
+def available_extractors():
+    return [name for name, (module, _) in EXTRACTORS.items() if find_spec(module) is not None]
+
+
+def default_extractor():
+    if PDF_EXTRACTOR != "auto":
+        return PDF_EXTRACTOR
+    return available_extractors()[0]
+
+
+def ocr_available():
+    if PDF_OCR == "0":
+        return False
+    return (find_spec("pytesseract") is not None and find_spec("fitz") is not None
+            and shutil.which("tesseract") is not None)
+
+
+def ocr_page(path, number):
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(path) as pdf:
+        pixmap = pdf[number].get_pixmap(dpi=OCR_DPI)
+    image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image)
+
+
+# One OCR queue per process; tesseract runs as a subprocess, so threads are enough
+@lru_cache(maxsize=None)
+def get_ocr_queue():
+    return ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix="ocr")
+
+
+@dataclass
+class ExtractStats:
+    extractor: str
+    pages: int = 0
+    cached_pages: int = 0
+    ocr_pages: int = 0
+    empty_pages: int = 0
+    seconds: float = 0.0
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.seconds if self.seconds else 0.0
+
+
+def _extract(path, extractor, stats, use_ocr):
+    pending = []
+    for number, text in EXTRACTORS[extractor][1](path):
+        if use_ocr and len(text.strip()) < OCR_MIN_CHARS:
+            pending.append((number, get_ocr_queue().submit(ocr_page, path, number)))
+            continue
+        yield {"page": number, "text": text, "ocr": False}
+
+    for number, future in pending:
+        try:
+            text = future.result()
+        except Exception as e:
+            print(f"OCR failed for {path} page {number + 1}: {e}")
+            text = ""
+        stats.ocr_pages += 1
+        yield {"page": number, "text": text, "ocr": True}
+
+
+# Generator over {"page", "text", "ocr"} dicts for the PDF at path, from the
+# page cache when sha is given and the file was extracted before
+def iter_pages(path, sha=None, extractor=None, use_cache=True, use_ocr=None, stats=None):
+    extractor = extractor or default_extractor()
+    stats = stats if stats is not None else ExtractStats(extractor)
+    use_ocr = ocr_available() if use_ocr is None else use_ocr
+    cache = doc_cache.get_cache() if use_cache and sha else None
+
+    start = time.perf_counter()
+    pages = cache.iter_pages(sha, extractor) if cache is not None else None
+    cached = pages is not None
+    if not cached:
+        pages = _extract(path, extractor, stats, use_ocr)
+        if cache is not None:
+            pages = cache.put_pages(sha, extractor, pages)
+    try:
+        for page in pages:
+            stats.pages += 1
+            stats.cached_pages += cached
+            yield page
+    finally:
+        stats.seconds += time.perf_counter() - start
+
+
+# Generator over the chunks of a PDF, split page by page as the pages are
+# extracted, so a caller that consumes them lazily never holds more than one
+# page of Documents. Chunks carry the same metadata PyPDFLoader produced
+# ({"source", "page"}), plus "ocr": True for scanned pages. Stats are recorded
+# once the generator is exhausted or closed.
+def load_pdf(path, splitter, sha=None, extractor=None, use_cache=True, use_ocr=None):
+    from langchain_core.documents import Document
+
+    stats = ExtractStats(extractor or default_extractor())
+    chunk_count = 0
+    split_seconds = 0.0
+    try:
+        for page in iter_pages(path, sha, stats.extractor, use_cache, use_ocr, stats):
+            if len(page["text"].strip()) < OCR_MIN_CHARS:
+                stats.empty_pages += 1
+                continue
+            metadata = {"source": path, "page": page["page"]}
+            if page["ocr"]:
+                metadata["ocr"] = True
+            start = time.perf_counter()
+            chunks = splitter.split_documents([Document(page_content=page["text"], metadata=metadata)])
+            split_seconds += time.perf_counter() - start
+            chunk_count += len(chunks)
+            yield from chunks
+    finally:
+        # Extraction and splitting interleave page by page; stats.seconds covers both
+        instrumentation.record_span("parse", stats.seconds - split_seconds, file=os.path.basename(path),
+                                    extractor=stats.extractor, pages=stats.pages, cached_pages=stats.cached_pages,
+                                    ocr_pages=stats.ocr_pages)
+        instrumentation.record_span("split", split_seconds, file=os.path.basename(path), chunks=chunk_count)
+        instrumentation.add("parse.pages", stats.pages)
+        instrumentation.add("split.chunks", chunk_count)
+
+        print(f"Extracted and split {stats.pages} pages from {os.path.basename(path)} with {stats.extractor} "
+              f"in {stats.seconds:.2f}s ({stats.pages_per_second:.0f} pages/s, {stats.cached_pages} cached, "
+              f"{stats.ocr_pages} OCR, {stats.empty_pages} empty skipped)")
@@ -0,0 +1,288 @@
+import csv
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import doc_cache
+
+# Question sheets (the Excel batch): an uploaded .xlsx or .csv with a QUESTIONS
+# column is read row by row (openpyxl in read-only mode, or the csv module) and
+# answered SHEET_BATCH_ROWS rows at a time. Every finished batch, and every
+# answer finished before a run was cancelled, is checkpointed in SQLite under
+# the sheet's content hash and the corpus fingerprint, so a run
+# that stops at row 900 of 1000 picks up at row 900 when the same file is
+# uploaded again, and the result file is written from the checkpoint straight to
+# disk instead of being built in memory.
+SHEETS_DIR = os.getenv("SHEETS_DIR", os.path.join(doc_cache.DOC_CACHE_DIR, "sheets"))
+SHEET_CHECKPOINT_PATH = os.getenv("SHEET_CHECKPOINT_PATH", os.path.join(doc_cache.DOC_CACHE_DIR, "sheets.db"))
+SHEET_CHECKPOINT_TTL_SECONDS = float(os.getenv("SHEET_CHECKPOINT_TTL_HOURS", "168")) * 3600
+SHEET_BATCH_ROWS = int(os.getenv("SHEET_BATCH_ROWS", "50"))
+
+QUESTION_COLUMN = "QUESTIONS"
+RESPONSE_COLUMN = "RESPONSES"
+SHEET_TYPES = ("xlsx", "csv")
+
+_checkpoint_lock = threading.Lock()
+_checkpoint = None
+
+
+def sheet_type(file_name):
+    ext = file_name.rsplit(".", 1)[-1].lower()
+    if ext not in SHEET_TYPES:
+        raise ValueError(f"Unsupported question sheet type: .{ext}")
+    return ext
+
+
+# SHA-256 of a file-like object, read in blocks; the position is restored
+def hash_file(file, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    position = file.tell()
+    file.seek(0)
+    for block in iter(lambda: file.read(chunk_size), b""):
+        digest.update(block)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def _question_index(header):
+    names = [str(name).strip() if name is not None else "" for name in header or ()]
+    if QUESTION_COLUMN not in names:
+        raise ValueError(f"The file must contain a '{QUESTION_COLUMN}' column.")
+    return names.index(QUESTION_COLUMN)
+
+
+def _xlsx_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()  # leave the caller's file open
+
+
+# Generator over (row number, question) for every data row, first data row = 0.
+# Empty cells come through as None so result rows stay aligned with the input.
+def iter_questions(file, kind):
+    rows = _xlsx_rows(file) if kind == "xlsx" else _csv_rows(file)
+    index = _question_index(next(rows, None))
+    for number, row in enumerate(rows):
+        value = row[index] if index < len(row) else None
+        if value is not None:
+            value = str(value).strip() or None
+        yield number, value
+
+
+# Copy an upload to SHEETS_DIR so a background run does not depend on the
+# session that received it; the same file is only stored once
+def save_upload(file, sheet, kind):
+    path = os.path.join(SHEETS_DIR, "uploads", f"{sheet}.{kind}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        position = file.tell()
+        file.seek(0)
+        with open(tmp_path, "wb") as out:
+            shutil.copyfileobj(file, out)
+        file.seek(position)
+        os.replace(tmp_path, path)
+    return path
+
+
+# Number of data rows when the file says so up front (xlsx dimensions), else None
+def count_rows(file, kind):
+    if kind != "xlsx":
+        return None
+    from openpyxl import load_workbook
+
+    position = file.tell()
+    workbook = load_workbook(file, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+        file.seek(position)
+    return max_row - 1 if max_row else None
+
+
+class SheetCheckpoint:
+
+    def __init__(self, path=SHEET_CHECKPOINT_PATH, ttl=SHEET_CHECKPOINT_TTL_SECONDS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS rows (
+            sheet TEXT NOT NULL, corpus TEXT NOT NULL, row INTEGER NOT NULL,
+            question TEXT, answer TEXT, error TEXT, updated_at REAL NOT NULL,
+            PRIMARY KEY (sheet, corpus, row))""")
+        self._db.execute("DELETE FROM rows WHERE updated_at < ?", (time.time() - self.ttl,))
+        self._db.commit()
+
+    # Rows answered without error (failed rows are retried on the next run)
+    def done_rows(self, sheet, corpus):
+        with self._lock:
+            rows = self._db.execute("SELECT row FROM rows WHERE sheet = ? AND corpus = ? AND error IS NULL",
+                                    (sheet, corpus)).fetchall()
+        return {row for row, in rows}
+
+    # results: (row, question, answer, error) tuples, committed together
+    def put_many(self, sheet, corpus, results):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (sheet, corpus, row, question, answer, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(sheet, corpus, row, question, answer, error, now) for row, question, answer, error in results])
+            self._db.commit()
+
+    # Generator over (row, question, answer, error) in row order
+    def iter_results(self, sheet, corpus, batch_size=1000):
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT row, question, answer, error FROM rows WHERE sheet = ? AND corpus = ? AND row > ? "
+                    "ORDER BY row LIMIT ?", (sheet, corpus, last, batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def clear(self, sheet, corpus):
+        with self._lock:
+            self._db.execute("DELETE FROM rows WHERE sheet = ? AND corpus = ?", (sheet, corpus))
+            self._db.commit()
+
+
+def get_checkpoint():
+    global _checkpoint
+    with _checkpoint_lock:
+        if _checkpoint is None:
+            _checkpoint = SheetCheckpoint()
+        return _checkpoint
+
+
+def _response(answer, error):
+    return answer if error is None else f"Error: {error}"
+
+
+# Write the checkpointed results of a sheet to path (xlsx or csv), one row at a
+# time; xlsxwriter's constant_memory mode flushes each row to disk as it goes
+def write_results(checkpoint, sheet, corpus, path, kind):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if kind == "xlsx":
+            import xlsxwriter
+
+            workbook = xlsxwriter.Workbook(tmp_path, {"constant_memory": True})
+            worksheet = workbook.add_worksheet("Chatbot Responses")
+            wrap_format = workbook.add_format({"text_wrap": True})
+            worksheet.set_column("A:A", 50)
+            worksheet.set_column("B:B", 100, wrap_format)
+            worksheet.write_row(0, 0, [QUESTION_COLUMN, RESPONSE_COLUMN])
+            for row, question, answer, error in checkpoint.iter_results(sheet, corpus):
+                worksheet.write_row(row + 1, 0, [question, _response(answer, error)])
+            workbook.close()
+        else:
+            with open(tmp_path, "w", encoding="utf-8", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow([QUESTION_COLUMN, RESPONSE_COLUMN])
+                for row, question, answer, error in checkpoint.iter_results(sheet, corpus):
+                    writer.writerow([question, _response(answer, error)])
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+@dataclass
+class SheetResult:
+    sheet: str
+    path: str
+    kind: str
+    rows: int
+    answered: int
+    resumed: int
+    errors: int
+    total: Optional[int] = None
+
+
+# Answer every question in an uploaded sheet and write the results file.
+# Rows checkpointed by an earlier run of the same file against the same corpus
+# are not asked again. on_progress(done, total_or_None, batch_answer) is called
+# from the calling thread (batch_answer is None for resumed rows).
+def answer_sheet(chatbot, file, kind, sheet=None, batch_rows=None, max_concurrency=None,
+                 on_progress=None, checkpoint=None):
+    from vector_embed import answer_questions
+
+    checkpoint = checkpoint or get_checkpoint()
+    sheet = sheet or hash_file(file)
+    corpus = chatbot.fingerprint
+    batch_rows = max(1, batch_rows or SHEET_BATCH_ROWS)
+    total = count_rows(file, kind)
+    done_rows = checkpoint.done_rows(sheet, corpus)
+    rows = answered = errors = skipped = 0
+    batch, empty = [], []
+
+    # A batch's results are checkpointed together with the empty rows read since
+    # the last batch, also when the batch stops early (a cancelled job raises from
+    # on_progress), so a resumed run never asks a finished question again
+    def flush(batch):
+        nonlocal empty
+        finished, empty = empty, []
+
+        def collect(done, batch_size, answer):
+            nonlocal answered, errors
+            row, question = batch[answer.index]
+            finished.append((row, question, answer.answer, answer.error))
+            answered += 1
+            errors += answer.error is not None
+            if on_progress is not None:
+                on_progress(len(done_rows) + skipped + answered, total, answer)
+
+        try:
+            answer_questions(chatbot, [question for _, question in batch], max_concurrency=max_concurrency,
+                             on_progress=collect)
+        finally:
+            checkpoint.put_many(sheet, corpus, finished)
+
+    for row, question in iter_questions(file, kind):
+        rows += 1
+        if row in done_rows:
+            continue
+        if question is None:
+            empty.append((row, None, "", None))
+            skipped += 1
+        else:
+            batch.append((row, question))
+        if len(batch) + len(empty) >= batch_rows:
+            flush(batch)
+            batch = []
+    if batch or empty:
+        flush(batch)
+
+    resumed = len(done_rows)
+    if resumed:
+        print(f"Question sheet {sheet[:12]}: resumed {resumed} of {rows} rows from the checkpoint")
+    os.makedirs(SHEETS_DIR, exist_ok=True)
+    path = os.path.join(SHEETS_DIR, f"{sheet[:16]}-{corpus[:16]}.{kind}")
+    write_results(checkpoint, sheet, corpus, path, kind)
+    return SheetResult(sheet=sheet, path=path, kind=kind, rows=rows, answered=answered,
+                       resumed=resumed, errors=errors, total=total)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The app modules sit at the repository root; caches go to a scratch directory,
+# set before doc_cache reads it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DOC_CACHE_DIR", tempfile.mkdtemp(prefix="tests-doc-cache-"))
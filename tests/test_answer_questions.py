@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.bench_retrieval import synthetic_corpus
+from benchmarks.fakes import FakeChatModel, fake_vectorstore
+from vector_embed import Chatbot, answer_questions
+
+
+# Later questions answer sooner, so completion order is the reverse of input order
+class StaggeredChatModel(FakeChatModel):
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        number = int(self._reply(messages).rsplit("question ", 1)[1].split()[0])
+        time.sleep(self.latency * (10 - number))
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    documents = synthetic_corpus(100, words_per_chunk=60)
+    return documents, fake_vectorstore(documents, collection_name="test-answer-questions")
+
+
+def make_chatbot(corpus, chat_model):
+    documents, vectorstore = corpus
+    return Chatbot(documents, vectorstore, chat_model=chat_model)
+
+
+def test_results_follow_input_order_under_concurrency(corpus):
+    chatbot = make_chatbot(corpus, StaggeredChatModel(latency=0.02))
+    questions = [f"question {i} w1 w2" for i in range(10)]
+    completed = []
+
+    results = answer_questions(chatbot, questions, max_concurrency=10,
+                               on_progress=lambda done, total, result: completed.append(result.index))
+
+    assert completed != sorted(completed)  # answers really finished out of order
+    assert [r.index for r in results] == list(range(10))
+    assert [r.question for r in results] == questions
+    assert [r.answer for r in results] == [f"ANSWER: {q}" for q in questions]
+    assert all(r.error is None for r in results)
+
+
+def test_failing_question_is_recorded_without_aborting_the_batch(corpus):
+    chatbot = make_chatbot(corpus, FakeChatModel())
+    questions = ["w1 w2", "w3 w4 FAIL", "w5 w6"]
+
+    results = answer_questions(chatbot, questions, max_concurrency=3)
+
+    assert results[1].answer is None
+    assert "fake LLM failure" in results[1].error
+    assert [r.answer for r in (results[0], results[2])] == ["ANSWER: w1 w2", "ANSWER: w5 w6"]
+    assert results[0].error is None and results[2].error is None
+
+
+def test_on_progress_is_called_once_per_question_from_the_calling_thread(corpus):
+    chatbot = make_chatbot(corpus, FakeChatModel(latency=0.01))
+    questions = [f"w{i} w{i + 1}" for i in range(12)]
+    calls = []
+
+    answer_questions(chatbot, questions, max_concurrency=4,
+                     on_progress=lambda done, total, result: calls.append(
+                         (done, total, result.index, threading.get_ident())))
+
+    assert [done for done, _, _, _ in calls] == list(range(1, 13))
+    assert {total for _, total, _, _ in calls} == {12}
+    assert sorted(index for _, _, index, _ in calls) == list(range(12))
+    assert {thread for _, _, _, thread in calls} == {threading.get_ident()}
+
+
+def test_no_questions(corpus):
+    calls = []
+    assert answer_questions(make_chatbot(corpus, FakeChatModel()), [], on_progress=lambda *a: calls.append(a)) == []
+    assert calls == []
@@ -0,0 +1,19 @@
+import chunking
+from chunking import TokenChunker
+
+
+class WordEncoder:
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+def test_estimated_token_counts_get_their_own_key(monkeypatch):
+    monkeypatch.setattr(chunking, "get_token_encoder", lambda: WordEncoder())
+    counted = TokenChunker().key
+    monkeypatch.setattr(chunking, "get_token_encoder", lambda: None)
+    estimated = TokenChunker().key
+
+    assert estimated != counted
+    assert estimated.endswith("-est4") and not counted.endswith("-est4")
+    assert chunking.count_tokens("x" * 40) == 10  # the estimate really is in use
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+
+import doc_cache
+
+
+def make_cache(root, max_bytes=10 ** 9, track_usage=True):
+    return doc_cache.DocumentCache(str(root), max_bytes=max_bytes, track_usage=track_usage)
+
+
+def put_entry(cache, sha, size):
+    cache.put_vectors(sha, "emb", np.zeros(size // 4, dtype=np.float32))
+    cache.put_chunks(sha, "tok", [Document(page_content="x" * size, metadata={})])
+
+
+def on_disk(root):
+    return sum(os.path.getsize(os.path.join(folder, name))
+               for folder, _, names in os.walk(root) for name in names if not name.startswith("index.db"))
+
+
+def test_sizes_are_tracked_per_file(tmp_path):
+    cache = make_cache(tmp_path)
+    put_entry(cache, "a" * 64, 4000)
+    put_entry(cache, "b" * 64, 8000)
+
+    assert cache.total_bytes() == on_disk(tmp_path)
+    put_entry(cache, "a" * 64, 400)  # rewriting a file replaces its size
+    assert cache.total_bytes() == on_disk(tmp_path)
+
+
+def test_eviction_removes_least_recently_used_entries(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, max_bytes=45000)
+    put_entry(cache, "a" * 64, 8000)
+    put_entry(cache, "b" * 64, 8000)
+    cache.touch("a" * 64)
+    monkeypatch.setattr(os, "listdir", lambda *args: (_ for _ in ()).throw(AssertionError("listdir")))
+
+    put_entry(cache, "c" * 64, 8000)
+
+    assert cache.get_vectors("b" * 64, "emb") is None
+    assert cache.get_vectors("a" * 64, "emb") is not None
+    assert cache.total_bytes() <= 45000
+
+
+def test_files_written_without_bookkeeping_are_accounted_by_the_parent(tmp_path):
+    parent = make_cache(tmp_path)
+    worker = make_cache(tmp_path, track_usage=False)
+    put_entry(worker, "a" * 64, 4000)
+
+    written = worker.take_untracked()
+    assert len(written) == 2 and worker.take_untracked() == []
+    parent.account_files(written)
+
+    assert parent.total_bytes() == on_disk(tmp_path)
+
+
+def test_existing_cache_is_indexed_once(tmp_path):
+    cache = make_cache(tmp_path)
+    put_entry(cache, "a" * 64, 4000)
+    cache._db.execute("DROP TABLE files")
+    cache._db.execute("UPDATE entries SET size_bytes = 0")
+    cache._db.commit()
+
+    reopened = make_cache(tmp_path)
+
+    assert reopened.total_bytes() == on_disk(tmp_path)
+    assert len(reopened._db.execute("SELECT path FROM files").fetchall()) == 2
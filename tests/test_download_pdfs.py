@@ -0,0 +1,119 @@
+import os
+import threading
+
+import pytest
+
+from benchmarks.fixture_server import BLOCK, FixtureServer
+from pdf_downloader import download_pdfs
+
+MB = len(BLOCK)
+
+
+@pytest.fixture(scope="module")
+def server():
+    with FixtureServer() as server:
+        yield server
+
+
+def leftovers(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith(".part"))
+
+
+def test_downloads_complete_in_input_order(server, tmp_path):
+    urls = [f"{server.base_url}/files/report-{i}.pdf?size={(i + 1) * 1000}" for i in range(6)]
+
+    results = download_pdfs(urls, str(tmp_path), max_workers=3, use_cache=False)
+
+    assert [r.url for r in results] == urls
+    assert [r.error for r in results] == [None] * 6
+    assert [r.bytes for r in results] == [(i + 1) * 1000 for i in range(6)]
+    assert all(os.path.getsize(r.path) == r.bytes for r in results)
+    assert leftovers(tmp_path) == []
+
+
+def test_oversized_body_is_rejected_from_content_length(server, tmp_path):
+    url = f"{server.base_url}/files/big.pdf?size={2 * MB}"
+
+    [result] = download_pdfs([url], str(tmp_path), max_bytes=MB, use_cache=False)
+
+    assert "over the" in result.error
+    assert result.path is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_body_is_rejected_while_streaming(server, tmp_path):
+    # No Content-Length: the limit can only be enforced on the bytes received
+    url = f"{server.base_url}/files/big.pdf?size={3 * MB}&no_length=1"
+    seen = []
+
+    [result] = download_pdfs([url], str(tmp_path), max_bytes=MB, use_cache=False,
+                             on_progress=lambda url, done, total: seen.append((done, total)))
+
+    assert "exceeded the" in result.error
+    assert all(total is None and done <= MB for done, total in seen)
+    assert os.listdir(tmp_path) == []  # the .part file was removed
+
+
+def test_slow_first_byte_hits_the_timeout(server, tmp_path):
+    url = f"{server.base_url}/files/slow.pdf?size=1000&delay=1.5"
+
+    [result] = download_pdfs([url], str(tmp_path), timeout=0.3, use_cache=False)
+
+    assert result.error is not None
+    assert os.listdir(tmp_path) == []
+
+
+def test_slow_body_hits_the_deadline_and_leaves_no_part_file(server, tmp_path):
+    url = f"{server.base_url}/files/slow.pdf?size={4 * MB}&block_delay=0.2"
+
+    [result] = download_pdfs([url], str(tmp_path), timeout=0.5, use_cache=False)
+
+    assert "did not finish" in result.error
+    assert os.listdir(tmp_path) == []
+
+
+def test_failures_do_not_affect_other_files(server, tmp_path):
+    urls = [f"{server.base_url}/files/ok.pdf?size=1000", f"{server.base_url}/missing.pdf",
+            f"{server.base_url}/files/big.pdf?size={2 * MB}"]
+
+    ok, missing, big = download_pdfs(urls, str(tmp_path), max_bytes=MB, use_cache=False)
+
+    assert ok.error is None and os.path.getsize(ok.path) == 1000
+    assert "404" in missing.error
+    assert "over the" in big.error
+    assert leftovers(tmp_path) == []
+
+
+def test_cancel_aborts_transfers_in_flight_and_skips_the_rest(server, tmp_path):
+    urls = [f"{server.base_url}/files/slow-{i}.pdf?size={4 * MB}&block_delay=0.1" for i in range(4)]
+    cancel = threading.Event()
+    completed = []
+
+    results = download_pdfs(urls, str(tmp_path), max_workers=2, use_cache=False, cancel=cancel,
+                            on_progress=lambda url, done, total: cancel.set(),
+                            on_complete=completed.append)
+
+    assert [r.error for r in results] == ["cancelled"] * 4
+    assert len(completed) == 4
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancel_before_start(server, tmp_path):
+    cancel = threading.Event()
+    cancel.set()
+
+    results = download_pdfs([f"{server.base_url}/files/a.pdf"], str(tmp_path), use_cache=False, cancel=cancel)
+
+    assert results[0].error == "cancelled"
+    assert os.listdir(tmp_path) == []
+
+
+def test_same_file_name_from_different_paths_is_kept_apart(server, tmp_path):
+    urls = [f"{server.base_url}/files/2023/report.pdf?size=1000", f"{server.base_url}/files/2024/report.pdf?size=2000"]
+
+    results = download_pdfs(urls, str(tmp_path), use_cache=False)
+
+    assert [r.error for r in results] == [None, None]
+    assert results[0].path != results[1].path
+    assert [os.path.getsize(r.path) for r in results] == [1000, 2000]
+    assert all(os.path.basename(r.path).endswith("-report.pdf") for r in results)
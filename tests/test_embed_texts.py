@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import embedding_pipeline
+from benchmarks.fakes import FakeEmbeddings
+from embedding_pipeline import EmbeddingMemo, embed_texts
+
+TEXTS = [f"chunk {i}" for i in range(40)]
+
+
+def expected(texts):
+    return np.asarray(FakeEmbeddings(size=16).embed_documents(texts), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    monkeypatch.setattr(embedding_pipeline.time, "sleep", lambda seconds: None)
+
+
+def test_duplicate_texts_are_embedded_once(tmp_path):
+    texts = TEXTS + TEXTS[:10] + TEXTS[5:15]
+    embedder = FakeEmbeddings(size=16)
+
+    vectors = embed_texts(texts, embedder, memo=EmbeddingMemo(str(tmp_path / "memo.db")), batch_size=8)
+
+    assert embedder.texts_sent == len(TEXTS)
+    assert np.allclose(vectors, expected(texts))
+
+
+def test_rate_limited_batches_are_retried(tmp_path):
+    embedder = FakeEmbeddings(size=16, rate_limit_every=3)  # every third call is a 429
+
+    vectors = embed_texts(TEXTS, embedder, memo=None, batch_size=8, max_concurrency=4)
+
+    assert embedder.texts_sent == len(TEXTS)
+    assert np.allclose(vectors, expected(TEXTS))
+
+
+def test_rerun_after_a_failure_only_embeds_the_missing_texts(tmp_path):
+    memo = EmbeddingMemo(str(tmp_path / "memo.db"))
+    failing = FakeEmbeddings(size=16, rate_limit_every=3)  # third batch fails for good
+
+    with pytest.raises(Exception, match="429"):
+        embed_texts(TEXTS, failing, memo=memo, batch_size=8, max_concurrency=1, max_retries=0)
+    assert len(memo) == failing.texts_sent == 32  # four of five batches were checkpointed
+
+    resumed = FakeEmbeddings(size=16)
+    vectors = embed_texts(TEXTS, resumed, memo=memo, batch_size=8)
+
+    assert resumed.texts_sent == 8
+    assert np.allclose(vectors, expected(TEXTS))
@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from embedding_pipeline import EmbeddingMemo
+
+DIM = 256  # 1 KB per vector
+
+
+def vector(i):
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_memo_is_kept_under_its_size_limit(tmp_path):
+    memo = EmbeddingMemo(str(tmp_path / "memo.db"), max_bytes=10 * DIM * 4)
+    memo.put_many((f"k{i}", vector(i)) for i in range(6))
+    time.sleep(0.01)
+    memo.get_many(["k0", "k1"])  # recently used, so kept
+
+    memo.put_many((f"k{i}", vector(i)) for i in range(6, 12))
+
+    assert len(memo) == 10 and memo.total_bytes() == 10 * DIM * 4
+    kept = memo.get_many(f"k{i}" for i in range(12))
+    assert sorted(kept) == sorted(["k0", "k1"] + [f"k{i}" for i in range(4, 12)])
+    assert np.array_equal(kept["k0"], vector(0))
+
+
+def test_replacing_a_vector_does_not_count_it_twice(tmp_path):
+    memo = EmbeddingMemo(str(tmp_path / "memo.db"))
+    memo.put_many([("k", vector(1))])
+    memo.put_many([("k", vector(2))])
+
+    assert memo.total_bytes() == DIM * 4
+    assert EmbeddingMemo(str(tmp_path / "memo.db")).total_bytes() == DIM * 4
+
+
+def test_memo_from_before_the_size_limit_is_upgraded(tmp_path):
+    path = str(tmp_path / "memo.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    db.executemany("INSERT INTO vectors VALUES (?, ?)", [(f"old{i}", vector(i).tobytes()) for i in range(4)])
+    db.commit()
+    db.close()
+
+    memo = EmbeddingMemo(path, max_bytes=4 * DIM * 4)
+    memo.put_many([("new", vector(9))])
+
+    assert memo.total_bytes() == 4 * DIM * 4
+    assert "new" in memo.get_many(["new"]) and len(memo.get_many(f"old{i}" for i in range(4))) == 3
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+from index_registry import IndexRegistry
+
+
+def test_builders_of_one_collection_take_turns(tmp_path):
+    registry = IndexRegistry(root=str(tmp_path))
+    inside, overlaps = [], []
+
+    def build(name):
+        with registry.building(name):
+            inside.append(name)
+            overlaps.append(inside.count(name))
+            time.sleep(0.05)
+            inside.remove(name)
+
+    threads = [threading.Thread(target=build, args=(name,)) for name in ("a", "a", "a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(overlaps) == 1
+
+
+def test_check_can_give_up_while_waiting(tmp_path):
+    registry = IndexRegistry(root=str(tmp_path))
+    cancel = threading.Event()
+
+    def check():
+        if cancel.is_set():
+            raise RuntimeError("cancelled")
+
+    with registry.building("a"):
+        threading.Timer(0.1, cancel.set).start()
+        with pytest.raises(RuntimeError):
+            with registry.building("a", check=check):
+                pass
+
+    with registry.building("a"):  # released by the first builder, never taken by the second
+        pass
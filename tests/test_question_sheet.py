@@ -0,0 +1,78 @@
+import csv
+import io
+
+import pytest
+
+import question_sheet
+
+
+class StubChatbot:
+    fingerprint = "stub-corpus"
+
+    def __init__(self):
+        self.asked = []
+
+    def ask(self, question):
+        self.asked.append(question)
+        return f"Answer to {question}"
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(question_sheet, "SHEETS_DIR", str(tmp_path / "sheets"))
+    return question_sheet.SheetCheckpoint(str(tmp_path / "sheets.db"))
+
+
+def sheet(questions):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(["ID", "QUESTIONS"])
+    writer.writerows([i, question] for i, question in enumerate(questions))
+    return io.BytesIO(text.getvalue().encode("utf-8"))
+
+
+def read_results(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        return list(csv.reader(file))[1:]
+
+
+QUESTIONS = [f"q{i}" if i % 4 != 3 else "" for i in range(23)]
+ASKED = [q for q in QUESTIONS if q]
+
+
+def test_cancelled_run_keeps_every_finished_answer(checkpoint):
+    def stop_after_seven(done, total, answer):
+        if answer is not None and answer.question == ASKED[6]:
+            raise Stop()
+
+    first = StubChatbot()
+    with pytest.raises(Stop):
+        question_sheet.answer_sheet(first, sheet(QUESTIONS), "csv", batch_rows=5, max_concurrency=1,
+                                    on_progress=stop_after_seven, checkpoint=checkpoint)
+    # Only the question already in flight when the run stopped was started after it
+    assert first.asked[:7] == ASKED[:7] and len(first.asked) <= 8
+
+    second = StubChatbot()
+    result = question_sheet.answer_sheet(second, sheet(QUESTIONS), "csv", batch_rows=5, max_concurrency=1,
+                                         checkpoint=checkpoint)
+
+    # Nothing answered before the cancel is asked again, and empty rows read so far were kept
+    assert second.asked == ASKED[7:]
+    assert result.resumed > 7
+    assert read_results(result.path) == [[q, f"Answer to {q}" if q else ""] for q in QUESTIONS]
+
+
+def test_progress_counts_every_row_once(checkpoint):
+    seen = []
+
+    result = question_sheet.answer_sheet(StubChatbot(), sheet(QUESTIONS), "csv", batch_rows=4,
+                                         on_progress=lambda done, total, answer: seen.append((done, total)),
+                                         checkpoint=checkpoint)
+
+    assert result.rows == len(QUESTIONS) and result.answered == len(ASKED)
+    assert [done for done, _ in seen] == sorted(done for done, _ in seen)
+    assert seen[-1] == (len(QUESTIONS), None)  # csv has no row count up front
@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import vector_index
+
+
+def test_hnsw_concurrent_searches_match_sequential_ones():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, 32)).astype(np.float32)
+    queries = rng.standard_normal((64, 32)).astype(np.float32)
+    index = vector_index.build_index(vectors, "hnsw", ef_search=16)
+    # Searches with k above ef_search must neither change the index's ef nor return fewer results
+    ks = [5 if i % 2 else 100 for i in range(len(queries))]
+
+    expected = [index.search(q, k)[0].tolist() for q, k in zip(queries, ks)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda args: index.search(*args)[0].tolist(), zip(queries, ks)))
+
+    assert results == expected
+    assert [len(r) for r in results] == ks
+    assert index.ef_search == 16
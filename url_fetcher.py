@@ -1,40 +1,204 @@
+import hashlib
+import json
 import os
-
-from langchain_core.tools import Tool
-from langchain_google_community import GoogleSearchAPIWrapper
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 
 from dotenv import load_dotenv
 
+import doc_cache
+import instrumentation
+
 # Load environment 
 load_dotenv()
 
-os.environ["GOOGLE_CSE_ID"] = os.getenv("GOOGLE_API_SECRET")
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+# Web search for report URLs. Results are cached on disk per normalized query
+# for SEARCH_CACHE_TTL_HOURS, several query variants can be sent concurrently
+# and merged, and the search backend is pluggable: anything with a
+# results(query, num_results) method returning [{"link": ..., "title": ...}]
+# can stand in for Google (see benchmarks/fakes.py).
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(doc_cache.DOC_CACHE_DIR, "search.db"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24")) * 3600
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "5"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+SEARCH_MAX_LINKS = int(os.getenv("SEARCH_MAX_LINKS", "10"))
+# Comma separated query variants to fan out to; see query_variants. The default
+# is the single original query, one search API call per Submit; e.g.
+# "latest,filetype,year" trades more calls for more candidate links
+SEARCH_VARIANTS = [v.strip() for v in os.getenv("SEARCH_VARIANTS", "latest").split(",") if v.strip()]
 
-search = GoogleSearchAPIWrapper()
+_backend_lock = threading.Lock()
+_backend = None
+_cache_lock = threading.Lock()
+_cache = None
 
-def top5_results(query):
-    return search.results(query, 5)
 
+class GoogleSearchBackend:
+    name = "google"
 
-def find_top_search_results(company,keyword):
+    def __init__(self):
+        from langchain_google_community import GoogleSearchAPIWrapper
 
-    tool = Tool(
-        name="Google Search Snippets",
-        description="Search Google for recent results.",
-        func=top5_results,
-    )
-    final_query = f"{company} + {keyword} + pdf + report + latest"
-    print("Final Query : ",final_query)
+        cse_id, api_key = os.getenv("GOOGLE_API_SECRET"), os.getenv("GOOGLE_API_KEY")
+        missing = [name for name, value in (("GOOGLE_API_SECRET", cse_id), ("GOOGLE_API_KEY", api_key)) if not value]
+        if missing:
+            raise ValueError(f"Google search needs {' and '.join(missing)} set in the environment or .env "
+                             "(GOOGLE_API_SECRET is the custom search engine id)")
+        os.environ["GOOGLE_CSE_ID"] = cse_id
+        os.environ["GOOGLE_API_KEY"] = api_key
+        self.search = GoogleSearchAPIWrapper()
 
-    data = tool.run(final_query)
+    def results(self, query, num_results):
+        return self.search.results(query, num_results)
 
-    # print("\nSearch Results : \n",data)
 
-    links = [item['link'] for item in data]
+def get_search_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = GoogleSearchBackend()
+        return _backend
+
+
+# Replace the search backend process-wide (e.g. with a local stub); None resets to Google
+def set_search_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+class SearchCache:
+
+    def __init__(self, path=SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL_SECONDS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS searches (
+            key TEXT PRIMARY KEY, query TEXT NOT NULL, results TEXT NOT NULL, created_at REAL NOT NULL)""")
+        self._db.commit()
+
+    @staticmethod
+    def key(backend_name, query, num_results):
+        return hashlib.sha256(f"{backend_name}\0{num_results}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT results, created_at FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is not None and time.time() - row[1] <= self.ttl:
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, query, results):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO searches (key, query, results, created_at) VALUES (?, ?, ?, ?)",
+                             (key, normalize_query(query), json.dumps(results), time.time()))
+            self._db.execute("DELETE FROM searches WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+
+def get_search_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
 
-    return links if links else [item['Result'] for item in data if 'Result' in item]
+def search(query, num_results=SEARCH_RESULTS, backend=None, use_cache=True):
+    backend = backend or get_search_backend()
+    cache = get_search_cache() if use_cache else None
+    key = SearchCache.key(getattr(backend, "name", type(backend).__name__), query, num_results)
+    with instrumentation.span("search.query", query=query, cached=False) as span:
+        if cache is not None:
+            results = cache.get(key)
+            if results is not None:
+                if span is not None:
+                    span.attributes["cached"] = True
+                return results
+
+        instrumentation.add("search.api_calls")
+        results = backend.results(query, num_results)
+    # GoogleSearchAPIWrapper reports "no results" as a single {"Result": ...} item
+    if cache is not None and any("link" in item for item in results):
+        cache.put(key, query, results)
+    return results
+
+
+def query_variants(company, keyword, variants=None, site=None):
+    queries = []
+    for variant in variants or SEARCH_VARIANTS:
+        if variant == "latest":
+            queries.append(f"{company} + {keyword} + pdf + report + latest")
+        elif variant == "filetype":
+            queries.append(f"{company} {keyword} report filetype:pdf")
+        elif variant == "year":
+            queries.append(f"{company} {keyword} report {date.today().year - 1} filetype:pdf")
+        else:
+            queries.append(variant.format(company=company, keyword=keyword))
+    if site:
+        queries.append(f"{company} {keyword} report site:{site}")
+    return list(dict.fromkeys(queries))
+
+
+# Runs all queries concurrently and merges their results rank by rank (first hit
+# of every query, then the second ones, ...), dropping duplicate URLs
+def search_many(queries, num_results=SEARCH_RESULTS, backend=None, use_cache=True, max_workers=None,
+                max_links=None):
+    # pdf_crawler pulls in bs4, lxml and requests; only needed once results come in
+    from pdf_crawler import normalize_url
+
+    backend = backend or get_search_backend()
+    max_workers = max(1, min(max_workers or SEARCH_CONCURRENCY, len(queries) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(instrumentation.wrap(search), query, num_results, backend, use_cache)
+                   for query in queries]
+
+    result_lists, errors = [], []
+    for query, future in zip(queries, futures):
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"Search failed for {query!r}: {e}")
+            errors.append(e)
+    # One failed variant is tolerated; all of them failing is an error
+    if errors and not result_lists:
+        raise errors[0]
+
+    merged, seen = [], set()
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank < len(results) and "link" in results[rank]:
+                key = normalize_url(results[rank]["link"])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(results[rank])
+    return merged[:max_links] if max_links else merged
+
+
+def find_top_search_results(company, keyword, backend=None, variants=None, site=None, use_cache=True):
+    queries = query_variants(company, keyword, variants, site)
+
+    with instrumentation.span("search", queries=len(queries)) as span:
+        data = search_many(queries, backend=backend, use_cache=use_cache, max_links=SEARCH_MAX_LINKS)
+        if span is not None:
+            span.attributes["links"] = len(data)
+
+    # print("\nSearch Results : \n",data)
+
+    return [item['link'] for item in data]
 
 # def search_top_5_urls(search_query):
 #     tool.run("Obama's first name?")
-
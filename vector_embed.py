@@ -1,23 +1,26 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
 
-from langchain_community.document_loaders import CSVLoader,BSHTMLLoader, WebBaseLoader,PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import Chroma
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from tqdm import tqdm
-
-import shutil
-import tempfile
 
-persist_directory = tempfile.mkdtemp()
+from answer_cache import corpus_fingerprint, get_answer_cache
+from chunk_store import ChunkStore
+from chunking import CHUNK_STRATEGY, TokenChunker, chunk_tokens, count_tokens, get_token_encoder, truncate_to_tokens
+import doc_cache
+import instrumentation
+import pdf_extract
+from embedding_pipeline import embed_texts, get_memo
 
 # __import__('pysqlite3')
 # import sys
@@ -30,38 +33,161 @@ from dotenv import load_dotenv
 load_dotenv()
 
 open_api_key = os.getenv("OPEN_API_KEY")
-embeddings = OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL"),
-                               api_key=open_api_key)
 
 
-llm = ChatOpenAI(model=os.getenv("LLM"), temperature=0.1, api_key=open_api_key)
+# The OpenAI clients (and langchain_openai itself, the slowest import here) are
+# only built when first used, so importing this module stays cheap on cold starts
+@lru_cache(maxsize=None)
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=os.getenv("EMBEDDING_MODEL"),
+                            api_key=open_api_key)
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=os.getenv("LLM"), temperature=0.1, api_key=open_api_key)
 
 
-def create_embeddings(documents):
-    print("In create embeddings")
+# vector_embed.embeddings / vector_embed.llm keep working, built on first access
+def __getattr__(name):
+    if name == "embeddings":
+        return get_embeddings()
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    # Use 'persist_directory' to create a persistent vector store
-    persist_directory = "vector_store_db" 
 
-    # If vectorstore exists, disconnect before deleting
-    if os.path.exists(persist_directory):
-        try:
-            # Attempt to clear Chroma if it's still connected
-            vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-            vectorstore.delete_collection()  # Clear the collection if necessary
-            # vectorstore._client.close()  # Ensure the client is closed
-        except Exception as e:
-            print(f"Error during closing: {e}")
+# Chroma caps how many records a single add/upsert/delete call may carry
+CHROMA_BATCH_SIZE = 4000
+
+
+def embedding_model_name(embedding):
+    return getattr(embedding, "model", None) or type(embedding).__name__
+
+
+# content_hash -> ids of the chunks indexed for that file
+def indexed_files(collection):
+    indexed = {}
+    existing = collection.get(include=["metadatas"])
+    for doc_id, metadata in zip(existing["ids"], existing["metadatas"]):
+        indexed.setdefault((metadata or {}).get("content_hash"), []).append(doc_id)
+    return indexed
+
+
+# Delete the chunks of every indexed file whose hash is not in keep
+def remove_files(collection, indexed, keep):
+    stale_ids = [doc_id for sha, ids in indexed.items() if sha not in keep for doc_id in ids]
+    for i in range(0, len(stale_ids), CHROMA_BATCH_SIZE):
+        collection.delete(ids=stale_ids[i:i + CHROMA_BATCH_SIZE])
+    return stale_ids
+
+
+def upsert_chunks(collection, sha, chunks, vectors, offset=0):
+    vectors = np.asarray(vectors, dtype=np.float32).tolist()
+    ids = [f"{sha}:{offset + i}" for i in range(len(chunks))]
+    for i in range(0, len(chunks), CHROMA_BATCH_SIZE):
+        batch = slice(i, i + CHROMA_BATCH_SIZE)
+        collection.upsert(ids=ids[batch], embeddings=vectors[batch],
+                          metadatas=[c.metadata for c in chunks[batch]],
+                          documents=[c.page_content for c in chunks[batch]])
+
+
+# Bring the Chroma collection in line with documents, one source file at a time
+# (chunks are grouped by their "content_hash" metadata): files that are already
+# indexed are left alone, files no longer selected are removed, and only new or
+# changed files are embedded. Vectors come from the document cache when the same
+# file was embedded with the same model before, otherwise from embed_texts
+# (deduped, memoized per text, batched with backoff and resumable).
+# on_progress(done, total) follows the embedding run.
+def sync_vectorstore(vectorstore, documents, embedding=None, cache=None, on_progress=None):
+    embedding = embedding or get_embeddings()
+    collection = vectorstore._collection
+
+    by_hash = {}
+    for doc in documents:
+        by_hash.setdefault(doc.metadata.get("content_hash"), []).append(doc)
+    if None in by_hash:
+        raise ValueError("documents must carry a content_hash metadata entry (see load_from_directory)")
+
+    indexed = indexed_files(collection)
+    remove_files(collection, indexed, keep=by_hash)
+
+    new_hashes = [sha for sha in by_hash if sha not in indexed]
+    vector_key = f"{embedding_model_name(embedding)}.{chunk_key()}"
+    file_vectors = {}
+    for sha in new_hashes:
+        vectors = cache.get_vectors(sha, vector_key) if cache is not None else None
+        if vectors is not None and len(vectors) == len(by_hash[sha]):
+            file_vectors[sha] = vectors
+
+    # Everything not in the document cache goes through one batched embedding run
+    to_embed = [sha for sha in new_hashes if sha not in file_vectors]
+    if to_embed:
+        texts = [chunk.page_content for sha in to_embed for chunk in by_hash[sha]]
+        vectors = embed_texts(texts, embedding, model=embedding_model_name(embedding),
+                              memo=get_memo() if cache is not None else None, on_progress=on_progress)
+        offset = 0
+        for sha in to_embed:
+            file_vectors[sha] = vectors[offset:offset + len(by_hash[sha])]
+            offset += len(by_hash[sha])
+            if cache is not None:
+                cache.put_vectors(sha, vector_key, file_vectors[sha])
+
+    for sha in new_hashes:
+        upsert_chunks(collection, sha, by_hash[sha], file_vectors[sha])
+
+    removed = sum(1 for sha in indexed if sha not in by_hash)
+    print(f"Vector store sync: {len(new_hashes)} files added ({len(new_hashes) - len(to_embed)} from cache), "
+          f"{len(by_hash) - len(new_hashes)} unchanged, {removed} removed")
+    return vectorstore
+
+
+# Directory of the persistent Chroma database holding every collection
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store_db")
+DEFAULT_COLLECTION = "langchain"
+
+
+# One Chroma client per process, shared by all sessions and collections
+@lru_cache(maxsize=None)
+def get_chroma_client(persist_directory=VECTOR_STORE_DIR):
+    import chromadb
 
-        shutil.rmtree(persist_directory, ignore_errors=True)
-        print(f"Removed previous vector store: {persist_directory}")
-    
     os.makedirs(persist_directory, exist_ok=True)
+    return chromadb.PersistentClient(path=persist_directory)
+
+
+def open_vectorstore(collection_name=DEFAULT_COLLECTION, embedding=None):
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(client=get_chroma_client(), collection_name=collection_name,
+                  embedding_function=embedding or get_embeddings())
+
+
+# Documents stored in a collection (as a ChunkStore), grouped by source file in
+# chunk order, so a persisted index can be reopened without reloading or
+# re-embedding its files
+def collection_documents(collection):
+    stored = collection.get(include=["documents", "metadatas"])
+    records = sorted(zip(stored["ids"], stored["documents"], stored["metadatas"]),
+                     key=lambda r: ((r[2] or {}).get("source", ""), int(r[0].rsplit(":", 1)[-1]) if ":" in r[0] else 0))
+    return ChunkStore.from_documents(Document(page_content=text, metadata=metadata or {}) for _, text, metadata in records)
 
+
+def create_embeddings(documents, use_cache=True, on_progress=None):
+    print("In create embeddings")
+
+    # The collection is kept between runs and updated incrementally
     try:
-        vectorstore = Chroma.from_documents(documents, embeddings, persist_directory=persist_directory)
+        vectorstore = open_vectorstore()
+        sync_vectorstore(vectorstore, documents, cache=doc_cache.get_cache() if use_cache else None,
+                         on_progress=on_progress)
     except Exception as e:
         print(f"Error creating vector store: {e}")
+        return documents, None
 
     return documents, vectorstore
 
@@ -86,54 +212,253 @@ def create_embeddings(documents):
 #     return documents, vectorstore
 
 
-def load_from_directory(directory):
-    print("Entered in function")
-    combined_data = []
-
-    loaders = {
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": BSHTMLLoader,
-        "xlsx": CSVLoader
-    }
-    try:
+# Character splitter settings, used with CHUNK_STRATEGY=chars (see chunking.py)
+CHUNK_SIZE = 2048
+CHUNK_OVERLAP = 250
+# Identifies the splitter settings that cached chunks and vectors were produced
+# with. Resolved on first use: the token chunker's key depends on whether the
+# tokenizer could be loaded
+@lru_cache(maxsize=None)
+def chunk_key():
+    return TokenChunker().key if CHUNK_STRATEGY == "tokens" else f"rc{CHUNK_SIZE}-{CHUNK_OVERLAP}"
 
-        for filename in tqdm(os.listdir(directory)):
-            ext = filename.split(".")[-1].lower()  # Ensure extension check is case-insensitive
-            if ext in loaders:
-                loader_class = loaders[ext]
-                loader = loader_class(os.path.join(directory, filename))
-                documents = loader.load()
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=2048, chunk_overlap=250)
-                texts = text_splitter.split_documents(documents)
-                combined_data.extend(texts)
-                
-            else:
-                loader = WebBaseLoader(os.path.join(directory, filename))
-                documents = loader.load()
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=2048, chunk_overlap=250)
-                texts = text_splitter.split_documents(documents)
-                combined_data.extend(texts)
-        print("SIZE of Combined Data : ",len(combined_data))
-        return combined_data
-    except Exception as e:
-        print(f"Error in Loading Documents {e}")
-        return None
+# Loader class names in langchain_community.document_loaders, imported on first
+# use; PDFs go through pdf_extract instead
+LOADERS = {
+    "csv": "CSVLoader",
+    "html": "BSHTMLLoader",
+    "xlsx": "CSVLoader"
+}
 
 
-def create_chatbot(documents,vectorstore,question_asked):
-    
-    vectorstore_retreiver = vectorstore.as_retriever(search_kwargs={"k": 5},)
+# Parallel file parsing; 1 loads everything in the calling process
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", str(os.cpu_count() or 1)))
+
 
-    keyword_retriever = BM25Retriever.from_documents(documents)
-    keyword_retriever.k =  5 
+@dataclass
+class LoadResult:
+    file_path: str
+    chunks: Sequence[Document] = field(default_factory=list)  # list or ChunkStore
+    error: Optional[str] = None
+    cached: bool = False
 
-    ensemble_retriever = EnsembleRetriever(retrievers=[vectorstore_retreiver,
-                                                    keyword_retriever],
-                                        weights=[0.5, 0.5])
 
+# One splitter per process, shared by every file it loads
+@lru_cache(maxsize=None)
+def get_text_splitter():
+    if CHUNK_STRATEGY == "tokens":
+        return TokenChunker()
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-    template = """
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def get_loader_class(ext):
+    from langchain_community import document_loaders
+
+    return getattr(document_loaders, LOADERS.get(ext, "WebBaseLoader"))
+
+
+# sha (the file's content hash) lets PDF extraction reuse cached page text.
+# PDFs come back as a generator of chunks, split a page at a time
+def load_file(file_path, sha=None):
+    ext = file_path.split(".")[-1].lower()  # Ensure extension check is case-insensitive
+    if ext == "pdf":
+        return pdf_extract.load_pdf(file_path, get_text_splitter(), sha=sha)
+    loader_class = get_loader_class(ext)
+    with instrumentation.span("parse", file=os.path.basename(file_path), loader=loader_class.__name__):
+        documents = loader_class(file_path).load()
+    with instrumentation.span("split", file=os.path.basename(file_path)) as span:
+        chunks = get_text_splitter().split_documents(documents)
+        if span is not None:
+            span.attributes["chunks"] = len(chunks)
+    instrumentation.add("split.chunks", len(chunks))
+    return chunks
+
+
+# Process-pool entry point: parse + split one file and tag its chunks. Chunks
+# are packed into a ChunkStore as they are produced, so neither the worker nor
+# the process it returns to keeps a Document per chunk of the file
+def _load_file_worker(file_path, sha):
+    def tagged(texts):
+        for text in texts:
+            text.metadata["content_hash"] = sha
+            yield text
+
+    return ChunkStore.from_documents(tagged(load_file(file_path, sha)))
+
+
+# _load_file_worker for a process pool: also returns the cache files the worker
+# wrote, for the parent to account for (see doc_cache.account_files)
+def _load_file_job(file_path, sha):
+    texts = _load_file_worker(file_path, sha)
+    return texts, doc_cache.get_cache().take_untracked()
+
+
+# Yield a LoadResult per file in directory as soon as that file is done.
+# Files with cached chunks are served straight away; the rest are parsed and
+# split in a process pool of max_workers (default LOAD_WORKERS). A file that
+# fails to load yields a LoadResult with error set and does not affect the others.
+def iter_load_from_directory(directory, max_workers=None, use_cache=True):
+    cache = doc_cache.get_cache() if use_cache else None
+    pending = []
+
+    for filename in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, filename)
+        try:
+            sha = doc_cache.file_sha256(file_path)
+            # Unchanged files reuse the chunks split from an earlier run
+            texts = cache.get_chunks(sha, chunk_key()) if cache is not None else None
+        except Exception as e:
+            yield LoadResult(file_path=file_path, error=str(e))
+            continue
+        if texts is not None:
+            for text in texts:
+                text.metadata["source"] = file_path
+            yield LoadResult(file_path=file_path, chunks=texts, cached=True)
+        else:
+            pending.append((file_path, sha))
+
+    def finished(file_path, sha, texts):
+        if cache is not None:
+            cache.put_chunks(sha, chunk_key(), texts)
+        return LoadResult(file_path=file_path, chunks=texts)
+
+    max_workers = max(1, min(max_workers or LOAD_WORKERS, len(pending) or 1))
+    if max_workers == 1:
+        for file_path, sha in pending:
+            try:
+                yield finished(file_path, sha, _load_file_worker(file_path, sha))
+            except Exception as e:
+                yield LoadResult(file_path=file_path, error=str(e))
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_load_file_job, file_path, sha): (file_path, sha)
+                   for file_path, sha in pending}
+        for future in as_completed(futures):
+            file_path, sha = futures[future]
+            try:
+                texts, written = future.result()
+                doc_cache.get_cache().account_files(written)
+                yield finished(file_path, sha, texts)
+            except Exception as e:
+                yield LoadResult(file_path=file_path, error=str(e))
+
+
+# Load and split every file in directory. Failed files are reported through
+# on_file(load_result) and skipped; chunks are returned in file-name order, as
+# a ChunkStore.
+def load_from_directory(directory, use_cache=True, max_workers=None, on_file=None):
+    from tqdm import tqdm
+
+    print("Entered in function")
+    results = {}
+
+    for result in tqdm(iter_load_from_directory(directory, max_workers=max_workers, use_cache=use_cache),
+                       total=len(os.listdir(directory))):
+        if result.error is not None:
+            print(f"Error in Loading Document {result.file_path}: {result.error}")
+        results[result.file_path] = result
+        if on_file is not None:
+            on_file(result)
+
+    combined_data = ChunkStore.from_documents(
+        chunk for file_path in sorted(results) for chunk in results[file_path].chunks)
+    print("SIZE of Combined Data : ",len(combined_data))
+    return combined_data
+
+
+# Same tokenizer BM25Retriever uses by default, so scores stay comparable
+def bm25_preprocess(text):
+    return text.split()
+
+
+# Compact Okapi BM25 index (same scoring as rank_bm25.BM25Okapi).
+# Documents are tokenized once into integer token ids and stored as CSR postings
+# (term -> doc ids / term frequencies) next to precomputed IDF and doc-length
+# vectors, so a query only touches the postings of its own terms.
+class BM25Index:
+
+    def __init__(self, texts, k1=1.5, b=0.75, epsilon=0.25, preprocess_func=bm25_preprocess):
+        self.k1 = k1
+        self.b = b
+        self.preprocess_func = preprocess_func
+        self.vocab = {}
+
+        term_chunks, doc_chunks, tf_chunks, doc_len = [], [], [], []
+        for doc_id, text in enumerate(texts):
+            token_ids = np.fromiter(
+                (self.vocab.setdefault(token, len(self.vocab)) for token in preprocess_func(text)),
+                dtype=np.int32,
+            )
+            doc_len.append(len(token_ids))
+            terms, counts = np.unique(token_ids, return_counts=True)
+            term_chunks.append(terms.astype(np.int32))
+            doc_chunks.append(np.full(len(terms), doc_id, dtype=np.int32))
+            tf_chunks.append(counts.astype(np.float32))
+
+        self.corpus_size = len(doc_len)
+        vocab_size = len(self.vocab)
+        terms = np.concatenate(term_chunks) if term_chunks else np.empty(0, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        self.postings_doc = np.concatenate(doc_chunks)[order] if doc_chunks else np.empty(0, dtype=np.int32)
+        self.postings_tf = np.concatenate(tf_chunks)[order] if tf_chunks else np.empty(0, dtype=np.float32)
+
+        doc_freq = np.bincount(terms, minlength=vocab_size)
+        self.postings_ptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.postings_ptr[1:])
+
+        # ATIRE-style idf with a floor of epsilon * average idf for very common terms
+        idf = np.log(self.corpus_size - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        if vocab_size:
+            idf[idf < 0] = epsilon * idf.mean()
+        self.idf = idf.astype(np.float32)
+
+        self.doc_len = np.asarray(doc_len, dtype=np.float32)
+        avgdl = self.doc_len.mean() if self.corpus_size else 0.0
+        # Length normalisation term of the BM25 denominator, computed once per document
+        self.doc_norm = (k1 * (1 - b + b * self.doc_len / avgdl)) if avgdl else np.full(self.corpus_size, k1, dtype=np.float32)
+
+    def get_scores(self, query):
+        scores = np.zeros(self.corpus_size, dtype=np.float32)
+        for token in self.preprocess_func(query):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            start, end = self.postings_ptr[term], self.postings_ptr[term + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[term] * (tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+        return scores
+
+    def top_n(self, query, n=5):
+        scores = self.get_scores(query)
+        n = min(n, self.corpus_size)
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+
+# LangChain retriever over a prebuilt BM25Index, used in place of BM25Retriever.
+# Hits are looked up in a ChunkStore, so no per-chunk Document is kept alive.
+class CompactBM25Retriever(BaseRetriever):
+    index: Any
+    docs: Any
+    k: int = 5
+
+    @classmethod
+    def from_documents(cls, documents, **kwargs):
+        documents = ChunkStore.from_documents(documents)
+        index = BM25Index(documents.texts())
+        return cls(index=index, docs=documents, **kwargs)
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return [self.docs[i] for i in self.index.top_n(query, self.k)]
+
+
+CHATBOT_TEMPLATE = """
     <|system|>>
     You are a helpful Research Assistant with expertise in human rights and tech accountability.
     You are conducting a research on tech accountability of renowned publicity listed companies accross criterias.
@@ -150,19 +475,385 @@ def create_chatbot(documents,vectorstore,question_asked):
     </s>
     """
 
-    prompt = ChatPromptTemplate.from_template(template)
-    output_parser = StrOutputParser()
 
-    chain = (
-        {"context": ensemble_retriever, "query": RunnablePassthrough()}
-        | prompt
-        | llm
-        | output_parser
-    )
+METRICS_HISTORY = 1000
+
+# Retrieval post-processing (see Chatbot.build_context)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 = no limit
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.95"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA") or 0) or None  # e.g. 0.7 to enable MMR
+RRF_C = 60  # same constant EnsembleRetriever uses for reciprocal rank fusion
+MIN_TRUNCATED_TOKENS = 100
+
+
+@dataclass
+class AnswerMetrics:
+    question: str
+    streamed: bool
+    time_to_first_token: Optional[float] = None
+    total_latency: Optional[float] = None
+    chunks: int = 0
+    cache_hit: Optional[str] = None
+    context_chunks: int = 0
+    context_tokens: int = 0
+    context_tokens_saved: int = 0
+
+
+def format_context(documents):
+    blocks = []
+    for doc in documents:
+        source = doc.metadata.get("source", "unknown")
+        page = doc.metadata.get("page")
+        location = f"{source}, page {page + 1}" if isinstance(page, int) else source
+        blocks.append(f"[Source: {location}]\n{doc.page_content}")
+    return "\n\n".join(blocks)
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Greedy near-duplicate filter: keep a row unless its cosine similarity to an
+# already kept row reaches threshold. rows must be L2-normalized.
+def dedupe_rows(rows, threshold):
+    if not len(rows):
+        return []
+    similarity = rows @ rows.T
+    kept = []
+    for i in range(len(rows)):
+        if not kept or similarity[i, kept].max() < threshold:
+            kept.append(i)
+    return kept
+
+
+# Maximal marginal relevance order over L2-normalized rows
+def mmr_order(query, rows, lambda_mult):
+    relevance = rows @ query
+    similarity = rows @ rows.T
+    selected, remaining = [], list(range(len(rows)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+# Retrieval + LLM chain for one corpus. Build it once after create_embeddings
+# and keep it in session state; every question then reuses the same BM25 index,
+# prompt and chain.
+#
+# Each question retrieves the top-k vector and top-k BM25 hits, fuses them with
+# weighted reciprocal rank fusion (as EnsembleRetriever did), drops near-duplicate
+# chunks by cosine similarity of their stored embeddings, optionally reorders them
+# with MMR, and trims the result to a token budget before it goes into the prompt.
+# Vector hits come from vector_index (see vector_index.py) when one is given,
+# otherwise from a query to the Chroma collection.
+class Chatbot:
+
+    def __init__(self, documents, vectorstore, chat_model=None, k=5, answer_cache=None,
+                 token_budget=CONTEXT_TOKEN_BUDGET, dedup_similarity=DEDUP_SIMILARITY, mmr_lambda=MMR_LAMBDA,
+                 vector_index=None):
+        documents = ChunkStore.from_documents(documents)
+        self.documents = documents
+        self.vectorstore = vectorstore
+        self.vector_index = vector_index
+        self.answer_cache = answer_cache
+        self.k = k
+        self.token_budget = token_budget
+        self.dedup_similarity = dedup_similarity
+        self.mmr_lambda = mmr_lambda
+        chat_model = chat_model or get_llm()
+        # Cached answers are only valid for the same corpus, model, prompt and retrieval settings
+        # (an approximate index may retrieve differently from Chroma)
+        index_settings = () if vector_index is None else \
+            (vector_index.key, getattr(vector_index, "ef_search", None))
+        self.fingerprint = corpus_fingerprint(
+            documents, getattr(chat_model, "model_name", type(chat_model).__name__),
+            CHATBOT_TEMPLATE, chunk_key(), k, token_budget, dedup_similarity, mmr_lambda, *index_settings)
+
+        self.keyword_retriever = CompactBM25Retriever.from_documents(documents, k=k)
+        self._ordinals = None  # per-file chunk numbers for _chunk_id, built on first use
+
+        prompt = ChatPromptTemplate.from_template(CHATBOT_TEMPLATE)
+        output_parser = StrOutputParser()
+
+        self.chain = prompt | chat_model | output_parser
+
+        # Latency of the most recent questions, newest last
+        self.metrics = deque(maxlen=METRICS_HISTORY)
+
+    # Lazily computed (and then reused) question embedding, shared by vector
+    # retrieval and semantic answer-cache lookups; question_vector, when given,
+    # is an embedding of the question computed elsewhere (e.g. once for many corpora)
+    def _query_vector(self, question_asked, question_vector=None):
+        vector = [] if question_vector is None else [question_vector]
+
+        def compute():
+            if not vector:
+                vector.append(self.vectorstore.embeddings.embed_query(str(question_asked)))
+            return vector[0]
+        return compute
+
+    # Candidates for a question: (document, stored embedding or None) in fused rank order
+    def vector_hits(self, query_vector):
+        if self.vector_index is not None:
+            ids, _ = self.vector_index.search(np.asarray(query_vector(), dtype=np.float32), self.k)
+            return list(zip((self.documents[int(i)] for i in ids), self.vector_index.vectors(ids)))
+        hits = self.vectorstore._collection.query(
+            query_embeddings=[list(map(float, query_vector()))], n_results=self.k,
+            include=["documents", "metadatas", "embeddings"])
+        return [(Document(page_content=text, metadata=metadata or {}), np.asarray(vector, dtype=np.float32))
+                for text, metadata, vector in zip(hits["documents"][0], hits["metadatas"][0], hits["embeddings"][0])]
+
+    # Chroma id (sha:n, see upsert_chunks) of the chunk at position i in self.documents
+    def _chunk_id(self, i):
+        if self._ordinals is None:
+            seen, ordinals = {}, np.empty(len(self.documents), dtype=np.int32)
+            for j, sha in enumerate(self.documents.column("content_hash")):
+                ordinals[j] = seen.get(sha, 0)
+                seen[sha] = ordinals[j] + 1
+            self._ordinals = ordinals
+        return f"{self.documents.metadata(i).get('content_hash')}:{self._ordinals[i]}"
+
+    # Embeddings stored at ingestion for the chunks at positions in self.documents
+    # (None where a chunk has none): from the vector index, or by chunk id from
+    # the Chroma collection. Never calls the embeddings API.
+    def stored_vectors(self, positions):
+        if not positions:
+            return []
+        if self.vector_index is not None:
+            return list(self.vector_index.vectors(positions))
+        ids = [self._chunk_id(i) for i in positions]
+        stored = self.vectorstore._collection.get(ids=ids, include=["embeddings"])
+        found = dict(zip(stored["ids"], stored["embeddings"]))
+        return [None if found.get(doc_id) is None else np.asarray(found[doc_id], dtype=np.float32) for doc_id in ids]
+
+    # Fused candidates, (document, stored embedding or None), plus the positions
+    # in self.documents of the keyword hits by chunk text
+    def retrieve(self, question_asked, query_vector):
+        vector_hits = self.vector_hits(query_vector)
+        keyword_positions = self.keyword_retriever.index.top_n(str(question_asked), self.k)
+        keyword_hits = [(self.documents[int(i)], None) for i in keyword_positions]
+
+        scores, candidates = {}, {}
+        for hit_list, weight in ((vector_hits, 0.5), (keyword_hits, 0.5)):
+            for rank, (doc, vector) in enumerate(hit_list, start=1):
+                key = doc.page_content
+                scores[key] = scores.get(key, 0.0) + weight / (rank + RRF_C)
+                if key not in candidates or candidates[key][1] is None:
+                    candidates[key] = (doc, vector)
+        positions = {doc.page_content: int(i) for (doc, _), i in zip(keyword_hits, keyword_positions)}
+        return [candidates[key] for key in sorted(scores, key=scores.get, reverse=True)], positions
+
+    # Prompt context for a question plus its size statistics
+    def build_context(self, question_asked, query_vector):
+        candidates, positions = self.retrieve(question_asked, query_vector)
+        documents = [doc for doc, _ in candidates]
+        # What the unprocessed ensemble put in the prompt; chunk sizes come from their metadata
+        baseline_tokens = sum(chunk_tokens(doc) for doc in documents)
+
+        if candidates and (self.dedup_similarity or self.mmr_lambda):
+            # BM25-only hits get the vectors stored for them at ingestion
+            missing = [i for i, (_, vector) in enumerate(candidates) if vector is None]
+            vectors = [vector for _, vector in candidates]
+            for i, vector in zip(missing, self.stored_vectors([positions[documents[i].page_content] for i in missing])):
+                vectors[i] = vector
+            # Chunks without a stored vector (a collection written under other ids)
+            # are not re-ranked and follow the others in fused order
+            ranked = [i for i, vector in enumerate(vectors) if vector is not None]
+            unranked = [i for i, vector in enumerate(vectors) if vector is None]
+            order = list(range(len(ranked)))
+            if ranked:
+                rows = _unit_rows(np.vstack([vectors[i] for i in ranked]))
+                if self.dedup_similarity:
+                    order = dedupe_rows(rows, self.dedup_similarity)
+                if self.mmr_lambda:
+                    query = np.asarray(query_vector(), dtype=np.float32)
+                    query = query / (np.linalg.norm(query) or 1.0)
+                    order = [order[i] for i in mmr_order(query, rows[order], self.mmr_lambda)]
+            documents = [documents[ranked[i]] for i in order] + [documents[i] for i in unranked]
+
+        selected, used = [], 0
+        for doc in documents:
+            header_tokens = count_tokens(format_context([Document(page_content="", metadata=doc.metadata)])) + 2
+            tokens = chunk_tokens(doc) + header_tokens
+            if self.token_budget and used + tokens > self.token_budget:
+                remaining = self.token_budget - used
+                if remaining >= MIN_TRUNCATED_TOKENS:
+                    text = truncate_to_tokens(doc.page_content, remaining - header_tokens)
+                    selected.append(Document(page_content=text, metadata={**doc.metadata, "tokens": count_tokens(text)}))
+                    used += selected[-1].metadata["tokens"] + header_tokens
+                break
+            selected.append(doc)
+            used += tokens
+
+        context = format_context(selected)
+        context_tokens = used  # headers and chunks counted above, without tokenizing the context again
+        return context, {"context_chunks": len(selected), "context_tokens": context_tokens,
+                         "context_tokens_saved": max(0, baseline_tokens - context_tokens)}
+
+    def _record_context(self, metrics, stats):
+        metrics.context_chunks = stats["context_chunks"]
+        metrics.context_tokens = stats["context_tokens"]
+        metrics.context_tokens_saved = stats["context_tokens_saved"]
+        instrumentation.add("retrieve.context_tokens", stats["context_tokens"])
+        instrumentation.add("retrieve.context_tokens_saved", stats["context_tokens_saved"])
+
+    # Token counts are estimates from the local tokenizer, not the provider's usage report
+    def _record_llm(self, context, question_asked, answer, seconds=None, **attributes):
+        prompt_tokens = count_tokens(context) + count_tokens(str(question_asked))
+        completion_tokens = count_tokens(answer)
+        instrumentation.add("llm.calls")
+        instrumentation.add("llm.prompt_tokens", prompt_tokens)
+        instrumentation.add("llm.completion_tokens", completion_tokens)
+        attributes.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if seconds is not None:
+            instrumentation.record_span("llm", seconds, **attributes)
+        return attributes
+
+    def _retrieve(self, question_asked, query_vector, metrics):
+        with instrumentation.span("retrieve") as span:
+            context, stats = self.build_context(question_asked, query_vector)
+            if span is not None:
+                span.attributes.update(stats)
+        self._record_context(metrics, stats)
+        return context
+
+    def ask(self, question_asked, question_vector=None):
+        metrics = AnswerMetrics(question=str(question_asked), streamed=False)
+        start = time.perf_counter()
+        try:
+            query_vector = self._query_vector(question_asked, question_vector)
+            if self.answer_cache is not None:
+                answer, metrics.cache_hit = self.answer_cache.get(self.fingerprint, question_asked, query_vector)
+                if answer is not None:
+                    instrumentation.add("answer_cache.hits")
+                    return answer
+
+            context = self._retrieve(question_asked, query_vector, metrics)
+            with instrumentation.span("llm") as span:
+                answer = self.chain.invoke({"context": context, "query": question_asked})
+                attributes = self._record_llm(context, question_asked, answer)
+                if span is not None:
+                    span.attributes.update(attributes)
+            if self.answer_cache is not None:
+                self.answer_cache.put(self.fingerprint, question_asked, answer, query_vector)
+            return answer
+        finally:
+            metrics.total_latency = time.perf_counter() - start
+            self.metrics.append(metrics)
+
+    # Generator over the answer text as the LLM produces it
+    def stream(self, question_asked):
+        metrics = AnswerMetrics(question=str(question_asked), streamed=True)
+        start = time.perf_counter()
+        try:
+            query_vector = self._query_vector(question_asked)
+            if self.answer_cache is not None:
+                answer, metrics.cache_hit = self.answer_cache.get(self.fingerprint, question_asked, query_vector)
+                if answer is not None:
+                    instrumentation.add("answer_cache.hits")
+                    metrics.time_to_first_token = time.perf_counter() - start
+                    metrics.chunks = 1
+                    yield answer
+                    return
+
+            context = self._retrieve(question_asked, query_vector, metrics)
+            pieces = []
+            # Timed by hand: a span's context would have to stay open across yields
+            llm_start = time.perf_counter()
+            for chunk in self.chain.stream({"context": context, "query": question_asked}):
+                if metrics.time_to_first_token is None:
+                    metrics.time_to_first_token = time.perf_counter() - start
+                metrics.chunks += 1
+                pieces.append(chunk)
+                yield chunk
+            self._record_llm(context, question_asked, "".join(pieces), time.perf_counter() - llm_start,
+                             streamed=True, first_token_s=round(metrics.time_to_first_token or 0.0, 4))
+            if self.answer_cache is not None:
+                self.answer_cache.put(self.fingerprint, question_asked, "".join(pieces), query_vector)
+        finally:
+            metrics.total_latency = time.perf_counter() - start
+            self.metrics.append(metrics)
+
+
+# index_path: directory to keep the corpus' vector index in (see vector_index.index_for);
+# if the index cannot be built from the collection, retrieval falls back to Chroma
+def build_chatbot(documents, vectorstore, chat_model=None, use_cache=True, index_path=None):
+    import vector_index
+
+    documents = ChunkStore.from_documents(documents)
+    index = None
+    try:
+        index = vector_index.index_for(documents, vectorstore, path=index_path)
+    except Exception as e:
+        print(f"Vector index unavailable, querying Chroma instead: {e}")
+    return Chatbot(documents, vectorstore, chat_model=chat_model,
+                   answer_cache=get_answer_cache() if use_cache else None, vector_index=index)
+
+
+def create_chatbot(documents,vectorstore,question_asked, chatbot=None):
+    # Reuse a prebuilt chatbot when one is passed in, otherwise build a throwaway one
+    if chatbot is None:
+        chatbot = build_chatbot(documents, vectorstore)
+
+    return chatbot.ask(question_asked)
+
 
-    result = chain.invoke(question_asked)
+# Streaming counterpart of create_chatbot: yields the answer piece by piece
+def stream_chatbot(documents, vectorstore, question_asked, chatbot=None):
+    if chatbot is None:
+        chatbot = build_chatbot(documents, vectorstore)
 
-    return result
+    yield from chatbot.stream(question_asked)
+
+
+# Upper bound on LLM round-trips in flight for batch (Excel) questions
+QA_CONCURRENCY = int(os.getenv("QA_CONCURRENCY", "8"))
+
+
+@dataclass
+class BatchAnswer:
+    index: int
+    question: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+
+
+# Answer a list of questions with up to max_concurrency chain calls in flight.
+# Results come back in input order; a failing question records its error instead
+# of aborting the batch. on_progress(done, total, batch_answer) is called from the
+# calling thread as each answer completes, so it is safe to update Streamlit widgets.
+def answer_questions(chatbot, questions, max_concurrency=None, on_progress=None):
+    questions = list(questions)
+    results = [BatchAnswer(index=i, question=q) for i, q in enumerate(questions)]
+    if not questions:
+        return results
+
+    max_workers = max(1, min(max_concurrency or QA_CONCURRENCY, len(questions)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(instrumentation.wrap(chatbot.ask), q): i for i, q in enumerate(questions)}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = results[futures[future]]
+                try:
+                    result.answer = future.result()
+                except Exception as e:
+                    result.error = str(e)
+                if on_progress is not None:
+                    on_progress(done, len(questions), result)
+        except BaseException:
+            # on_progress raised (e.g. the job was cancelled): questions not started yet are dropped
+            for future in futures:
+                future.cancel()
+            raise
+
+    return results
 
 
 
@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+import instrumentation
+
+# In-process vector index for the chatbot's semantic retrieval, in place of a
+# Chroma query per question. Chroma stays the store of record (ingestion upserts
+# there); an index is built from the collection's vectors once per corpus, saved
+# next to the corpus' ChunkStore and reopened (memory-mapped) from there.
+#
+#   chroma  no in-process index, query the Chroma collection (the default)
+#   exact   NumPy brute force over all vectors, exact top-k
+#   hnsw    HNSW graph (hnswlib, which chromadb already ships), approximate;
+#           HNSW_M and HNSW_EF_CONSTRUCTION set graph size and build effort,
+#           HNSW_EF_SEARCH trades recall for query latency
+#   auto    exact up to VECTOR_INDEX_EXACT_MAX chunks, hnsw above
+#
+# The exact backend can store its vectors as float32, float16 (half the memory,
+# but NumPy widens float16 slowly, so scoring is several times slower) or int8
+# (a quarter, one scale per row, close to float32 speed). HNSW keeps float32
+# vectors inside the graph, so VECTOR_INDEX_DTYPE only applies to exact. Vectors are L2-normalized
+# and ranked by cosine similarity, which is also Chroma's order for the
+# (normalized) OpenAI embeddings. `python -m benchmarks.bench_vector_index`
+# reports recall@k and latency of each setting against exact float32.
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "chroma")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+VECTOR_INDEX_EXACT_MAX = int(os.getenv("VECTOR_INDEX_EXACT_MAX", "20000"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+BACKENDS = ("chroma", "exact", "hnsw", "auto")
+DTYPES = ("float32", "float16", "int8")
+SCORE_BLOCK_ROWS = 2048  # rows scored per step; the float32 copy of a quantized block stays in cache
+COLLECTION_BATCH_SIZE = 4000
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+# Rows of unit vectors stored as float32, float16 or int8 (symmetric, one
+# float32 scale per row); scored block by block so only SCORE_BLOCK_ROWS rows
+# are ever widened to float32 at once
+class VectorStorage:
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+
+    @classmethod
+    def from_vectors(cls, vectors, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype {dtype!r}, expected one of {', '.join(DTYPES)}")
+        vectors = _unit(vectors)
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            data = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return cls(data, scales.astype(np.float32))
+        return cls(vectors.astype(dtype))
+
+    @property
+    def dtype(self):
+        return self.data.dtype.name
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, indices):
+        rows = np.asarray(self.data[indices], dtype=np.float32)
+        if self.scales is not None:
+            rows *= self.scales[indices, None]
+        return rows
+
+    def scores(self, query):
+        scores = np.empty(len(self.data), dtype=np.float32)
+        for start in range(0, len(self.data), SCORE_BLOCK_ROWS):
+            block = slice(start, start + SCORE_BLOCK_ROWS)
+            scores[block] = np.asarray(self.data[block], dtype=np.float32) @ query
+            if self.scales is not None:
+                scores[block] *= self.scales[block]
+        return scores
+
+    def save(self, path):
+        np.save(os.path.join(path, "vectors.npy"), self.data)
+        if self.scales is not None:
+            np.save(os.path.join(path, "scales.npy"), self.scales)
+
+    @classmethod
+    def open(cls, path):
+        scales_path = os.path.join(path, "scales.npy")
+        return cls(np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+                   np.load(scales_path) if os.path.exists(scales_path) else None)
+
+
+class ExactIndex:
+    backend = "exact"
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    @classmethod
+    def build(cls, vectors, dtype="float32"):
+        return cls(VectorStorage.from_vectors(vectors, dtype))
+
+    @property
+    def key(self):
+        return f"exact-{self.storage.dtype}"
+
+    @property
+    def nbytes(self):
+        return self.storage.nbytes
+
+    def __len__(self):
+        return len(self.storage)
+
+    # (row ids, cosine similarities) of the k nearest rows, best first
+    def search(self, query, k):
+        scores = self.storage.scores(_unit(query))
+        top = _top_k(scores, k)
+        return top, scores[top]
+
+    def vectors(self, ids):
+        return self.storage.rows(np.asarray(ids, dtype=np.int64))
+
+    def save(self, path):
+        self.storage.save(path)
+        return {"dtype": self.storage.dtype}
+
+    @classmethod
+    def open(cls, path, meta):
+        return cls(VectorStorage.open(path))
+
+
+class HNSWIndex:
+    backend = "hnsw"
+
+    def __init__(self, index, count, m, ef_construction, ef_search):
+        self.index = index
+        self.count = count
+        self.m = m
+        self.ef_construction = ef_construction
+        self.set_ef_search(ef_search)
+
+    @classmethod
+    def build(cls, vectors, m=None, ef_construction=None, ef_search=None, threads=-1):
+        import hnswlib
+
+        vectors = _unit(vectors)
+        m, ef_construction = m or HNSW_M, ef_construction or HNSW_EF_CONSTRUCTION
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=max(1, len(vectors)), ef_construction=ef_construction, M=m)
+        if len(vectors):
+            index.add_items(vectors, np.arange(len(vectors)), num_threads=threads)
+        return cls(index, len(vectors), m, ef_construction, ef_search or HNSW_EF_SEARCH)
+
+    @property
+    def key(self):
+        return f"hnsw-M{self.m}-efc{self.ef_construction}"
+
+    @property
+    def nbytes(self):
+        # hnswlib's own layout: per element the vector, its level-0 links and a label
+        return self.count * (self.index.dim * 4 + self.m * 2 * 4 + 4 + 8)
+
+    def __len__(self):
+        return self.count
+
+    # ef is a setting of the whole hnswlib index, shared by every thread that
+    # searches it, so it is only set here (at build/open time, or by a
+    # benchmark before it queries) and never per search. hnswlib searches with
+    # max(ef, k), so a k above ef_search still returns k results.
+    def set_ef_search(self, ef_search):
+        self.ef_search = ef_search
+        self.index.set_ef(ef_search)
+
+    def search(self, query, k):
+        k = min(k, self.count)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        labels, distances = self.index.knn_query(_unit(query)[None, :], k=k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]  # ip distance is 1 - similarity
+
+    def vectors(self, ids):
+        return np.asarray(self.index.get_items(list(map(int, ids))), dtype=np.float32)
+
+    def save(self, path):
+        self.index.save_index(os.path.join(path, "hnsw.bin"))
+        return {"m": self.m, "ef_construction": self.ef_construction, "dim": self.index.dim}
+
+    @classmethod
+    def open(cls, path, meta, ef_search=None):
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=meta["dim"])
+        index.load_index(os.path.join(path, "hnsw.bin"), max_elements=max(1, meta["count"]))
+        return cls(index, meta["count"], meta["m"], meta["ef_construction"], ef_search or HNSW_EF_SEARCH)
+
+
+INDEX_CLASSES = {"exact": ExactIndex, "hnsw": HNSWIndex}
+
+
+def resolve_backend(count, backend=None):
+    backend = backend or VECTOR_INDEX
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector index {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == "auto":
+        return "exact" if count <= VECTOR_INDEX_EXACT_MAX else "hnsw"
+    return backend
+
+
+def build_index(vectors, backend="exact", dtype=None, **params):
+    if backend == "hnsw":
+        return HNSWIndex.build(vectors, **params)
+    return ExactIndex.build(vectors, dtype or VECTOR_INDEX_DTYPE)
+
+
+def save_index(index, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    meta = {"backend": index.backend, "key": index.key, "count": len(index), **index.save(tmp_path)}
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def open_index(path):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        meta = json.load(file)
+    return INDEX_CLASSES[meta["backend"]].open(path, meta)
+
+
+# Ids the chunks of documents were upserted under: "<content_hash>:<n>" for the
+# n-th chunk of a file (see upsert_chunks); a ChunkStore keeps each file's
+# chunks in that order
+def chunk_ids(documents):
+    seen = {}
+    ids = []
+    for sha in documents.column("content_hash"):
+        n = seen.get(sha, 0)
+        seen[sha] = n + 1
+        ids.append(f"{sha}:{n}")
+    return ids
+
+
+# Vectors of every chunk of documents from the Chroma collection, row i for chunk i.
+# Collections written under other ids (e.g. by Chroma.from_documents) are
+# matched on chunk text instead.
+def collection_vectors(collection, documents):
+    ids = chunk_ids(documents)
+    rows = {}
+    for i in range(0, len(ids), COLLECTION_BATCH_SIZE):
+        stored = collection.get(ids=ids[i:i + COLLECTION_BATCH_SIZE], include=["embeddings"])
+        rows.update(zip(stored["ids"], stored["embeddings"]))
+    if all(doc_id in rows for doc_id in ids):
+        return np.asarray([rows[doc_id] for doc_id in ids], dtype=np.float32)
+
+    stored = collection.get(include=["documents", "embeddings"])
+    by_text = dict(zip(stored["documents"], stored["embeddings"]))
+    vectors = []
+    for i, doc_id in enumerate(ids):
+        vector = rows.get(doc_id)
+        if vector is None:
+            vector = by_text.get(documents.text(i))
+        if vector is None:
+            raise KeyError(f"Chunk {doc_id} has no vector in the collection")
+        vectors.append(vector)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+# Index over the chunks of documents for the configured backend, or None for
+# "chroma". With path, an index saved there with the same settings is reopened
+# instead of rebuilt, and a new one is saved there.
+def index_for(documents, vectorstore, path=None, backend=None, dtype=None):
+    backend = resolve_backend(len(documents), backend)
+    if backend == "chroma":
+        return None
+    name = f"{backend}-{dtype or VECTOR_INDEX_DTYPE}" if backend == "exact" else \
+        f"{backend}-M{HNSW_M}-efc{HNSW_EF_CONSTRUCTION}"
+    index_path = os.path.join(path, name) if path else None
+    if index_path and os.path.exists(os.path.join(index_path, "meta.json")):
+        try:
+            index = open_index(index_path)
+            if len(index) == len(documents):
+                return index
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"Rebuilding vector index {index_path}: {e}")
+
+    start = time.perf_counter()
+    with instrumentation.span("vector_index", backend=backend, chunks=len(documents)):
+        vectors = collection_vectors(vectorstore._collection, documents)
+        index = build_index(vectors, backend, dtype)
+    print(f"Built {index.key} vector index over {len(index)} chunks in {time.perf_counter() - start:.2f}s "
+          f"({index.nbytes / 1e6:.1f} MB)")
+    if index_path:
+        save_index(index, index_path)
+    return index